@@ -0,0 +1,68 @@
+"""
+增量刷新与全量重算的耗时对比
+
+用法: python -m benchmarks.incremental_refresh [行数] [每次变化行数]
+"""
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_synthetic_universe
+from modules.analyzer import analyze_etf_data
+from modules.incremental import IncrementalAnalyzer
+
+
+def _perturb(df, n_changed, rng):
+    """随机修改n_changed行的行情字段，模拟一次日内刷新"""
+    df = df.copy()
+    rows = rng.choice(len(df), size=n_changed, replace=False)
+    for col in ['涨跌幅', '成交额', '换手率', '溢折率', '规模变化']:
+        position = df.columns.get_loc(col)
+        df.iloc[rows, position] = df.iloc[rows, position].to_numpy() * rng.uniform(0.8, 1.2, n_changed)
+    return df, rows
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_changed = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rng = np.random.default_rng(1)
+    df = make_synthetic_universe(n_rows)
+
+    engine = IncrementalAnalyzer(df)
+    # 预热代码索引的哈希表（只在首次查找时构建）
+    engine.update(df.iloc[:1], partial=True)
+    snapshot, _ = _perturb(df, n_changed, rng)
+
+    start = time.perf_counter()
+    full = analyze_etf_data(snapshot)
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine.update(snapshot)
+    incremental = engine.results()
+    incremental_time = time.perf_counter() - start
+
+    partial_times = []
+    for _ in range(5):
+        snapshot, rows = _perturb(snapshot, n_changed, rng)
+        start = time.perf_counter()
+        engine.update(snapshot.iloc[rows], partial=True)
+        engine.results()
+        partial_times.append(time.perf_counter() - start)
+    partial_time = np.median(partial_times)
+
+    # 并列值的先后顺序可能不同，按排序列的取值比较
+    for name, column in [('top_gainers', '涨跌幅'), ('top_volume', '成交额'), ('top_inflow', '规模变化'),
+                         ('discount_etfs', '溢折率'), ('reversal_etfs', '5日涨跌幅'), ('top_score', '综合得分')]:
+        same = np.allclose(full[name][column].to_numpy(), incremental[name][column].to_numpy())
+        print(f"{name}: {'一致' if same else '不一致'}")
+    same = full['market_overview']['上涨'] == incremental['market_overview']['上涨']
+    print(f"market_overview: {'一致' if same else '不一致'}")
+    print(f"全量重算: {full_time * 1000:.1f} ms")
+    print(f"增量刷新(完整快照比较, {n_changed} 行变化): {incremental_time * 1000:.1f} ms")
+    print(f"增量刷新(仅变化行, 5次中位数): {partial_time * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
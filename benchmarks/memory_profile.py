@@ -0,0 +1,58 @@
+"""
+数据流水线峰值内存(RSS)测量
+
+用法: python -m benchmarks.memory_profile [行数]
+每个阶段在独立子进程中运行，分别报告加载、分析、组合构建后的峰值RSS。
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import write_synthetic_csv
+
+
+def _peak_rss_mb():
+    """当前进程峰值RSS（MB）"""
+    # Linux上ru_maxrss会跨exec继承父进程的峰值，优先读取VmHWM
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS返回字节，Linux返回KB
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_pipeline(csv_path):
+    """运行加载→分析→组合构建，打印各阶段结束时的峰值RSS"""
+    from modules.data_loader import load_etf_data
+    from modules.analyzer import analyze_etf_data, add_derived_columns
+    from modules.portfolio_builder import generate_portfolio_advice
+
+    baseline = _peak_rss_mb()
+    df = load_etf_data(csv_path)
+    print(f"加载完成: 峰值RSS {_peak_rss_mb():.0f} MB")
+    df = add_derived_columns(df)
+    analyze_etf_data(df)
+    print(f"分析完成: 峰值RSS {_peak_rss_mb():.0f} MB")
+    generate_portfolio_advice(df)
+    print(f"组合构建完成: 峰值RSS {_peak_rss_mb():.0f} MB (导入后基线 {baseline:.0f} MB)")
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    if len(sys.argv) > 2:
+        run_pipeline(sys.argv[2])
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'synthetic.csv')
+        write_synthetic_csv(csv_path, n_rows)
+        print(f"合成数据: {n_rows} 行, {os.path.getsize(csv_path) / 1e6:.0f} MB")
+        subprocess.run([sys.executable, '-m', 'benchmarks.memory_profile', str(n_rows), csv_path], check=True)
+
+
+if __name__ == '__main__':
+    main()
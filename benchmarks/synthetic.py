@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+# 与 data/ETF行情数据.csv 相同的列布局
+ETF_TYPES = ['股票', '债', '商品', '货币', '跨境']
+EXCHANGES = ['上海证券交易所', '深圳证券交易所']
+COMPANIES = ['华夏基金', '易方达基金', '南方基金', '广发基金', '嘉实基金', '博时基金', '国泰基金', '海富通基金']
+NAME_WORDS = ['科技', '芯片', '银行', '证券', '消费', '白酒', '医药', '医疗', '黄金', '有色', '红利', '沪深300', '中证500', '纳指']
+
+
+def make_synthetic_universe(n_rows, seed=0):
+    """生成n_rows只ETF的合成行情数据"""
+    rng = np.random.default_rng(seed)
+    codes = np.char.add(np.arange(100000, 100000 + n_rows).astype(str), '.SH')
+    words = rng.choice(NAME_WORDS, size=n_rows)
+    price = np.round(rng.lognormal(0.5, 0.6, n_rows), 3)
+    change = np.round(rng.normal(0.002, 0.015, n_rows), 4)
+    iopv = np.round(price * (1 - rng.normal(0, 0.003, n_rows)), 4)
+    shares = rng.integers(10 ** 6, 10 ** 10, n_rows)
+    index_ids = rng.integers(0, max(1, n_rows // 20), n_rows)
+    return pd.DataFrame({
+        '代码': codes,
+        '类型': rng.choice(ETF_TYPES, size=n_rows),
+        '名称': np.char.add(words.astype(str), 'ETF'),
+        '现价': price,
+        '涨跌': np.round(price * change, 3),
+        '涨跌幅': change,
+        '溢折率': np.round(rng.normal(0, 0.004, n_rows), 4),
+        '成交额': np.round(rng.lognormal(16, 2, n_rows)),
+        '换手率': np.round(rng.lognormal(-1.5, 1, n_rows), 4),
+        '5日涨跌幅': np.round(rng.normal(0.005, 0.03, n_rows), 4),
+        '年初至今': np.round(rng.normal(0.03, 0.1, n_rows), 4),
+        '基金份额': shares,
+        '估算规模': np.round(shares * price),
+        '规模变化': np.round(rng.normal(0, 5e7, n_rows), 2),
+        '管理公司': rng.choice(COMPANIES, size=n_rows),
+        'IOPV': iopv,
+        '跟踪指数代码': np.char.add(index_ids.astype(str), '.CSI'),
+        '跟踪指数名称': np.char.add('指数', index_ids.astype(str)),
+        '市盈率': np.round(rng.uniform(0, 40, n_rows), 2),
+        '市净率': np.round(rng.uniform(0, 5, n_rows), 2),
+        '上市地': rng.choice(EXCHANGES, size=n_rows),
+    })
+
+
+def write_synthetic_csv(path, n_rows, seed=0):
+    """将合成数据写入CSV文件"""
+    make_synthetic_universe(n_rows, seed).to_csv(path, index=False, encoding='utf-8')
+    return path
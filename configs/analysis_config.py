@@ -16,3 +16,84 @@ REVERSAL_THRESHOLD = {
 
 # 折价阈值
 DISCOUNT_THRESHOLD = -0.005  # 折价超过0.5%
+
+# 历史因子配置（因子定义见modules/factors.py，按名称加入ANALYSIS_WEIGHTS即可参与综合得分）
+# 例如: ANALYSIS_WEIGHTS['资金流持续性'] = 0.10；波动率类因子通常使用负权重
+FACTOR_CONFIG = {
+    'window': 20,  # 滚动窗口（交易日数，含当日）
+    'min_periods': 5  # 有效样本少于该数量时因子记为缺失（标准化后为0）
+}
+
+# 日内溢折率监控配置
+PREMIUM_MONITOR_CONFIG = {
+    'window': 30,  # 每只ETF环形缓冲区保留的快照数
+    'min_deviation': 0.005,  # 价格相对IOPV的偏离至少达到0.5%才可能触发
+    'sigma': 2.0,  # 偏离超过自身滚动标准差的倍数才视为异常
+    'min_samples': 5,  # 滚动标准差所需的最少历史样本，不足时只用min_deviation
+    'persistence': 3,  # 连续多少次同向异常后发出信号
+    'poll_interval': 2  # 监视目录时的轮询间隔（秒）
+}
+
+# 多周期动量/反转扫描配置（基于保存的历史快照）
+SCANNER_CONFIG = {
+    'horizons': [3, 5, 10, 20, 60],  # 扫描的周期（交易日）
+    'momentum_weights': [0.10, 0.20, 0.20, 0.30, 0.20],  # 各周期收益标准化后合成多周期动量的权重
+    'min_coverage': 0.8  # 周期内有效收益天数占比低于该值时该周期记为缺失
+}
+
+# 自定义筛选配置（表达式语法见modules/screener.py）
+SCREEN_CONFIG = {
+    'top_n': 10,  # 每个筛选报告的ETF数量
+    'report_sections': 20,  # 报告中最多展开的筛选数（其余只在汇总表中列出命中数）
+    'screens_file': 'configs/screens.json',  # 额外的筛选定义文件（JSON数组），不存在时忽略
+    'screens': [
+        {'name': '折价且交投活跃', 'expr': "溢折率 < -0.0005 and 换手率 > 0.05", 'sort': '溢折率', 'ascending': True},
+        {'name': '超跌后放量上涨', 'expr': "`5日涨跌幅` < -0.005 and 涨跌幅 > 0 and rank(成交额) > 0.7", 'sort': '涨跌幅'},
+        {'name': '主题类资金流入', 'expr': "类型 == '主' and 规模变化 > 0 and 涨跌幅 > 0", 'sort': '规模变化'}
+    ]
+}
+
+# 多维汇总配置（按类型、管理公司、跟踪指数及其组合汇总）
+ROLLUP_CONFIG = {
+    'dimensions': ['类型', '管理公司', '跟踪指数名称'],  # 汇总维度，自动生成所有组合
+    'missing_label': '未知',  # 维度缺失值的标签
+    # 指标列 -> 汇总方式：sum为合计，mean为均值（缺失值不计入）
+    'metrics': {
+        '规模变化': 'sum',
+        '成交额': 'sum',
+        '估算规模': 'sum',
+        '换手率': 'mean',
+        '溢折率': 'mean',
+        '涨跌幅': 'mean',
+        '5日涨跌幅': 'mean'
+    },
+    'weight': '估算规模',  # 收益类指标另算按该列加权的均值
+    'weighted_metrics': ['涨跌幅', '5日涨跌幅'],
+    'cache_dir': 'rollup',  # 汇总缓存目录（位于history_dir下）
+    'top_n': 10,  # 报告中每个维度展示的数量
+    'report_dimensions': ['管理公司', '跟踪指数名称'],  # 报告中展开的维度
+    'heatmap': ('管理公司', '类型'),  # 热力图的行、列维度
+    'heatmap_rows': 15  # 热力图保留资金流绝对值最大的行数
+}
+
+# 综合得分排名稳定性配置：在ANALYSIS_WEIGHTS附近按Dirichlet分布抽样扰动权重，统计各ETF排名的分布
+STABILITY_CONFIG = {
+    'draws': 2000,  # 抽样的权重组数
+    'concentration': 50,  # Dirichlet集中度，越大扰动越小（权重0.15时相对标准差约33%）
+    'top_n': 10,  # 统计进入前N名的概率（与综合评分榜单一致）
+    'interval': (0.05, 0.95),  # 排名区间的分位数
+    'seed': 0,  # 随机种子，固定后同一数据每次结果一致
+    'report_rows': 15,  # 报告中列出的ETF数（按入选概率）
+    'chunk_cells': 4_000_000,  # 分块计算时每块得分矩阵的元素数上限（float64约32MB）
+    'max_rows': 50_000  # ETF数超过该值时跳过（写入日志），全市场规模下耗时约0.2秒，5万只约3秒
+}
+
+# 因子分位分析配置：按各因子把全市场等分成若干组，统计每组的收益
+QUANTILE_CONFIG = {
+    'buckets': 10,  # 分组数（10为十分位）
+    'target': '涨跌幅',  # 各组统计的收益列
+    # 默认使用数据加载时清洗过的全部数值列（df.attrs['numeric_cols']），去掉exclude中的列，再加上extra_factors
+    'exclude': ['现价', '涨跌', 'IOPV'],  # 价格水平和与目标重复的列
+    'extra_factors': ['综合得分', '多周期动量'],  # 派生列，存在时参与分组
+    'report_factors': ['换手率', '溢折率', '规模变化', '综合得分']  # 报告中展开分组明细和图表的因子
+}
@@ -0,0 +1,67 @@
+# 数据加载配置
+DATA_CONFIG = {
+    'excel_extensions': ['.xlsx', '.xls'],
+    'cache_dir': 'data/.cache',  # Excel一次性转换后的列式缓存目录
+    'default_sheet': 0,  # 默认读取第一个工作表
+    'max_load_workers': 4,  # 读取多个数据文件的线程数上限（重叠磁盘和缓存读取，解析仍受GIL限制）
+    'date_columns': ['日期', '交易日期', '交易日']  # 数据中记录交易日的列，有则优先于文件名和修改时间
+}
+
+# 数据源配置：按文件名匹配（fnmatch通配符，按顺序取第一个匹配项）
+# column_map: 供应商列名 -> 标准列名
+# defaults: 文件中缺少该列时填入的值
+# code_suffix: 代码不含交易所后缀时补齐的后缀（同时补足6位）
+DATA_SOURCES = [
+    {
+        'name': '上海证券交易所',
+        'pattern': '*上交所*',
+        'column_map': {'证券代码': '代码', '证券简称': '名称', '基金类型': '类型', '收盘价': '现价'},
+        'defaults': {'上市地': '上海证券交易所'},
+        'code_suffix': '.SH'
+    },
+    {
+        'name': '深圳证券交易所',
+        'pattern': '*深交所*',
+        'column_map': {'证券代码': '代码', '证券简称': '名称', '基金类型': '类型', '收盘价': '现价'},
+        'defaults': {'上市地': '深圳证券交易所'},
+        'code_suffix': '.SZ'
+    },
+    {
+        'name': '默认',
+        'pattern': '*',
+        'column_map': {},
+        'defaults': {},
+        'code_suffix': None
+    }
+]
+
+# 历史快照配置：每次运行把预处理后的当日快照按日期保存，供历史因子使用
+HISTORY_CONFIG = {
+    'history_dir': 'data/history',
+    'save_snapshots': True,  # 运行主流程时是否保存当日快照
+    'date_format': '%Y-%m-%d'
+}
+
+# 结构化结果归档配置（SQLite）
+ARCHIVE_CONFIG = {
+    'db_path': 'data/archive.sqlite',
+    'enabled': True  # 运行主流程时是否写入归档
+}
+
+# 分析结果导出配置（Arrow IPC / Parquet，按日期分区）
+EXPORT_CONFIG = {
+    'export_dir': 'data/export',
+    'enabled': True,  # 运行主流程时是否导出
+    'formats': ['arrow', 'parquet']  # arrow为未压缩的IPC文件，可直接内存映射
+}
+
+# 数据目录监听配置：新快照写入完成后立即运行流水线
+WATCH_CONFIG = {
+    'watch_dir': 'data',
+    'patterns': ['*.csv', '*.xlsx', '*.xls'],  # 只处理匹配的文件名，供应商的临时文件不会触发
+    'backend': 'auto',  # auto: Linux上用inotify，其他系统或inotify不可用时轮询；poll: 强制轮询
+    'poll_interval': 2,  # 轮询后端的扫描间隔（秒）
+    'settle_seconds': 3,  # 文件大小和修改时间保持不变多久后视为写入完成（秒）
+    'check_interval': 0.5,  # 等待写入完成期间检查文件状态的间隔（秒）
+    'latency_log': 'logs/watch_latency.csv'  # 每次触发的到达、稳定、开始和发布时间
+}
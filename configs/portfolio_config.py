@@ -16,3 +16,24 @@ PORTFOLIO_WEIGHTS = {
     'balanced': [0.25, 0.25, 0.2, 0.15, 0.15],
     'diversified': [0.2, 0.2, 0.15, 0.15, 0.15, 0.15]
 }
+
+# 分散组合配置
+DIVERSIFICATION_CONFIG = {
+    'mode': 'correlation',  # 'correlation'按历史收益相关性聚类；'keyword'按名称关键词。历史不足时自动退回keyword
+    'window': 60,  # 计算相关性的交易日窗口
+    'min_periods': 20,  # 窗口内有效收益少于该天数的ETF不参与聚类
+    'n_clusters': 6,  # 聚类数量，每类选综合得分最高的一只
+    'linkage': 'average',  # 层次聚类的连接方式
+    'block_size': 1024  # 由配对统计量计算相关系数时的分块行数
+}
+
+# 组合分析配置
+PORTFOLIO_ANALYTICS_CONFIG = {
+    'window': 60,  # 计算波动率、夏普比率、最大回撤的历史交易日窗口
+    'min_periods': 20,  # 组合有效收益少于该天数时历史指标为NaN
+    'trading_days': 252,  # 年化天数
+    'nominal_capital': 1e7,  # 计算流动性覆盖时假设的组合规模（元）
+    'participation': 0.1,  # 单日最多占某ETF平均成交额的比例
+    # 按年化波动率划分风险等级（上限, 等级），超过最后一档为"高"
+    'risk_levels': [(0.10, '低'), (0.25, '中等')]
+}
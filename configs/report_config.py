@@ -10,8 +10,91 @@ REPORT_CONFIG = {
     'chart_sizes': {
         'histogram': (8, 4),  # 减小尺寸
         'bar_chart': (8, 5),
-        'pie_chart': (6, 6)
+        'pie_chart': (6, 6),
+        'heatmap': (10, 7),
+        'quantile': (10, 7)
     },
     'risk_free_rate': 0.02,  # 无风险利率，用于计算夏普比率
+    'score_scatter_top_n': 50,  # 静态综合评分散点图绘制综合得分最高的ETF数（全市场见--interactive）
     'chart_dpi': 80  # 降低图表分辨率
 }
+
+# HTML报告交互图表配置（--interactive）
+INTERACTIVE_CHART_CONFIG = {
+    'plotlyjs': 'inline',  # 'inline' 在报告中内嵌一次plotly.js（离线可用），'cdn' 引用CDN
+    'category_column': '类型',  # 图例和筛选下拉框按该列分组
+    'height': 600,
+    'charts': {
+        'score_scatter': {'x': '成交额', 'y': '综合得分', 'log_x': True, 'title': 'ETF综合得分 vs 成交额（全市场）'},
+        'return_scatter': {'x': '5日涨跌幅', 'y': '涨跌幅', 'log_x': False, 'title': '今日涨跌幅 vs 5日涨跌幅（全市场）'}
+    },
+    'hover_columns': ['涨跌幅', '溢折率']  # 悬停时额外显示的列
+}
+
+# HTML报告全市场数据表配置（--full-table）
+UNIVERSE_TABLE_CONFIG = {
+    'columns': ['代码', '名称', '类型', '管理公司', '现价', '涨跌幅', '5日涨跌幅', '年初至今', '成交额', '换手率',
+                '溢折率', '规模变化', '综合得分'],
+    'filter_column': '类型',  # 下拉筛选所用的列
+    'default_sort': '综合得分',  # 初始按该列从高到低排序
+    'row_height': 30,  # 行高（像素），虚拟滚动按固定行高定位
+    'visible_rows': 20,  # 可视区域行数
+    'decimals': {'percent': 6, 'currency': 0, 'number': 4}  # 嵌入数据时数值保留的小数位
+}
+
+# 本地报告服务配置
+SERVICE_CONFIG = {
+    'host': '127.0.0.1',  # 仅监听本机
+    'port': 8765,
+    'poll_interval': 5,  # 检查数据文件更新的间隔（秒）
+    'render_workers': 2,  # 图表渲染进程数
+    'request_timeout': 30  # 读取请求头的超时时间（秒）
+}
+
+# 流水线时间预算配置
+TIME_BUDGET = {
+    'total': 300,  # 总预算（秒）
+    'grace': 30,  # 超出总预算后再等待的时间，之后强制终止工作进程
+    # 各阶段占剩余预算的份额，前面阶段节省的时间顺延给后续阶段
+    'stages': {
+        'load': 0.15,
+        'analysis': 0.15,
+        'charts': 0.30,
+        'portfolio': 0.10,
+        'archive': 0.05,  # 归档和导出为可选阶段，剩余时间不足optional_min_seconds时跳过
+        'export': 0.05,
+        'report': 0.20
+    },
+    'optional_min_seconds': 5,  # 阶段剩余时间少于该值时跳过可选内容
+    'optional_charts': ['score_scatter', 'rollup_heatmap', 'quantile_returns']  # 预算不足时优先舍弃的图表
+}
+
+# 采样分析配置（--profile）：工作进程内定时采样调用栈，按流水线阶段归类
+PROFILE_CONFIG = {
+    'interval': 0.01,  # 采样间隔（秒）
+    'max_depth': 200,  # 每个样本保留的最大栈深度（从最内层算起）
+    'top_n': 25,  # 热点汇总列出的函数数
+    'outside_stage': 'other'  # 不在任何阶段内的样本（如归档、导出）归入的名称
+}
+
+# 日间变化对比配置
+DIFF_CONFIG = {
+    'index_dir': 'rankings',  # 排名索引目录（位于历史快照目录下）
+    # 参与新进/退出对比的榜单及其显示名称
+    'tracked_lists': {
+        'top_gainers': '涨幅榜',
+        'top_losers': '跌幅榜',
+        'top_volume': '成交额榜',
+        'top_turnover': '换手率榜',
+        'top_inflow': '资金流入榜',
+        'top_score': '综合评分榜'
+    },
+    'top_n': 10  # 排名升降展示数量
+}
+
+# 自选清单批量报告配置（--watchlists）
+WATCHLIST_CONFIG = {
+    'output_dir': 'reports/watchlists',
+    'workers': 4,  # 渲染进程数
+    'shared_charts': ['price_change_dist', 'type_performance']  # 全市场图表，只生成一次供所有报告复用
+}
@@ -2,22 +2,54 @@ import argparse
 import sys
 import time
 import matplotlib.pyplot as plt
-from modules.data_loader import load_etf_data
-from modules.analyzer import analyze_etf_data
-from modules.visualizer import generate_all_charts
+from modules.data_loader import read_etf_sources, clean_etf_data
+from modules.analyzer import analyze_etf_data, add_derived_columns
+from modules.visualizer import generate_all_charts, generate_interactive_charts
 from modules.portfolio_builder import generate_portfolio_advice
 from modules.report_generator import generate_markdown_report, generate_html_report
-from utils.logging_config import logger
+from modules.history import default_store
+from modules.rank_diff import compare_with_previous
+from modules.archive import archive_results
+from modules.exporter import export_results
+from configs.report_config import TIME_BUDGET
+from configs.data_config import HISTORY_CONFIG, ARCHIVE_CONFIG, EXPORT_CONFIG, WATCH_CONFIG
+from utils.logging_config import logger, get_log_queue, init_worker_logging
+from utils.time_budget import TimeBudget
+from utils.profiler import SamplingProfiler
+from utils.shared_table import ensure_resource_tracker, share_bytes, read_shared_bytes
+import os
 import traceback
 import platform
+from datetime import datetime
 import multiprocessing
 
+# 超过该长度的字符串结果经共享内存返回，不再通过进程池管道pickle
+SHARED_RESULT_MIN_BYTES = 64 * 1024
+
+def _call_with_shared_result(func, args):
+    """
+    在工作进程中执行func，较大的字符串结果写入共享内存后只返回其名称
+
+    工作进程保留共享内存句柄，主进程读取结果之后才关闭进程池，Windows上共享内存不会提前销毁
+    """
+    result = func(*args)
+    if isinstance(result, str) and len(result) >= SHARED_RESULT_MIN_BYTES:
+        return ('shared',) + share_bytes(result.encode('utf-8'))
+    return ('inline', result)
+
 def run_with_timeout(func, args=(), timeout=120):
     """使用多进程实现超时功能"""
-    pool = multiprocessing.Pool(processes=1)
+    # 工作进程的日志经队列交给主进程统一写入，共享内存由同一个资源跟踪器管理
+    ensure_resource_tracker()
+    pool = multiprocessing.Pool(processes=1, initializer=init_worker_logging, initargs=(get_log_queue(),))
+    finished = False
     try:
-        result = pool.apply_async(func, args)
-        return result.get(timeout=timeout)
+        result = pool.apply_async(_call_with_shared_result, (func, args))
+        packed = result.get(timeout=timeout)
+        finished = True
+        if packed[0] == 'shared':
+            return read_shared_bytes(*packed[1:]).decode('utf-8')
+        return packed[1]
     except multiprocessing.TimeoutError:
         logger.error("操作超时")
         return None
@@ -26,48 +58,102 @@ def run_with_timeout(func, args=(), timeout=120):
         return None
     finally:
         pool.close()
-        pool.terminate()
+        if finished:
+            # 正常结束时等待工作进程退出，确保其日志已全部送入队列
+            pool.join()
+        else:
+            pool.terminate()
 
-def main_process(data_file, output_file, report_type):
+def profile_path(output_file):
+    """采样分析结果与报告放在一起：报告路径去掉扩展名"""
+    if output_file:
+        return os.path.splitext(output_file)[0]
+    return f"reports/ETF市场日报_{datetime.now().strftime('%Y%m%d')}"
+
+def main_process(data_file, output_file, report_type, sheet_name=None, time_budget=None, interactive=False,
+                 full_table=False, profile=False):
     """在单独进程中运行的主逻辑"""
+    # 各阶段从总预算中分得截止时间，预算不足时舍弃可选内容，保证核心榜单照常发布
+    budget = TimeBudget(time_budget)
+    # 采样分析在工作进程内运行，样本按budget当前所处的阶段归类
+    profiler = SamplingProfiler(stage=lambda: budget.current_stage).start() if profile else None
     try:
         # 1. 加载数据
         logger.info("正在加载ETF数据...")
-        df = load_etf_data(data_file)
+        with budget.stage('load'):
+            raw = read_etf_sources(data_file, sheet_name)
+            df = clean_etf_data(raw)
         if df is None or df.empty:
             logger.error("加载的数据为空，请检查数据文件")
             return "数据加载失败"
         
         logger.info(f"成功加载 {len(df)} 条ETF数据")
         
+        # 保存当日快照，累积的历史供波动率、资金流持续性等历史因子使用；
+        # 快照保存清洗保留下来的行的原始数值，不含缺失值填充和异常值替换
+        if HISTORY_CONFIG['save_snapshots']:
+            try:
+                default_store().save(raw.loc[df.index])
+            except Exception as e:
+                logger.warning(f"保存历史快照失败: {str(e)}")
+        
         # 2. 数据分析
         logger.info("正在分析ETF数据...")
-        start_analysis = time.time()
-        analysis_results = analyze_etf_data(df)
-        logger.info(f"数据分析完成，耗时: {time.time() - start_analysis:.2f}秒")
+        with budget.stage('analysis', '数据分析'):
+            # 派生列以叠加方式加入，后续各阶段共享同一份数据而不再各自复制
+            df = add_derived_columns(df)
+            analysis_results = analyze_etf_data(df, budget=budget)
+            # 与上一交易日的排名索引对比
+            try:
+                analysis_results['day_over_day'] = compare_with_previous(
+                    df, analysis_results, save=HISTORY_CONFIG['save_snapshots'])
+            except Exception as e:
+                logger.warning(f"日间对比失败: {str(e)}")
+        analysis_results['degraded_sections'] = budget.degraded
         
         # 3. 生成图表
         logger.info("正在生成可视化图表...")
-        start_charts = time.time()
-        charts = generate_all_charts(df, analysis_results)
-        logger.info(f"图表生成完成，耗时: {time.time() - start_charts:.2f}秒")
+        with budget.stage('charts', '图表生成'):
+            charts = generate_all_charts(df, analysis_results, budget)
+            # 交互图表只用于HTML报告，绘制全部ETF
+            interactive_charts = generate_interactive_charts(df) if interactive and report_type.lower() == 'html' else None
         
         # 4. 生成投资组合建议
         logger.info("正在生成投资组合建议...")
-        start_portfolio = time.time()
-        portfolio_advice = generate_portfolio_advice(df)
-        logger.info(f"投资组合生成完成，耗时: {time.time() - start_portfolio:.2f}秒")
+        with budget.stage('portfolio', '投资组合生成'):
+            portfolio_advice = generate_portfolio_advice(df, budget)
+        
+        # 结构化结果写入归档，供跨日期查询；归档和导出是可选阶段，预算不足时跳过，保证报告按时发布
+        if ARCHIVE_CONFIG['enabled']:
+            with budget.stage('archive', '结果归档'):
+                if budget.allows_optional():
+                    try:
+                        archive_results(df, analysis_results, portfolio_advice)
+                    except Exception as e:
+                        logger.warning(f"写入归档失败: {str(e)}")
+                else:
+                    budget.degrade('结果归档')
+        
+        # 导出Arrow/Parquet，供下游直接读取
+        if EXPORT_CONFIG['enabled']:
+            with budget.stage('export', '结果导出'):
+                if budget.allows_optional():
+                    try:
+                        export_results(df, analysis_results, portfolio_advice)
+                    except Exception as e:
+                        logger.warning(f"导出分析结果失败: {str(e)}")
+                else:
+                    budget.degrade('Arrow/Parquet导出')
         
         # 5. 生成报告
         logger.info("正在生成报告...")
-        start_report = time.time()
+        with budget.stage('report', '报告生成'):
+            if report_type.lower() == 'html':
+                report_content = generate_html_report(analysis_results, charts, portfolio_advice, output_file, interactive_charts,
+                                                      universe=df if full_table else None)
+            else:
+                report_content = generate_markdown_report(analysis_results, charts, portfolio_advice, output_file)
         
-        if report_type.lower() == 'html':
-            report_content = generate_html_report(analysis_results, charts, portfolio_advice, output_file)
-        else:
-            report_content = generate_markdown_report(analysis_results, charts, portfolio_advice, output_file)
-        
-        logger.info(f"报告生成完成，耗时: {time.time() - start_report:.2f}秒")
         logger.info("报告生成完成！")
         
         return report_content
@@ -78,20 +164,28 @@ def main_process(data_file, output_file, report_type):
     finally:
         # 确保关闭所有matplotlib图形
         plt.close('all')
+        if profiler is not None:
+            try:
+                profiler.stop().save(profile_path(output_file))
+            except Exception as e:
+                logger.warning(f"保存采样分析结果失败: {str(e)}")
 
-def main(data_file='data/ETF行情数据.csv', output_file=None, report_type='md'):
+def main(data_file='data/ETF行情数据.csv', output_file=None, report_type='md', sheet_name=None, time_budget=None,
+         interactive=False, full_table=False, profile=False):
     """主函数入口，处理超时逻辑"""
     try:
         # 在Windows上使用多进程实现超时
         logger.info("使用多进程超时机制")
         
-        # 设置超时时间（秒）
-        timeout = 300  # 5分钟
+        # 工作进程按阶段预算协作式降级；超出总预算加宽限期仍未完成时才强制终止
+        if time_budget is None:
+            time_budget = TIME_BUDGET['total']
+        timeout = time_budget + TIME_BUDGET['grace']
         
         # 运行主逻辑并设置超时
         result = run_with_timeout(
             main_process, 
-            args=(data_file, output_file, report_type), 
+            args=(data_file, output_file, report_type, sheet_name, time_budget, interactive, full_table, profile), 
             timeout=timeout
         )
         
@@ -108,12 +202,53 @@ def main(data_file='data/ETF行情数据.csv', output_file=None, report_type='md
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='ETF市场日报生成工具')
-    parser.add_argument('data_file', nargs='?', default='data/ETF行情数据.csv', help='ETF数据文件路径')
+    parser.add_argument('data_file', nargs='*', default=['data/ETF行情数据.csv'],
+                        help='ETF数据文件路径，可指定多个（如分交易所/供应商的文件），逐个解析后按代码合并去重')
     parser.add_argument('--output', '-o', help='输出文件路径')
     parser.add_argument('--format', '-f', choices=['md', 'html'], default='md', help='报告格式: md (Markdown) 或 html')
+    parser.add_argument('--sheet', '-s', help='Excel工作表名称或序号（默认第一个工作表）')
+    parser.add_argument('--interactive', action='store_true', help='HTML报告附加全市场交互图表（WebGL，可悬停和按类型筛选）')
+    parser.add_argument('--full-table', action='store_true', help='HTML报告附加可排序、筛选的全市场数据表')
+    parser.add_argument('--profile', action='store_true',
+                        help='采样分析各阶段耗时，在报告旁输出折叠栈（.folded，可生成火焰图）和热点汇总')
+    parser.add_argument('--budget', type=float, help='流水线总时间预算（秒），不足时舍弃可选图表和分散组合')
+    parser.add_argument('--serve', action='store_true', help='启动本地报告服务，以JSON/PNG提供最新分析结果')
+    parser.add_argument('--host', help='报告服务监听地址（默认127.0.0.1）')
+    parser.add_argument('--port', type=int, help='报告服务端口（默认8765）')
+    parser.add_argument('--watchlists', metavar='FILE', help='按自选清单文件（JSON）批量生成报告，数据只分析一次')
+    parser.add_argument('--monitor', metavar='SOURCE', help='日内溢折率监控：快照目录，或tcp://host:port本地推送地址')
+    parser.add_argument('--follow', action='store_true', help='监控目录时持续等待新快照文件')
+    parser.add_argument('--watch', nargs='?', const=WATCH_CONFIG['watch_dir'], metavar='DIR',
+                        help='监听数据目录（默认data），新快照写入完成后立即生成报告')
     
     args = parser.parse_args()
-    result = main(args.data_file, args.output, args.format)
+    data_file = args.data_file[0] if len(args.data_file) == 1 else args.data_file
+    sheet_name = int(args.sheet) if args.sheet and args.sheet.isdigit() else args.sheet
+    
+    if args.monitor:
+        from modules.premium_monitor import run_monitor
+        run_monitor(args.monitor, args.follow)
+        sys.exit(0)
+    
+    if args.watchlists:
+        from modules.batch_reports import run_batch
+        run_batch(data_file, args.watchlists, sheet_name, args.format)
+        sys.exit(0)
+    
+    if args.watch:
+        from modules.watcher import run_watch
+        time_budget = args.budget if args.budget is not None else TIME_BUDGET['total']
+        run_watch(main_process, (args.output, args.format, sheet_name, time_budget, args.interactive, args.full_table,
+                                args.profile), args.watch, time_budget + TIME_BUDGET['grace'])
+        sys.exit(0)
+    
+    if args.serve:
+        from modules.report_service import run_service
+        run_service(data_file, sheet_name, args.host, args.port)
+        sys.exit(0)
+    
+    result = main(data_file, args.output, args.format, sheet_name, args.budget, args.interactive, args.full_table,
+                  args.profile)
     
     if isinstance(result, str) and result.startswith("程序执行失败"):
         sys.exit(1)
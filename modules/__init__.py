@@ -1 +1,7 @@
 # 使modules成为包
+import pandas as pd
+
+# 启用写时复制：各阶段派生的DataFrame与原始数据共享列缓冲区，只有被写入的列才会复制
+# pandas>=3.0 已默认启用且该选项已弃用
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
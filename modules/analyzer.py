@@ -1,71 +1,177 @@
+import weakref
 import numpy as np
-from scipy import stats
 import pandas as pd
-from configs.analysis_config import ANALYSIS_WEIGHTS, REVERSAL_THRESHOLD, DISCOUNT_THRESHOLD
+from configs.analysis_config import ANALYSIS_WEIGHTS, REVERSAL_THRESHOLD, DISCOUNT_THRESHOLD, STABILITY_CONFIG, SCANNER_CONFIG
+from .factors import FACTORS, compute_factors
+from .scanner import scan_history
+from .screener import run_screens
+from .rollup import build_rollup
+from .stability import score_stability
+from .quantiles import quantile_analysis
+from utils.logging_config import logger
 
-def calculate_composite_score(df):
-    """计算ETF综合得分"""
+# 各排名表输出的列
+RANKING_COLUMNS = {
+    'top_gainers': ['代码', '名称', '现价', '涨跌幅', '成交额'],
+    'top_losers': ['代码', '名称', '现价', '涨跌幅', '成交额'],
+    'top_volume': ['代码', '名称', '现价', '涨跌幅', '成交额'],
+    'top_turnover': ['代码', '名称', '现价', '换手率', '成交额'],
+    'discount_etfs': ['代码', '名称', '现价', '溢折率', '成交额', '换手率'],
+    'top_inflow': ['代码', '名称', '现价', '规模变化', '估算规模', '涨跌幅'],
+    'reversal_etfs': ['代码', '名称', '现价', '涨跌幅', '5日涨跌幅', '成交额'],
+    'top_score': ['代码', '名称', '现价', '涨跌幅', '5日涨跌幅', '年初至今', '综合得分'],
+    # 各周期动量列随SCANNER_CONFIG['horizons']变化
+    'momentum_scan': (['代码', '名称', '现价'] + [f"动量{horizon}日" for horizon in SCANNER_CONFIG['horizons']]
+                      + ['多周期动量']),
+    'reversal_scan': ['代码', '名称', '现价', '涨跌幅', '反转周期数', '反转前跌幅']
+}
+
+# add_derived_columns计算综合得分时得到的 (权重, 因子块)，按返回的DataFrame登记，DataFrame释放时随之移除
+_FACTOR_BLOCKS = {}
+
+def standardize_factors(df, factors):
+    """对因子列做Z-score标准化，返回 (行数 × 因子数) 的数组，缺失/无穷值记为0"""
+    # 写时复制下to_numpy可能返回只读视图，这里生成新数组而非原地修改
+    block = df[factors].to_numpy(dtype='float64')
+    block = np.where(np.isfinite(block), block, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z_scores = (block - np.nanmean(block, axis=0)) / np.nanstd(block, axis=0)
+    return np.nan_to_num(z_scores, nan=0, posinf=0, neginf=0)
+
+def factor_block(df, store=None):
+    """
+    综合得分的因子权重和标准化因子块
+    
+    ANALYSIS_WEIGHTS中不是数据列的名称按历史因子（modules/factors.py）计算，
+    历史样本不足时该因子标准化后为0，不影响其余因子
+    
+    返回:
+    (权重数组, (行数 × 因子数) 标准化因子块)
+    """
     factors = list(ANALYSIS_WEIGHTS.keys())
-    df_factors = df[factors].copy()
-    
-    # Z-score标准化处理
-    for factor in factors:
-        # 处理无穷大值
-        df_factors[factor] = df_factors[factor].replace([np.inf, -np.inf], np.nan)
-        # Z-score标准化
-        z_scores = stats.zscore(df_factors[factor], nan_policy='omit')
-        # 将NaN替换为0
-        df_factors[factor] = np.nan_to_num(z_scores, nan=0)
-    
-    # 计算加权综合得分
-    composite_score = np.zeros(len(df))
-    for factor, weight in ANALYSIS_WEIGHTS.items():
-        composite_score += df_factors[factor] * weight
-    
-    return composite_score
+    weights = np.array(list(ANALYSIS_WEIGHTS.values()))
+    
+    historical = [name for name in factors if name not in df.columns and name in FACTORS]
+    if historical:
+        df = df.assign(**compute_factors(df, historical, store))
+    return weights, standardize_factors(df, factors)
+
+def calculate_composite_score(df, store=None):
+    """计算ETF综合得分"""
+    weights, block = factor_block(df, store)
+    # 整块标准化后做一次矩阵乘法，不复制因子列到新的DataFrame
+    composite_score = block @ weights
+    
+    return pd.Series(composite_score, index=df.index)
 
-def analyze_etf_data(df):
-    """执行完整的ETF数据分析"""
+def score_factors(df):
+    """综合得分所用的 (权重, 因子块)：df由add_derived_columns算出得分时直接复用，否则重新计算"""
+    cached = _FACTOR_BLOCKS.get(id(df))
+    if cached is not None and len(cached[1]) == len(df):
+        return cached
+    return factor_block(df)
+
+def add_derived_columns(df):
+    """
+    在原始数据上叠加派生列（综合得分、反转信号，以及有历史时的多周期动量/反转），不修改传入的DataFrame
+    
+    写时复制下assign只新增派生列，原有列仍与输入共享缓冲区
+    """
+    overlays, factors = {}, None
+    if '多周期动量' not in df.columns:
+        try:
+            scan = scan_history(df)
+        except Exception as e:
+            logger.warning(f"多周期扫描失败: {str(e)}")
+            scan = None
+        if scan is not None:
+            overlays.update(scan)
+    if '综合得分' not in df.columns:
+        # 因子块保留下来，排名稳定性分析不必再标准化一次
+        factors = factor_block(df)
+        overlays['综合得分'] = pd.Series(factors[1] @ factors[0], index=df.index)
+    if '反转信号' not in df.columns:
+        overlays['反转信号'] = (df['5日涨跌幅'] < REVERSAL_THRESHOLD['5日跌幅']) & (df['涨跌幅'] > REVERSAL_THRESHOLD['今日涨幅'])
+    if not overlays:
+        return df
+    result = df.assign(**overlays)
+    if factors is not None:
+        _FACTOR_BLOCKS[id(result)] = factors
+        weakref.finalize(result, _FACTOR_BLOCKS.pop, id(result), None)
+    return result
+
+def analyze_etf_data(df, derive=True, budget=None):
+    """
+    执行完整的ETF数据分析
+    
+    derive=False时直接使用df中已有的派生列（如从全市场表切出的自选子集，得分保持全市场口径）；
+    budget为可选的时间预算（TimeBudget），不足时跳过排名稳定性分析
+    """
     results = {}
     
-    # 1. 计算综合得分
-    df['综合得分'] = calculate_composite_score(df)
+    # 1. 计算综合得分（派生列叠加在共享数据之上，调用方的DataFrame保持不变）
+    if derive:
+        df = add_derived_columns(df)
     
     # 2. 涨跌幅排名
-    results['top_gainers'] = df.nlargest(10, '涨跌幅')[['代码', '名称', '现价', '涨跌幅', '成交额']]
-    results['top_losers'] = df.nsmallest(10, '涨跌幅')[['代码', '名称', '现价', '涨跌幅', '成交额']]
+    results['top_gainers'] = df.nlargest(10, '涨跌幅')[RANKING_COLUMNS['top_gainers']]
+    results['top_losers'] = df.nsmallest(10, '涨跌幅')[RANKING_COLUMNS['top_losers']]
     
     # 3. 成交额排名
-    results['top_volume'] = df.nlargest(10, '成交额')[['代码', '名称', '现价', '涨跌幅', '成交额']]
+    results['top_volume'] = df.nlargest(10, '成交额')[RANKING_COLUMNS['top_volume']]
     
     # 4. 换手率排名
-    results['top_turnover'] = df.nlargest(10, '换手率')[['代码', '名称', '现价', '换手率', '成交额']]
+    results['top_turnover'] = df.nlargest(10, '换手率')[RANKING_COLUMNS['top_turnover']]
     
     # 5. 折价ETF分析
     results['discount_etfs'] = df[df['溢折率'] < DISCOUNT_THRESHOLD].sort_values('溢折率')[
-        ['代码', '名称', '现价', '溢折率', '成交额', '换手率']].head(10)
+        RANKING_COLUMNS['discount_etfs']].head(10)
     
     # 6. 资金流入排名
-    results['top_inflow'] = df.nlargest(10, '规模变化')[['代码', '名称', '现价', '规模变化', '估算规模', '涨跌幅']]
+    results['top_inflow'] = df.nlargest(10, '规模变化')[RANKING_COLUMNS['top_inflow']]
     
     # 7. 反转信号ETF
-    df['反转信号'] = (df['5日涨跌幅'] < REVERSAL_THRESHOLD['5日跌幅']) & (df['涨跌幅'] > REVERSAL_THRESHOLD['今日涨幅'])
     results['reversal_etfs'] = df[df['反转信号']].sort_values('5日涨跌幅')[
-        ['代码', '名称', '现价', '涨跌幅', '5日涨跌幅', '成交额']].head(10)
+        RANKING_COLUMNS['reversal_etfs']].head(10)
     
     # 8. 综合评分排名
-    results['top_score'] = df.nlargest(10, '综合得分')[
-        ['代码', '名称', '现价', '涨跌幅', '5日涨跌幅', '年初至今', '综合得分']]
+    results['top_score'] = df.nlargest(10, '综合得分')[RANKING_COLUMNS['top_score']]
+    
+    # 综合评分的排名稳定性（权重扰动下进入前10的概率和排名区间；自选子集沿用全市场口径，不再计算）
+    if derive:
+        if len(df) > STABILITY_CONFIG['max_rows']:
+            logger.info(f"ETF数 {len(df)} 超过 {STABILITY_CONFIG['max_rows']}，跳过综合评分稳定性分析")
+        elif budget is not None and not budget.allows_optional():
+            budget.degrade('综合评分稳定性')
+        else:
+            results['score_stability'] = score_stability(df, *score_factors(df))
     
-    # 9. 类型分析
+    # 9. 多周期动量与反转（有历史快照时）
+    if '多周期动量' in df.columns:
+        results['momentum_scan'] = df.nlargest(10, '多周期动量')[RANKING_COLUMNS['momentum_scan']]
+        results['reversal_scan'] = df[df['多周期反转']].sort_values(
+            ['反转周期数', '反转前跌幅'], ascending=[False, True])[RANKING_COLUMNS['reversal_scan']].head(10)
+    
+    # 10. 自定义筛选（SCREEN_CONFIG和筛选定义文件中的表达式，一次求值全部筛选）
+    results['screens'], results['screen_summary'] = run_screens(df)
+    
+    # 11. 类型分析
     results['type_perf'] = df.groupby('类型')['涨跌幅'].agg(['mean', 'count'])
     results['type_perf'].columns = ['平均涨跌幅', '数量']
     
-    # 10. 市场概况
+    # 12. 多维汇总（按类型、管理公司、跟踪指数及其组合；自选子集沿用全市场结果）
+    if derive:
+        results['rollup'] = build_rollup(df)
+    
+    # 13. 因子分位分析（按各因子等分全市场统计各组收益；自选子集样本太少，沿用全市场结果）
+    if derive:
+        results['quantiles'] = quantile_analysis(df)
+    
+    # 14. 市场概况
     results['market_overview'] = {
-        '上涨': len(df[df['涨跌幅'] > 0]),
-        '下跌': len(df[df['涨跌幅'] < 0]),
-        '平盘': len(df[df['涨跌幅'] == 0]),
+        '上涨': int((df['涨跌幅'] > 0).sum()),
+        '下跌': int((df['涨跌幅'] < 0).sum()),
+        '平盘': int((df['涨跌幅'] == 0).sum()),
         '平均涨跌幅': df['涨跌幅'].mean(),
         '总数量': len(df)
     }
@@ -0,0 +1,274 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from configs.data_config import ARCHIVE_CONFIG
+from .history import snapshot_date
+from utils.logging_config import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    date TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    etf_count INTEGER,
+    avg_change REAL
+);
+CREATE TABLE IF NOT EXISTS rankings (
+    date TEXT NOT NULL,
+    list TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    name TEXT,
+    price REAL,
+    change REAL
+);
+CREATE INDEX IF NOT EXISTS idx_rankings_code ON rankings (code, list, date);
+CREATE INDEX IF NOT EXISTS idx_rankings_date ON rankings (date, list);
+CREATE TABLE IF NOT EXISTS scores (
+    date TEXT NOT NULL,
+    code TEXT NOT NULL,
+    name TEXT,
+    score REAL,
+    rank INTEGER,
+    change REAL,
+    amount REAL,
+    turnover REAL,
+    premium REAL,
+    PRIMARY KEY (code, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_scores_date ON scores (date, rank);
+CREATE TABLE IF NOT EXISTS portfolio (
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    name TEXT,
+    score REAL
+);
+CREATE INDEX IF NOT EXISTS idx_portfolio_code ON portfolio (code, date);
+CREATE INDEX IF NOT EXISTS idx_portfolio_date ON portfolio (date, category);
+CREATE TABLE IF NOT EXISTS etfs (
+    code TEXT PRIMARY KEY,
+    name TEXT,
+    last_seen TEXT
+);
+"""
+
+def _column(table, name):
+    """取DataFrame的一列为Python对象数组（NaN转为None），缺列时全为None"""
+    if name not in table.columns:
+        return [None] * len(table)
+    return table[name].astype(object).where(table[name].notna(), None).tolist()
+
+def _code_range(code):
+    """
+    代码查询条件：带交易所后缀时精确匹配，否则匹配所有后缀（511360 -> 511360.SH/511360.SZ）
+
+    不带后缀时用区间 ['511360.', '511360/') 代替LIKE，仍可使用代码索引
+    """
+    if '.' in code:
+        return "code = ?", (code,)
+    return "(code = ? OR (code >= ? AND code < ?))", (code, code + '.', code + '/')
+
+class ReportArchive:
+    """
+    历次报告结构化结果的SQLite归档
+
+    每个交易日写入全部榜单、全市场得分和组合选择，按日期和代码建索引；
+    ETF名称建FTS5全文索引（trigram分词，支持中文子串）。同一日期重复写入时覆盖
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or ARCHIVE_CONFIG['db_path']
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.fts = self._create_fts()
+
+    def _migrate(self):
+        """旧版scores表的turnover列存放的是成交额：改名为amount，再新增存放换手率的turnover列"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(scores)")]
+        if 'amount' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE scores RENAME COLUMN turnover TO amount")
+                self.conn.execute("ALTER TABLE scores ADD COLUMN turnover REAL")
+            logger.info("归档scores表已升级：原turnover列（成交额）改名为amount，新增turnover列（换手率）")
+
+    def _create_fts(self):
+        """创建名称全文索引；SQLite不支持FTS5时退回LIKE查询"""
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS etf_names USING fts5("
+                                  f"code UNINDEXED, name, tokenize='{tokenizer}')")
+                return True
+            except sqlite3.OperationalError:
+                continue
+        logger.warning("SQLite不支持FTS5，名称搜索使用LIKE")
+        return False
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, df, analysis_results, portfolio_advice, date=None):
+        """
+        写入一次运行的结构化结果
+
+        参数:
+        df: 含综合得分的当日数据
+        analysis_results: analyze_etf_data的结果
+        portfolio_advice: generate_portfolio_advice的结果
+        date: 交易日，默认snapshot_date(df)
+        """
+        date = date or snapshot_date(df)
+        rankings = []
+        for key, table in analysis_results.items():
+            if isinstance(table, pd.DataFrame) and '代码' in table.columns:
+                rankings += zip([date] * len(table), [key] * len(table), range(1, len(table) + 1),
+                                _column(table, '代码'), _column(table, '名称'),
+                                _column(table, '现价'), _column(table, '涨跌幅'))
+
+        picks = []
+        for key, value in portfolio_advice.items():
+            tables = value.items() if isinstance(value, dict) else [(None, value)]
+            for sub, table in tables:
+                if isinstance(table, pd.DataFrame) and '代码' in table.columns:
+                    category = key if sub is None else f"{key}/{sub}"
+                    picks += zip([date] * len(table), [category] * len(table), range(1, len(table) + 1),
+                                 _column(table, '代码'), _column(table, '名称'), _column(table, '综合得分'))
+
+        ranks = df['综合得分'].rank(ascending=False, method='min') if '综合得分' in df.columns else pd.Series(np.nan, index=df.index)
+        scores = list(zip([date] * len(df), _column(df, '代码'), _column(df, '名称'), _column(df, '综合得分'),
+                          [None if pd.isna(rank) else int(rank) for rank in ranks],
+                          _column(df, '涨跌幅'), _column(df, '成交额'), _column(df, '换手率'), _column(df, '溢折率')))
+
+        start = time.time()
+        with self.conn:
+            for table in ('runs', 'rankings', 'scores', 'portfolio'):
+                self.conn.execute(f"DELETE FROM {table} WHERE date = ?", (date,))
+            self.conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?)",
+                              (date, datetime.now().isoformat(timespec='seconds'), len(df),
+                               float(df['涨跌幅'].mean()) if '涨跌幅' in df.columns else None))
+            self.conn.executemany("INSERT INTO rankings VALUES (?, ?, ?, ?, ?, ?, ?)", rankings)
+            # 按列名插入：升级过的旧归档中turnover列排在最后
+            self.conn.executemany("INSERT OR REPLACE INTO scores (date, code, name, score, rank, change, amount, "
+                                  "turnover, premium) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", scores)
+            self.conn.executemany("INSERT INTO portfolio VALUES (?, ?, ?, ?, ?, ?)", picks)
+            self._update_names(date, [(row[1], row[2]) for row in scores])
+        logger.info(f"已归档 {date}: 榜单 {len(rankings)} 行，得分 {len(scores)} 行，组合 {len(picks)} 行，"
+                    f"耗时: {time.time() - start:.2f}秒")
+
+    def _update_names(self, date, names):
+        """更新代码-名称表；名称有变化（或首次出现）的代码同步更新全文索引"""
+        known = dict(self.conn.execute("SELECT code, name FROM etfs"))
+        changed = [(code, name) for code, name in names if code is not None and known.get(code) != name]
+        self.conn.executemany("INSERT INTO etfs VALUES (?, ?, ?) ON CONFLICT(code) DO UPDATE "
+                              "SET name = excluded.name, last_seen = excluded.last_seen",
+                              [(code, name, date) for code, name in names if code is not None])
+        if self.fts and changed:
+            self.conn.executemany("DELETE FROM etf_names WHERE code = ?", [(code,) for code, _ in changed])
+            self.conn.executemany("INSERT INTO etf_names (code, name) VALUES (?, ?)", changed)
+
+    def _query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def search(self, text, limit=20):
+        """按名称搜索ETF（全文索引；少于3个字时trigram无法匹配，改用LIKE）"""
+        if self.fts and len(text) >= 3:
+            return self._query("SELECT e.code AS 代码, e.name AS 名称, e.last_seen AS 最近出现 FROM etf_names "
+                               "JOIN etfs e USING (code) WHERE etf_names MATCH ? ORDER BY rank LIMIT ?",
+                               ('"' + text.replace('"', '""') + '"', limit))
+        return self._query("SELECT code AS 代码, name AS 名称, last_seen AS 最近出现 FROM etfs "
+                           "WHERE name LIKE ? ORDER BY code LIMIT ?", (f"%{text}%", limit))
+
+    def appearances(self, code, ranking=None, since=None, until=None):
+        """某ETF在各榜单中出现的次数、最好名次和首末日期"""
+        condition, params = _code_range(code)
+        sql = (f"SELECT list AS 榜单, COUNT(*) AS 次数, MIN(position) AS 最好名次, "
+               f"MIN(date) AS 首次, MAX(date) AS 最近 FROM rankings WHERE {condition}")
+        for clause, value in (("list = ?", ranking), ("date >= ?", since), ("date <= ?", until)):
+            if value:
+                sql += f" AND {clause}"
+                params += (value,)
+        return self._query(sql + " GROUP BY list ORDER BY 次数 DESC", params)
+
+    def score_history(self, code, since=None, until=None):
+        """某ETF的逐日综合得分、排名、涨跌幅、成交额和换手率"""
+        condition, params = _code_range(code)
+        sql = (f"SELECT date AS 日期, code AS 代码, name AS 名称, score AS 综合得分, rank AS 排名, "
+               f"change AS 涨跌幅, amount AS 成交额, turnover AS 换手率 FROM scores WHERE {condition}")
+        for clause, value in (("date >= ?", since), ("date <= ?", until)):
+            if value:
+                sql += f" AND {clause}"
+                params += (value,)
+        return self._query(sql + " ORDER BY date", params)
+
+    def ranking(self, date, ranking):
+        """某日某榜单"""
+        return self._query("SELECT position AS 名次, code AS 代码, name AS 名称, price AS 现价, change AS 涨跌幅 "
+                           "FROM rankings WHERE date = ? AND list = ? ORDER BY position", (date, ranking))
+
+    def dates(self):
+        """已归档的交易日"""
+        return [row[0] for row in self.conn.execute("SELECT date FROM runs ORDER BY date")]
+
+def archive_results(df, analysis_results, portfolio_advice, db_path=None):
+    """把一次运行的结果写入归档"""
+    with ReportArchive(db_path) as archive:
+        archive.record(df, analysis_results, portfolio_advice)
+
+def main(argv=None):
+    """归档查询命令行：python -m modules.archive <命令> ..."""
+    parser = argparse.ArgumentParser(prog='python -m modules.archive', description='查询历次报告的结构化归档')
+    parser.add_argument('--db', help=f"归档文件（默认{ARCHIVE_CONFIG['db_path']}）")
+    commands = parser.add_subparsers(dest='command', required=True)
+    search = commands.add_parser('search', help='按名称搜索ETF')
+    search.add_argument('text')
+    count = commands.add_parser('count', help='统计ETF出现在各榜单的次数')
+    count.add_argument('code', help='代码，可省略交易所后缀')
+    count.add_argument('--list', dest='ranking', help='只统计某个榜单，如top_inflow')
+    count.add_argument('--since', help='起始日期 YYYY-MM-DD')
+    count.add_argument('--until', help='截止日期 YYYY-MM-DD')
+    history = commands.add_parser('history', help='ETF的逐日得分和排名')
+    history.add_argument('code')
+    history.add_argument('--since')
+    history.add_argument('--until')
+    day = commands.add_parser('day', help='某日的某个榜单')
+    day.add_argument('date')
+    day.add_argument('ranking', nargs='?', default='top_score')
+    commands.add_parser('dates', help='已归档的交易日')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db or ARCHIVE_CONFIG['db_path']):
+        print(f"归档不存在: {args.db or ARCHIVE_CONFIG['db_path']}")
+        return 1
+    with ReportArchive(args.db) as archive:
+        start = time.perf_counter()
+        if args.command == 'search':
+            result = archive.search(args.text)
+        elif args.command == 'count':
+            result = archive.appearances(args.code, args.ranking, args.since, args.until)
+        elif args.command == 'history':
+            result = archive.score_history(args.code, args.since, args.until)
+        elif args.command == 'day':
+            result = archive.ranking(args.date, args.ranking)
+        else:
+            result = pd.DataFrame({'日期': archive.dates()})
+        elapsed = (time.perf_counter() - start) * 1000
+    print(result.to_string(index=False) if not result.empty else '无结果')
+    print(f"\n{len(result)} 行，查询耗时 {elapsed:.1f}毫秒")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
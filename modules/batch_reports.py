@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from configs.data_config import HISTORY_CONFIG
+from configs.portfolio_config import PORTFOLIO_CATEGORIES
+from configs.report_config import WATCHLIST_CONFIG
+from .data_loader import load_etf_sources
+from .history import snapshot_date
+from .analyzer import analyze_etf_data, add_derived_columns
+from .portfolio_builder import generate_portfolio_advice
+from .visualizer import render_chart
+from .report_generator import generate_markdown_report, generate_html_report
+from utils.logging_config import logger, get_log_queue, init_worker_logging
+from utils.shared_table import SharedTable, attach_table, ensure_resource_tracker
+
+# 渲染进程内的共享上下文（由_init_worker在进程启动时设置一次）
+_WORKER = {}
+
+def load_watchlists(path):
+    """
+    读取自选清单文件（JSON数组）
+
+    每项: {"name": 名称, "codes": [代码, ...], "categories": [组合类别, ...], "format": "md"|"html"}；
+    代码可省略交易所后缀，categories和format可省略
+    """
+    with open(path, encoding='utf-8') as f:
+        watchlists = json.load(f)
+    for item in watchlists:
+        if not item.get('name') or not item.get('codes'):
+            raise ValueError(f"自选清单缺少name或codes: {item}")
+        unknown = [category for category in item.get('categories', []) if category not in PORTFOLIO_CATEGORIES]
+        if unknown:
+            raise ValueError(f"自选清单 {item['name']} 包含未知的组合类别: {', '.join(unknown)}")
+    return watchlists
+
+class CodeIndex:
+    """代码 -> 行位置；不带后缀的代码按首次出现的交易所匹配"""
+
+    def __init__(self, codes):
+        # 代码重复时按首次出现的行匹配（get_indexer要求索引唯一）
+        index = pd.Index(codes)
+        first = ~index.duplicated()
+        self.rows = np.flatnonzero(first)
+        self.index = index[first]
+        bare = pd.Series(np.arange(len(codes)), index=index.str.split('.').str[0])
+        self.bare = bare[~bare.index.duplicated()]
+
+    def positions(self, codes):
+        """返回 (找到的行位置数组, 未找到的代码列表)"""
+        codes = pd.Index([str(code) for code in codes])
+        positions = self.index.get_indexer(codes)
+        positions[positions >= 0] = self.rows[positions[positions >= 0]]
+        missing = positions < 0
+        positions[missing] = self.bare.reindex(codes[missing]).fillna(-1).to_numpy(dtype=np.intp)
+        found = positions >= 0
+        return pd.unique(positions[found]), codes[~found].tolist()
+
+def _init_worker(log_queue, descriptor, shared):
+    """渲染进程初始化：挂载共享表并保存全市场结果，之后每个任务只传自选清单"""
+    init_worker_logging(log_queue)
+    attached = attach_table(descriptor)
+    _WORKER.update(shared, df=attached.__enter__(), attached=attached)
+
+def render_watchlist(task):
+    """
+    在渲染进程中生成一份自选报告
+
+    参数:
+    task: (名称, 行位置数组, 组合类别列表, 报告格式, 输出文件)
+
+    返回:
+    (名称, 输出文件, 耗时秒数)
+    """
+    name, positions, categories, report_type, output_file = task
+    start = time.time()
+    subset = _WORKER['df'].iloc[positions]
+    # 自选子集直接使用全市场口径的派生列；市场概况、类型表现、多维汇总和因子分位沿用全市场结果
+    analysis_results = analyze_etf_data(subset, derive=False)
+    analysis_results['market_overview'] = _WORKER['market_overview']
+    analysis_results['type_perf'] = _WORKER['type_perf']
+    analysis_results['rollup'] = _WORKER['rollup']
+    analysis_results['quantiles'] = _WORKER['quantiles']
+    analysis_results['degraded_sections'] = []
+    portfolio_advice = {category: _WORKER['portfolio_advice'][category] for category in categories
+                        if category in _WORKER['portfolio_advice']}
+    title = f"ETF市场日报 · {name}"
+    if report_type == 'html':
+        generate_html_report(analysis_results, _WORKER['charts'], portfolio_advice, output_file,
+                             title=title, categories=categories)
+    else:
+        generate_markdown_report(analysis_results, _WORKER['charts'], portfolio_advice, output_file,
+                                 title=title, categories=categories)
+    return name, output_file, time.time() - start
+
+def run_batch(data_file, watchlist_file, sheet_name=None, report_type='md', output_dir=None, workers=None):
+    """
+    为多个自选清单批量生成报告
+
+    数据只加载和分析一次；全市场图表和组合建议只生成一次，
+    打分后的全市场表放入共享内存，渲染进程按代码索引切出各自选子集并行渲染
+
+    返回:
+    [(名称, 输出文件, 耗时秒数), ...]
+    """
+    output_dir = output_dir or WATCHLIST_CONFIG['output_dir']
+    workers = workers or WATCHLIST_CONFIG['workers']
+    watchlists = load_watchlists(watchlist_file)
+    start = time.time()
+
+    df = add_derived_columns(load_etf_sources(data_file, sheet_name))
+    analysis_results = analyze_etf_data(df)
+    shared = {
+        'market_overview': analysis_results['market_overview'],
+        'type_perf': analysis_results['type_perf'],
+        'rollup': analysis_results['rollup'],
+        'quantiles': analysis_results['quantiles'],
+        'charts': {name: chart for name in WATCHLIST_CONFIG['shared_charts']
+                   if (chart := render_chart(name, df, analysis_results))},
+        'portfolio_advice': generate_portfolio_advice(df)
+    }
+    logger.info(f"全市场分析完成，耗时: {time.time() - start:.2f}秒，开始渲染 {len(watchlists)} 份自选报告")
+
+    code_index = CodeIndex(df['代码'].astype(str))
+    # 文件名用数据本身的交易日，晚间或次日重跑旧文件不会标成运行当天
+    trade_date = datetime.strptime(snapshot_date(df), HISTORY_CONFIG['date_format']).strftime('%Y%m%d')
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    for item in watchlists:
+        positions, missing = code_index.positions(item['codes'])
+        if missing:
+            logger.warning(f"自选清单 {item['name']} 中有 {len(missing)} 个代码不在数据中: {', '.join(missing[:10])}")
+        fmt = item.get('format', report_type)
+        safe_name = re.sub(r'[\\/:*?"<>|\s]+', '_', item['name'])
+        tasks.append((item['name'], positions, item.get('categories') or list(PORTFOLIO_CATEGORIES), fmt,
+                      os.path.join(output_dir, f"{safe_name}_{trade_date}.{fmt}")))
+
+    render_start = time.time()
+    ensure_resource_tracker()
+    with SharedTable.from_frame(df) as table, ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(get_log_queue(), table.descriptor, shared)) as pool:
+        results = list(pool.map(render_watchlist, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    logger.info(f"自选报告生成完成: {len(results)} 份，渲染耗时 {time.time() - render_start:.2f}秒，"
+                f"总耗时 {time.time() - start:.2f}秒，目录: {output_dir}")
+    return results
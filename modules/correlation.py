@@ -0,0 +1,184 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+from configs.portfolio_config import DIVERSIFICATION_CONFIG
+from .history import default_store, snapshot_date
+from utils.logging_config import logger
+
+# 进程内的相关矩阵缓存：(历史目录, 窗口) -> CorrelationCache，常驻服务跨快照复用
+_CACHES = {}
+
+class PairwiseStats:
+    """
+    逐对有效样本的相关系数累加量
+
+    对每对ETF累计双方都有数据的天数、各自的和与平方和以及乘积和。
+    这些量对交易日可加，窗口滚动时加上新的一天、减去移出的一天即可（秩1更新），
+    不必重新读取整个窗口
+    """
+
+    def __init__(self, n):
+        self.count = np.zeros((n, n))
+        self.sum_x = np.zeros((n, n))  # [i, j]: i与j都有数据的日子里i的收益之和
+        self.sum_xx = np.zeros((n, n))
+        self.sum_xy = np.zeros((n, n))
+
+    def add(self, rows, sign=1):
+        """计入(sign=1)或移出(sign=-1)若干天的收益，rows为 (天数 × ETF数) 数组"""
+        valid = np.isfinite(rows).astype('float64')
+        x = np.where(valid > 0, rows, 0.0)
+        self.count += sign * (valid.T @ valid)
+        self.sum_x += sign * (x.T @ valid)
+        self.sum_xx += sign * ((x * x).T @ valid)
+        self.sum_xy += sign * (x.T @ x)
+
+    def correlation(self, min_periods, block_size):
+        """按行分块计算相关矩阵，控制临时数组的大小；有效配对天数不足时为NaN"""
+        n = len(self.count)
+        corr = np.empty((n, n), dtype='float32')
+        for start in range(0, n, block_size):
+            rows = slice(start, min(start + block_size, n))
+            count = self.count[rows]
+            sum_x, sum_y = self.sum_x[rows], self.sum_x.T[rows]
+            cov = count * self.sum_xy[rows] - sum_x * sum_y
+            var_x = count * self.sum_xx[rows] - sum_x ** 2
+            var_y = count * self.sum_xx.T[rows] - sum_y ** 2
+            with np.errstate(invalid='ignore', divide='ignore'):
+                block = cov / np.sqrt(var_x * var_y)
+            block[(count < min_periods) | ~np.isfinite(block)] = np.nan
+            corr[rows] = np.clip(block, -1, 1)
+        return corr
+
+class CorrelationCache:
+    """
+    基于历史快照的日收益相关矩阵
+
+    只在历史中增加了新交易日时刷新：ETF集合不变时对滚动窗口做秩1加减，
+    集合变化时整窗重建。结果同时写入 history/correlation/，同一天再次运行直接读取
+    """
+
+    def __init__(self, store=None, window=None, column='涨跌幅'):
+        self.store = store or default_store()
+        self.window = window or DIVERSIFICATION_CONFIG['window']
+        self.column = column
+        self.codes = None
+        self.dates = []
+        self.stats = None
+        self.corr = None
+
+    def _cache_file(self):
+        return os.path.join(self.store.history_dir, 'correlation', f"{self.column}_w{self.window}.npz")
+
+    def _load_file(self, codes, dates):
+        """读取同一窗口、同一ETF集合的已保存结果"""
+        path = self._cache_file()
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as saved:
+                if list(saved['dates']) != dates or not np.array_equal(saved['codes'], codes.to_numpy(dtype=str)):
+                    return False
+                self.corr = saved['corr']
+        except Exception as e:
+            logger.warning(f"读取相关矩阵缓存失败: {str(e)}")
+            return False
+        self.codes, self.dates, self.stats = codes, dates, None
+        logger.info(f"命中相关矩阵缓存: {path}")
+        return True
+
+    def _save_file(self):
+        try:
+            os.makedirs(os.path.dirname(self._cache_file()), exist_ok=True)
+            np.savez(self._cache_file(), codes=self.codes.to_numpy(dtype=str), dates=np.array(self.dates), corr=self.corr)
+        except Exception as e:
+            logger.warning(f"写入相关矩阵缓存失败: {str(e)}")
+
+    def window_dates(self, current):
+        """截至当前快照日期的最近window个历史交易日"""
+        end = snapshot_date(current)
+        return [date for date in self.store.dates() if date <= end][-self.window:]
+
+    def matrix(self, current):
+        """
+        当前ETF集合在最近window个交易日上的相关矩阵
+
+        参数:
+        current: 当前快照（决定ETF集合和截止日期）
+
+        返回:
+        (代码索引, float32相关矩阵, 窗口内交易日列表)
+        """
+        codes = pd.Index(current['代码'])
+        dates = self.window_dates(current)
+        same_codes = self.codes is not None and self.codes.equals(codes)
+        if same_codes and dates == self.dates:
+            return self.codes, self.corr, self.dates
+        if self._load_file(codes, dates):
+            return self.codes, self.corr, self.dates
+
+        dropped = [date for date in self.dates if date not in dates]
+        added = [date for date in dates if date not in self.dates]
+        if same_codes and self.stats is not None and self.dates[len(dropped):] == dates[:len(dates) - len(added)]:
+            if dropped:
+                self.stats.add(self.store.rows(dropped, codes, self.column), -1)
+            if added:
+                self.stats.add(self.store.rows(added, codes, self.column), 1)
+            logger.info(f"相关矩阵滚动更新: 新增 {len(added)} 天，移出 {len(dropped)} 天")
+        else:
+            self.stats = PairwiseStats(len(codes))
+            self.stats.add(self.store.rows(dates, codes, self.column), 1)
+            logger.info(f"相关矩阵重建: {len(codes)} 只ETF，{len(dates)} 个交易日")
+
+        self.codes, self.dates = codes, dates
+        self.corr = self.stats.correlation(DIVERSIFICATION_CONFIG['min_periods'], DIVERSIFICATION_CONFIG['block_size'])
+        self._save_file()
+        return self.codes, self.corr, self.dates
+
+def get_correlation_cache(store=None, window=None):
+    """按历史目录和窗口复用相关矩阵缓存"""
+    store = store or default_store()
+    window = window or DIVERSIFICATION_CONFIG['window']
+    key = (os.path.abspath(store.history_dir), window)
+    if key not in _CACHES:
+        _CACHES[key] = CorrelationCache(store, window)
+    return _CACHES[key]
+
+def correlation_clusters(df, store=None, n_clusters=None):
+    """
+    按日收益相关性对ETF做层次聚类
+
+    参数:
+    df: 当前快照
+    store: 历史快照存储
+    n_clusters: 聚类数量，默认DIVERSIFICATION_CONFIG['n_clusters']
+
+    返回:
+    与df同索引的簇编号Series（历史样本不足的ETF为NaN）；可聚类的ETF不足时返回None
+    """
+    config = DIVERSIFICATION_CONFIG
+    n_clusters = n_clusters or config['n_clusters']
+    cache = get_correlation_cache(store)
+    available = len(cache.window_dates(df))
+    if available < config['min_periods']:
+        logger.info(f"历史交易日不足（{available}/{config['min_periods']}），无法按相关性聚类")
+        return None
+    codes, corr, _ = cache.matrix(df)
+
+    # 只对窗口内有效样本充足的ETF聚类（对角线为与自身的有效天数判定结果）
+    eligible = np.flatnonzero(np.isfinite(np.diagonal(corr)))
+    if len(eligible) < n_clusters:
+        return None
+
+    sub = corr[np.ix_(eligible, eligible)].astype('float64')
+    # 有效重叠不足的配对视为不相关
+    sub = np.where(np.isfinite(sub), sub, 0.0)
+    distance = np.sqrt(np.clip(0.5 * (1 - sub), 0, None))
+    np.fill_diagonal(distance, 0)
+    tree = linkage(squareform(distance, checks=False), method=config['linkage'])
+    labels = np.full(len(codes), np.nan)
+    labels[eligible] = fcluster(tree, t=n_clusters, criterion='maxclust')
+
+    logger.info(f"相关性聚类完成: {len(eligible)} 只ETF分为 {int(np.nanmax(labels))} 类")
+    return pd.Series(labels[codes.get_indexer(df['代码'])], index=df.index)
@@ -1,8 +1,18 @@
+import fnmatch
+import glob
+import hashlib
+import os
+import re
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import chardet
 import logging
 # 修复导入路径
+from configs.data_config import DATA_CONFIG, DATA_SOURCES, HISTORY_CONFIG
+from utils.cache_io import write_cache
 from utils.logging_config import logger
 
 def detect_encoding(file_path):
@@ -16,44 +26,247 @@ def detect_encoding(file_path):
         logger.error(f"文件编码检测失败: {str(e)}")
         return 'gbk'  # 默认使用gbk编码
 
-def load_etf_data(file_path='data/ETF行情数据.csv'):
-    """加载并预处理ETF数据"""
+def is_excel_file(file_path):
+    """根据扩展名判断是否为Excel工作簿"""
+    return os.path.splitext(file_path)[1].lower() in DATA_CONFIG['excel_extensions']
+
+# 缓存键的十六进制位数
+_FINGERPRINT_LENGTH = 16
+
+def _file_fingerprint(file_path):
+    """由文件内容哈希和修改时间组成的缓存键"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    digest.update(str(os.stat(file_path).st_mtime_ns).encode())
+    return digest.hexdigest()[:_FINGERPRINT_LENGTH]
+
+def read_excel_cached(file_path, sheet_name=0, dtype=None):
+    """
+    读取Excel工作簿，首次读取时转换为列式缓存
+    
+    参数:
+    file_path: Excel文件路径
+    sheet_name: 工作表名称或序号
+    dtype: 传给read_excel的列类型（默认代码列按文本读取）
+    
+    返回:
+    原始数据DataFrame；同一工作簿再次读取时直接加载缓存，开销与CSV相当
+    """
+    cache_dir = DATA_CONFIG['cache_dir']
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    sheet_key = re.sub(r'[^\w-]', '_', str(sheet_name))
+    prefix = os.path.join(cache_dir, f"{stem}_{sheet_key}_")
+    cache_base = prefix + _file_fingerprint(file_path)
+    
+    for cache_file in (cache_base + '.parquet', cache_base + '.pkl'):
+        if os.path.exists(cache_file):
+            logger.info(f"命中Excel缓存: {cache_file}")
+            if cache_file.endswith('.parquet'):
+                return pd.read_parquet(cache_file)
+            return pd.read_pickle(cache_file)
+    
+    logger.info(f"首次读取Excel文件: {file_path} (工作表: {sheet_name})，转换为缓存")
+    df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=dtype or {'代码': str})
+    
     try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 清理同一工作表的旧缓存：前缀之后必须正好是缓存键和扩展名，
+        # 否则会误删名称以该前缀开头的其他工作簿的缓存（如etf与etf_2）
+        pattern = glob.escape(prefix) + '[0-9a-f]' * _FINGERPRINT_LENGTH
+        for stale in glob.glob(pattern + '.parquet') + glob.glob(pattern + '.pkl'):
+            os.remove(stale)
+        cache_file = write_cache(df, cache_base)
+        logger.info(f"已写入Excel缓存: {cache_file}")
+    except Exception as e:
+        logger.warning(f"写入Excel缓存失败: {str(e)}")
+    
+    return df
+
+# 文件名中的日期，如 ETF行情_20250606.csv、etf-2025-06-06.xlsx
+_FILENAME_DATE = re.compile(r'(?<!\d)(20\d{2})[-_.]?(\d{2})[-_.]?(\d{2})(?!\d)')
+
+def source_date(file_path, df):
+    """
+    数据文件所属的交易日
+
+    依次取数据中的日期列（DATA_CONFIG['date_columns']，取最大日期）、文件名中的日期和文件修改时间，
+    晚间或周末重跑旧文件时仍记为数据本身的日期，不会按运行当天覆盖历史
+
+    返回:
+    (日期字符串, 来源说明)
+    """
+    date_format = HISTORY_CONFIG['date_format']
+    for col in DATA_CONFIG['date_columns']:
+        if col in df.columns:
+            dates = pd.to_datetime(df[col].astype(str), errors='coerce', format='mixed').dropna()
+            if len(dates):
+                return dates.max().strftime(date_format), f"数据列 {col}"
+    for match in _FILENAME_DATE.finditer(os.path.basename(file_path)):
+        try:
+            return datetime(*map(int, match.groups())).strftime(date_format), '文件名'
+        except ValueError:
+            continue
+    return datetime.fromtimestamp(os.path.getmtime(file_path)).strftime(date_format), '文件修改时间'
+
+def match_source(file_path):
+    """按文件名匹配数据源配置"""
+    name = os.path.basename(file_path)
+    for source in DATA_SOURCES:
+        if fnmatch.fnmatch(name, source['pattern']):
+            return source
+    return {'name': '默认', 'column_map': {}, 'defaults': {}, 'code_suffix': None}
+
+def read_source(file_path, sheet_name=None):
+    """读取单个数据文件，并按数据源配置统一列名、补齐缺失列和代码后缀"""
+    source = match_source(file_path)
+    column_map = source['column_map']
+    # 代码列按文本读取，保留前导零
+    dtype = {col: str for col in ['代码'] + [src for src, dst in column_map.items() if dst == '代码']}
+    
+    if is_excel_file(file_path):
+        if sheet_name is None:
+            sheet_name = DATA_CONFIG['default_sheet']
+        df = read_excel_cached(file_path, sheet_name, dtype)
+    else:
         encoding = detect_encoding(file_path)
         logger.info(f"使用编码: {encoding} 加载文件: {file_path}")
-        df = pd.read_csv(file_path, encoding=encoding)
-        
-        # 验证必要列
-        required_cols = ['代码', '名称', '涨跌幅', '5日涨跌幅', '成交额', '换手率', '溢折率', '规模变化', '年初至今']
-        missing = [col for col in required_cols if col not in df.columns]
-        if missing:
-            logger.warning(f"数据文件缺少列: {', '.join(missing)}")
-        
-        # 预处理
-        df = df.dropna(subset=['名称'])
-        numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-        df[numeric_cols] = df[numeric_cols].fillna(0)
-        
-        # 异常值处理
-        for col in numeric_cols:
-            q1 = df[col].quantile(0.25)
-            q3 = df[col].quantile(0.75)
-            iqr = q3 - q1
-            lower_bound = q1 - 1.5 * iqr
-            upper_bound = q3 + 1.5 * iqr
-            median = df[col].median()
-            df[col] = np.where(
-                (df[col] < lower_bound) | (df[col] > upper_bound),
-                median,
-                df[col]
-            )
-        
-        # 计算动量得分
-        df['动量得分'] = 0.3 * df['涨跌幅'] + 0.7 * df['5日涨跌幅']
-        
+        df = pd.read_csv(file_path, encoding=encoding, dtype=dtype)
+    
+    if column_map:
+        df = df.rename(columns=column_map)
+    for col, value in source['defaults'].items():
+        if col not in df.columns:
+            df[col] = value
+    if source['code_suffix'] and '代码' in df.columns:
+        codes = df['代码'].astype(str).str.strip()
+        df['代码'] = codes.where(codes.str.contains('.', regex=False),
+                                 codes.str.zfill(6) + source['code_suffix'])
+    # 历史快照、归档和导出都按该日期存放
+    date, origin = source_date(file_path, df)
+    df.attrs['trade_date'] = date
+    logger.info(f"数据日期: {date}（取自{origin}）")
+    return df
+
+def clean_etf_data(df):
+    """验证必要列并完成缺失值填充、异常值处理和动量得分计算"""
+    # 验证必要列
+    required_cols = ['代码', '名称', '涨跌幅', '5日涨跌幅', '成交额', '换手率', '溢折率', '规模变化', '年初至今']
+    missing = [col for col in required_cols if col not in df.columns]
+    if missing:
+        logger.warning(f"数据文件缺少列: {', '.join(missing)}")
+    
+    # 预处理
+    df = df.dropna(subset=['名称'])
+    # 同一代码只保留第一次出现的行，下游按代码对齐历史和持仓时要求代码唯一
+    if '代码' in df.columns:
+        duplicated = df['代码'].duplicated()
+        if duplicated.any():
+            logger.warning(f"数据中有重复代码 {int(duplicated.sum())} 条，保留第一次出现的行")
+            df = df[~duplicated]
+    numeric_cols = list(df.select_dtypes(include=['float64', 'int64']).columns)
+    
+    # 缺失值填充与异常值处理：对整个数值列块一次性计算，避免逐列生成中间数组
+    block = df[numeric_cols].to_numpy(dtype='float64', na_value=0.0)
+    if len(block):
+        q1, median, q3 = np.quantile(block, [0.25, 0.5, 0.75], axis=0)
+        iqr = q3 - q1
+        outliers = (block < q1 - 1.5 * iqr) | (block > q3 + 1.5 * iqr)
+        np.copyto(block, np.broadcast_to(median, block.shape), where=outliers)
+    df[numeric_cols] = block
+    # 记录清洗后的数值列，供下游阶段直接复用该数值块
+    df.attrs['numeric_cols'] = numeric_cols
+    
+    # 计算动量得分
+    df['动量得分'] = 0.3 * df['涨跌幅'] + 0.7 * df['5日涨跌幅']
+    return df
+
+def load_etf_data(file_path='data/ETF行情数据.csv', sheet_name=None):
+    """加载并预处理ETF数据（支持CSV和Excel，Excel可通过sheet_name指定工作表）"""
+    try:
+        df = clean_etf_data(read_source(file_path, sheet_name))
         logger.info(f"成功加载数据，共 {len(df)} 条记录")
         return df
     
     except Exception as e:
         logger.error(f"数据加载失败: {str(e)}", exc_info=True)
         raise
+
+def _read_source_timed(file_path, sheet_name):
+    """读取单个数据源并去掉无名称的行，返回(数据, 耗时)"""
+    start = time.time()
+    df = read_source(file_path, sheet_name)
+    if '名称' in df.columns:
+        df = df.dropna(subset=['名称'])
+    return df, time.time() - start
+
+def merge_sources(frames):
+    """
+    合并多个数据源
+    
+    按输入顺序拼接，同一代码以先出现的数据源为准；
+    在任一数据源中为数值类型的列统一转为数值，避免拼接后退化为文本列
+    """
+    numeric_cols = {col for df in frames for col in df.select_dtypes(include='number').columns}
+    merged = pd.concat(frames, ignore_index=True, sort=False)
+    for col in numeric_cols:
+        if merged[col].dtype.kind not in 'biuf':
+            merged[col] = pd.to_numeric(merged[col], errors='coerce')
+    
+    duplicated = merged['代码'].duplicated()
+    if duplicated.any():
+        logger.info(f"合并数据源时去除重复代码 {int(duplicated.sum())} 条")
+        merged = merged[~duplicated].reset_index(drop=True)
+    return merged
+
+def read_etf_sources(file_paths, sheet_name=None):
+    """
+    读取多个数据文件（如按交易所或供应商拆分的行情）并合并去重，不做缺失值填充和异常值处理
+    
+    参数:
+    file_paths: 数据文件路径或路径列表，代码重复时以靠前的文件为准
+    sheet_name: Excel工作表名称或序号，对所有Excel文件生效
+    
+    返回:
+    合并后的原始数据（历史快照保存这份原始数值）。各文件在线程池中读取：磁盘读取和Parquet缓存加载可以重叠，
+    但CSV/Excel解析和编码检测持有GIL，冷读时总耗时接近各文件之和，并非取决于最慢的文件。
+    （流水线本身运行在守护进程中，不能再创建子进程并行解析。）
+    """
+    if isinstance(file_paths, str):
+        file_paths = [file_paths]
+    if len(file_paths) == 1:
+        try:
+            return read_source(file_paths[0], sheet_name)
+        except Exception as e:
+            logger.error(f"数据加载失败: {str(e)}", exc_info=True)
+            raise
+    
+    try:
+        start = time.time()
+        workers = min(len(file_paths), DATA_CONFIG['max_load_workers'])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(lambda path: _read_source_timed(path, sheet_name), file_paths))
+        
+        for path, (df, elapsed) in zip(file_paths, loaded):
+            logger.info(f"数据源 {path} [{match_source(path)['name']}]: {len(df)} 条，耗时: {elapsed:.2f}秒")
+        
+        merged = merge_sources([df for df, _ in loaded])
+        # 各数据源日期不同时取最新的一个
+        merged.attrs['trade_date'] = max(df.attrs['trade_date'] for df, _ in loaded)
+        logger.info(f"成功合并 {len(file_paths)} 个数据源，共 {len(merged)} 条记录，耗时: {time.time() - start:.2f}秒")
+        return merged
+    
+    except Exception as e:
+        logger.error(f"多数据源加载失败: {str(e)}", exc_info=True)
+        raise
+
+def load_etf_sources(file_paths, sheet_name=None):
+    """
+    加载一个或多个数据文件，合并去重后统一预处理（参数同read_etf_sources）
+    
+    异常值处理在合并后按全体数据的分布进行，与单文件加载的结果口径一致
+    """
+    df = clean_etf_data(read_etf_sources(file_paths, sheet_name))
+    logger.info(f"成功加载数据，共 {len(df)} 条记录")
+    return df
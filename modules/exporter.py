@@ -0,0 +1,213 @@
+import json
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from configs.analysis_config import SCANNER_CONFIG
+from configs.data_config import EXPORT_CONFIG
+from .analyzer import RANKING_COLUMNS
+from .history import snapshot_date
+from utils.logging_config import logger
+
+# 清单格式版本，字段类型规则变化时递增
+MANIFEST_VERSION = 2
+
+# 各列的导出类型（按列名，所有表一致）。未声明的列：布尔为bool，文本为string，其余（含全为空的列）为float64
+COLUMN_TYPES = {
+    **{col: 'string' for col in ['代码', '名称', '类型', '管理公司', '跟踪指数代码', '跟踪指数名称', '上市地',
+                                 '组合', '分组', '筛选', '条件', '因子', '组', '风险等级']},
+    **{col: 'int64' for col in ['名次', '数量', '命中数', '有效数', '上涨', '下跌', '平盘', '总数量', '基准排名',
+                                '排名下界', '中位排名', '排名上界', '反转周期数', '历史天数']},
+    **{col: 'bool' for col in ['反转信号', '多周期反转']}
+}
+
+# 全市场表的列：标准数据列、清洗和派生列，以及有历史快照时才有的多周期扫描列（没有历史的日期填空值）
+UNIVERSE_COLUMNS = (['代码', '类型', '名称', '现价', '涨跌', '涨跌幅', '溢折率', '成交额', '换手率', '5日涨跌幅',
+                     '年初至今', '基金份额', '估算规模', '规模变化', '管理公司', '年初至今份额变动', '年初至今份额变动率',
+                     'IOPV', '跟踪指数代码', '跟踪指数名称', '市盈率', '市净率', '上市地', '动量得分', '综合得分', '反转信号']
+                    + [f"动量{horizon}日" for horizon in SCANNER_CONFIG['horizons']]
+                    + ['多周期动量', '反转周期数', '反转前跌幅', '多周期反转'])
+
+PORTFOLIO_COLUMNS = ['组合', '分组', '名次', '代码', '名称', '现价', '涨跌幅', '综合得分']
+
+# 固定布局的表：声明的列总是导出（当日缺少的列填空值），当日多出的列排在后面
+TABLE_COLUMNS = {
+    'universe': UNIVERSE_COLUMNS,
+    **{name: columns + ['名次'] for name, columns in RANKING_COLUMNS.items()},
+    'score_stability': ['代码', '名称', '综合得分', '基准排名', '入选概率', '排名下界', '中位排名', '排名上界', '名次'],
+    'screen_summary': ['筛选', '条件', '命中数'],
+    'type_perf': ['类型', '平均涨跌幅', '数量'],
+    'market_overview': ['上涨', '下跌', '平盘', '平均涨跌幅', '总数量'],
+    'portfolio': PORTFOLIO_COLUMNS,
+    'portfolio_metrics': ['组合', '预期收益率', '年化收益', '年化波动率', '夏普比率', '最大回撤', '集中度', '有效持仓数',
+                          '流动性覆盖', '清仓天数', '历史天数', '风险等级']
+}
+
+def _column_type(name, values):
+    """列的导出类型：优先按COLUMN_TYPES声明，不随当日数据的dtype变化"""
+    if name in COLUMN_TYPES:
+        return COLUMN_TYPES[name]
+    if values is not None and pd.api.types.is_bool_dtype(values):
+        return 'bool'
+    if values is None or pd.api.types.is_numeric_dtype(values) or values.isna().all():
+        return 'float64'
+    return 'string'
+
+def _arrow_array(values, type_name, length):
+    """按声明类型转换一列，缺失值为null；当日缺少的列为全null"""
+    import pyarrow as pa
+    arrow_type = {'string': pa.string(), 'int64': pa.int64(), 'bool': pa.bool_(), 'float64': pa.float64()}[type_name]
+    if values is None:
+        return pa.nulls(length, type=arrow_type)
+    if type_name == 'string':
+        return pa.array(values.astype('string'), type=arrow_type, from_pandas=True)
+    if not pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        values = pd.to_numeric(values, errors='coerce')
+    if type_name == 'float64':
+        return pa.array(values.to_numpy(dtype='float64', na_value=np.nan), type=arrow_type, from_pandas=True)
+    # 整数和布尔列可能含NA（可空Int64、缺历史的行），用掩码标记为null
+    mask = values.isna().to_numpy()
+    if type_name == 'int64':
+        data = values.to_numpy(dtype='float64', na_value=0).astype('int64')
+    else:
+        data = values.to_numpy(dtype=bool, na_value=False)
+    return pa.array(data, mask=mask if mask.any() else None, type=arrow_type)
+
+def _arrow_table(frame, name=None):
+    """
+    按声明的schema转换为Arrow表，保证同一张表各天的schema一致
+
+    TABLE_COLUMNS中声明了列的表按声明顺序输出全部列，当日缺少的填null；各列类型按COLUMN_TYPES，
+    与当日是否为空、是否全为NA、是否为可空整数无关
+    """
+    import pyarrow as pa
+    declared = TABLE_COLUMNS.get(name, [])
+    columns = declared + [str(col) for col in frame.columns if str(col) not in declared]
+    arrays, fields = [], []
+    for col in columns:
+        values = frame[col] if col in frame.columns else None
+        array = _arrow_array(values, _column_type(col, values), len(frame))
+        arrays.append(array)
+        fields.append(pa.field(col, array.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+def export_tables(df, analysis_results, portfolio_advice):
+    """
+    整理需要导出的表：{表名: DataFrame}
+
+    universe为带综合得分的全市场数据；analysis_results中的每个榜单各为一张表（嵌套字典用“.”连接表名，
+    如day_over_day.rank_gainers），增加名次列；组合选择合并为portfolio表，每行带组合、分组和名次
+    """
+    tables = {'universe': df}
+
+    def collect(prefix, value):
+        if isinstance(value, pd.DataFrame):
+            table = value.reset_index() if prefix == 'type_perf' else value.reset_index(drop=True)
+            tables[prefix] = table.assign(名次=np.arange(1, len(table) + 1)) if '代码' in table.columns else table
+        elif isinstance(value, dict) and prefix == 'market_overview':
+            tables[prefix] = pd.DataFrame([value])
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                collect(f"{prefix}.{key}", item)
+
+    for key, value in analysis_results.items():
+        collect(key, value)
+
+    picks = []
+    for key, value in portfolio_advice.items():
+        groups = value.items() if isinstance(value, dict) else [(None, value)]
+        for group, table in groups:
+            if isinstance(table, pd.DataFrame) and '代码' in table.columns and not table.empty:
+                columns = [col for col in ('代码', '名称', '现价', '涨跌幅', '综合得分') if col in table.columns]
+                picks.append(table[columns].reset_index(drop=True).assign(
+                    组合=key, 分组=group, 名次=np.arange(1, len(table) + 1)))
+    if picks:
+        tables['portfolio'] = pd.concat(picks, ignore_index=True).reindex(columns=PORTFOLIO_COLUMNS)
+    if isinstance(portfolio_advice.get('metrics'), pd.DataFrame) and not portfolio_advice['metrics'].empty:
+        tables['portfolio_metrics'] = portfolio_advice['metrics']
+    return tables
+
+class ResultExporter:
+    """
+    按日期分区导出分析结果
+
+    每种格式、每张表一个目录，每个交易日一个hive风格分区（<格式>/<表名>/date=YYYY-MM-DD/part.<格式>），
+    可直接作为pyarrow.dataset的分区数据集追加读取。Arrow IPC文件不压缩，消费方内存映射后零拷贝读取。
+    manifest.json记录每张表的schema和各分区的文件与行数
+    """
+
+    def __init__(self, export_dir=None, formats=None):
+        self.export_dir = export_dir or EXPORT_CONFIG['export_dir']
+        self.formats = formats or EXPORT_CONFIG['formats']
+        self.manifest_path = os.path.join(self.export_dir, 'manifest.json')
+
+    def load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        return {'version': MANIFEST_VERSION, 'tables': {}}
+
+    def _save_manifest(self, manifest):
+        # 先写临时文件再替换，消费方不会读到写了一半的清单
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def _write_partition(self, name, table, date):
+        """写入一张表某日的分区，返回 {格式: 相对路径}"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        files = {}
+        for fmt in self.formats:
+            files[fmt] = f"{fmt}/{name}/date={date}/part.{fmt}"
+            path = os.path.join(self.export_dir, *files[fmt].split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if fmt == 'arrow':
+                with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            elif fmt == 'parquet':
+                pq.write_table(table, path)
+        return files
+
+    def export(self, df, analysis_results, portfolio_advice, date=None):
+        """
+        导出一个交易日的结果（同一日期重复导出时覆盖该分区）
+
+        返回:
+        更新后的清单
+        """
+        date = date or snapshot_date(df)
+        start = time.time()
+        manifest = self.load_manifest()
+        for name, frame in export_tables(df, analysis_results, portfolio_advice).items():
+            table = _arrow_table(frame, name)
+            schema = [{'name': field.name, 'type': str(field.type)} for field in table.schema]
+            entry = manifest['tables'].setdefault(name, {'schema': schema, 'partitions': {}})
+            if entry['schema'] != schema:
+                logger.warning(f"导出表 {name} 的schema发生变化，清单记录为最新schema")
+                entry['schema'] = schema
+            entry['partitions'][date] = {'rows': table.num_rows, 'files': self._write_partition(name, table, date)}
+        manifest['version'] = MANIFEST_VERSION
+        manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        self._save_manifest(manifest)
+        logger.info(f"已导出 {date} 的分析结果: {len(manifest['tables'])} 张表，"
+                    f"耗时: {time.time() - start:.2f}秒，目录: {self.export_dir}")
+        return manifest
+
+def export_results(df, analysis_results, portfolio_advice, export_dir=None):
+    """导出一次运行的结果；缺少pyarrow时记录错误并跳过"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        logger.error("导出Arrow/Parquet需要安装pyarrow")
+        return None
+    return ResultExporter(export_dir).export(df, analysis_results, portfolio_advice)
+
+def read_table(name, date, export_dir=None):
+    """以内存映射方式读取某日导出的Arrow表（零拷贝）"""
+    import pyarrow as pa
+    path = os.path.join(export_dir or EXPORT_CONFIG['export_dir'], 'arrow', name, f"date={date}", 'part.arrow')
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
@@ -0,0 +1,124 @@
+import glob
+import hashlib
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from configs.analysis_config import FACTOR_CONFIG
+from .history import default_store, snapshot_date
+from utils.cache_io import write_cache
+from utils.logging_config import logger
+
+# 因子注册表：名称 -> {'func': 计算函数, 'columns': 所需列, 'description': 说明}
+# 计算函数接收 {列名: (日期数 × ETF数) 数组}，返回每只ETF一个值的数组；
+# 窗口内全为NaN产生的除零/空切片告警由compute_factors统一屏蔽
+FACTORS = {}
+
+# 同一进程内的因子结果缓存：(日期, 窗口, 输入摘要) -> DataFrame
+_FACTOR_CACHE = {}
+
+def register_factor(name, columns, description):
+    """注册历史因子，注册后即可按名称加入ANALYSIS_WEIGHTS"""
+    def decorator(func):
+        FACTORS[name] = {'func': func, 'columns': columns, 'description': description}
+        return func
+    return decorator
+
+def _valid_count(values):
+    return np.isfinite(values).sum(axis=0)
+
+@register_factor('波动率', ['涨跌幅'], '日涨跌幅的滚动标准差')
+def realized_volatility(panel):
+    return np.nanstd(panel['涨跌幅'], axis=0, ddof=1)
+
+@register_factor('下行波动率', ['涨跌幅'], '只计下跌日的滚动下行偏差')
+def downside_deviation(panel):
+    returns = panel['涨跌幅']
+    downside = np.where(np.isnan(returns), np.nan, np.minimum(returns, 0))
+    return np.sqrt(np.nanmean(downside ** 2, axis=0))
+
+@register_factor('非流动性', ['涨跌幅', '成交额'], 'Amihud非流动性：|涨跌幅|/成交额（每亿元）的滚动均值')
+def amihud_illiquidity(panel):
+    turnover = panel['成交额']
+    ratio = np.abs(panel['涨跌幅']) / np.where(turnover > 0, turnover, np.nan) * 1e8
+    return np.nanmean(ratio, axis=0)
+
+@register_factor('资金流持续性', ['规模变化'], '窗口内规模净流入天数与净流出天数之差占有效天数的比例')
+def flow_persistence(panel):
+    flows = panel['规模变化']
+    return np.nansum(np.sign(flows), axis=0) / _valid_count(flows)
+
+@register_factor('溢折率偏离', ['溢折率'], '当日溢折率相对窗口均值的标准化偏离，负值表示折价高于常态')
+def premium_reversion(panel):
+    premium = panel['溢折率']
+    deviation = (premium[-1] - np.nanmean(premium, axis=0)) / np.nanstd(premium, axis=0, ddof=1)
+    return np.where(np.isfinite(deviation), deviation, np.nan)
+
+def _input_digest(df, columns, dates):
+    """当日输入列和所用历史日期的摘要，快照内容变化时缓存失效"""
+    digest = hashlib.sha1(','.join(dates).encode())
+    present = [col for col in ['代码'] + columns if col in df.columns]
+    digest.update(pd.util.hash_pandas_object(df[present], index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+def compute_factors(df, names, store=None, window=None):
+    """
+    计算历史因子
+
+    参数:
+    df: 当前快照
+    names: 因子名称列表（须已注册）
+    store: 历史快照存储，默认使用HISTORY_CONFIG中的目录
+    window: 滚动窗口长度，默认FACTOR_CONFIG['window']
+
+    返回:
+    与df同索引的因子DataFrame。所有ETF在同一个 (日期 × ETF) 数组上一次算出，
+    结果按日期缓存在内存和 history/factors/ 下，同一天重复计算直接读取缓存
+    """
+    unknown = [name for name in names if name not in FACTORS]
+    if unknown:
+        raise KeyError(f"未注册的因子: {', '.join(unknown)}")
+
+    store = store or default_store()
+    window = window or FACTOR_CONFIG['window']
+    date = snapshot_date(df)
+    columns = sorted({col for name in names for col in FACTORS[name]['columns']})
+    dates = [day for day in store.dates() if day < date][-(window - 1):]
+    key = (date, window, _input_digest(df, columns, dates))
+
+    cache_dir = os.path.join(store.history_dir, 'factors')
+    cache_file = os.path.join(cache_dir, f"{date}_w{window}_{key[2]}")
+    cached = _FACTOR_CACHE.get(key)
+    if cached is None:
+        for path in (cache_file + '.parquet', cache_file + '.pkl'):
+            if os.path.exists(path):
+                cached = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_pickle(path)
+                break
+    if cached is not None and all(name in cached.columns for name in names):
+        _FACTOR_CACHE[key] = cached
+        return pd.DataFrame({name: cached[name].to_numpy() for name in names}, index=df.index)
+
+    dates, panel = store.panel(df, columns, window)
+    # 同一面板上顺带算出所需列已就绪的其他因子，一并缓存
+    factors = {}
+    for name, factor in FACTORS.items():
+        if not set(factor['columns']) <= set(columns):
+            continue
+        valid = np.isfinite(np.stack([panel[col] for col in factor['columns']])).all(axis=0).sum(axis=0)
+        with warnings.catch_warnings(), np.errstate(all='ignore'):
+            warnings.simplefilter('ignore', RuntimeWarning)
+            values = np.asarray(factor['func'](panel), dtype='float64')
+        factors[name] = np.where(valid >= FACTOR_CONFIG['min_periods'], values, np.nan)
+    result = pd.DataFrame(factors)
+    logger.info(f"历史因子计算完成: {date}，窗口 {len(dates)} 天，因子: {', '.join(result.columns)}")
+
+    _FACTOR_CACHE[key] = result
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(glob.escape(cache_dir), f"{date}_w{window}_*")):
+            os.remove(stale)
+        write_cache(result, cache_file)
+    except Exception as e:
+        logger.warning(f"写入因子缓存失败: {str(e)}")
+
+    return pd.DataFrame({name: result[name].to_numpy() for name in names}, index=df.index)
@@ -0,0 +1,142 @@
+import glob
+import os
+import re
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from configs.data_config import HISTORY_CONFIG
+from utils.cache_io import write_cache
+from utils.logging_config import logger
+
+def snapshot_date(df):
+    """
+    快照所属日期：加载数据时按文件确定的trade_date（见data_loader.source_date）
+
+    没有记录时（如直接构造的DataFrame）退回运行当天并记录警告，日期同时写入df.attrs，同一份数据只警告一次
+    """
+    date = df.attrs.get('trade_date')
+    if not date:
+        date = datetime.now().strftime(HISTORY_CONFIG['date_format'])
+        logger.warning(f"数据没有记录交易日，按运行当天 {date} 处理")
+        df.attrs['trade_date'] = date
+    return date
+
+# 默认目录的共享实例，同一进程内各阶段复用已读取的快照
+_default_store = None
+
+def default_store():
+    """返回HISTORY_CONFIG目录对应的共享HistoryStore"""
+    global _default_store
+    if _default_store is None:
+        _default_store = HistoryStore()
+    return _default_store
+
+class HistoryStore:
+    """
+    按日期保存的ETF快照历史
+
+    每个交易日一个列式文件（data/history/YYYY-MM-DD.parquet，缺少pyarrow时为pickle），
+    同一日期重复保存时覆盖。读取过的快照在内存中缓存，按列对齐成 (日期 × ETF) 的数组面板，
+    供历史因子做整块的滚动窗口计算。
+    """
+
+    def __init__(self, history_dir=None):
+        self.history_dir = history_dir or HISTORY_CONFIG['history_dir']
+        self._frames = {}
+
+    def _path(self, date):
+        """日期对应的快照文件（不存在时返回None）"""
+        for ext in ('.parquet', '.pkl'):
+            path = os.path.join(self.history_dir, date + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def dates(self):
+        """已保存的日期（升序）"""
+        if not os.path.isdir(self.history_dir):
+            return []
+        names = {os.path.splitext(name)[0] for name in os.listdir(self.history_dir)}
+        return sorted(name for name in names if re.fullmatch(r'\d{4}-\d{2}-\d{2}', name))
+
+    def save(self, df, date=None):
+        """
+        保存当日快照
+
+        参数:
+        df: ETF原始数据（未经缺失值填充和异常值处理，见data_loader.read_etf_sources）
+        date: 日期字符串，默认取snapshot_date(df)
+
+        返回:
+        快照文件路径；同时在df.attrs中记录trade_date
+        """
+        date = date or snapshot_date(df)
+        os.makedirs(self.history_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(glob.escape(self.history_dir), glob.escape(date) + '.*')):
+            os.remove(stale)
+        path = write_cache(df, os.path.join(self.history_dir, date))
+        df.attrs['trade_date'] = date
+        self._frames[(date, None)] = df
+        logger.info(f"已保存历史快照 {date}: {len(df)} 条")
+        return path
+
+    def load(self, date, columns=None):
+        """读取某日快照；指定columns时Parquet只读取其中存在的列"""
+        key = (date, None if columns is None else tuple(columns))
+        if key not in self._frames and (date, None) in self._frames:
+            frame = self._frames[(date, None)]
+            self._frames[key] = frame if columns is None else frame[[col for col in columns if col in frame.columns]]
+        if key not in self._frames:
+            path = self._path(date)
+            if path is None:
+                raise FileNotFoundError(f"没有 {date} 的历史快照")
+            if path.endswith('.parquet'):
+                if columns is not None:
+                    # Parquet文件由pyarrow写入，读取列名只需解析文件尾部的schema
+                    import pyarrow.parquet as pq
+                    available = set(pq.read_schema(path).names)
+                    columns = [col for col in columns if col in available]
+                frame = pd.read_parquet(path, columns=columns)
+            else:
+                frame = pd.read_pickle(path)
+                if columns is not None:
+                    frame = frame[[col for col in columns if col in frame.columns]]
+            self._frames[key] = frame
+        return self._frames[key]
+
+    def panel(self, current, columns, window):
+        """
+        以当前快照为最后一天，构建最近window个交易日的数组面板
+
+        参数:
+        current: 当前快照（决定ETF集合和顺序，日期由snapshot_date确定）；
+                 本进程已保存当日原始快照时，当日数值取自该快照而非清洗后的current
+        columns: 需要的列
+        window: 窗口长度（含当日）
+
+        返回:
+        (日期列表, {列名: (日期数 × ETF数) 的float64数组})；某日缺少的ETF或列为NaN
+        """
+        end = snapshot_date(current)
+        dates = [date for date in self.dates() if date < end][-(window - 1):] if window > 1 else []
+        frames = [self.load(date, ['代码'] + list(columns)) for date in dates] + [self._frames.get((end, None), current)]
+        dates = dates + [end]
+
+        return dates, align_frames(frames, pd.Index(current['代码']), columns)
+
+    def rows(self, dates, codes, column):
+        """指定日期的某一列按codes对齐为 (日期数 × ETF数) 数组"""
+        frames = [self.load(date, ['代码', column]) for date in dates]
+        return align_frames(frames, codes, [column])[column]
+
+def align_frames(frames, codes, columns):
+    """把多个快照的数值列按代码对齐，返回 {列名: (快照数 × ETF数) 的float64数组}，缺失为NaN"""
+    arrays = {col: np.full((len(frames), len(codes)), np.nan) for col in columns}
+    for t, frame in enumerate(frames):
+        positions = codes.get_indexer(frame['代码'])
+        found = positions >= 0
+        for col in columns:
+            if col in frame.columns:
+                values = pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                arrays[col][t, positions[found]] = values[found]
+    return arrays
@@ -0,0 +1,304 @@
+import numpy as np
+import pandas as pd
+from configs.analysis_config import ANALYSIS_WEIGHTS, REVERSAL_THRESHOLD, DISCOUNT_THRESHOLD
+from .analyzer import RANKING_COLUMNS
+from .factors import FACTORS, compute_factors
+from utils.logging_config import logger
+
+# 单列排名：(排序列, 是否升序)
+RANKING_KEYS = {
+    'top_gainers': ('涨跌幅', False),
+    'top_losers': ('涨跌幅', True),
+    'top_volume': ('成交额', False),
+    'top_turnover': ('换手率', False),
+    'top_inflow': ('规模变化', False),
+    'discount_etfs': ('溢折率', True)
+}
+
+TEXT_COLUMNS = ['代码', '名称', '类型']
+
+# 增量维护的排名表（依赖历史的多周期扫描表仍按日全量计算）
+INCREMENTAL_TABLES = list(RANKING_KEYS) + ['reversal_etfs', 'top_score']
+
+def diff_snapshot(code_index, old_values, snapshot, columns):
+    """
+    按代码比较新快照与已有数据
+
+    参数:
+    code_index: 已有数据的代码索引（pd.Index，位置即行槽位）
+    old_values: 已有数据 (槽位数 × 列数) 的数值数组
+    snapshot: 新快照DataFrame
+    columns: 参与比较的数值列
+
+    返回:
+    (changed_slots, changed_rows, new_rows)：发生变化的已有槽位、它们在快照中的行号、新增代码在快照中的行号
+    """
+    positions = code_index.get_indexer(snapshot['代码'])
+    known = positions >= 0
+    known_rows = np.flatnonzero(known)
+    slots = positions[known]
+
+    new_values = snapshot[columns].to_numpy(dtype='float64')[known_rows]
+    old = old_values[slots]
+    # 两边都是NaN视为未变化
+    changed = ((new_values != old) & ~(np.isnan(new_values) & np.isnan(old))).any(axis=1)
+    return slots[changed], known_rows[changed], np.flatnonzero(~known)
+
+class SortedIndex:
+    """按某一列维护的有序索引，增量更新时只删除和插入变化的槽位"""
+
+    def __init__(self, values, ascending=True):
+        self.sign = 1.0 if ascending else -1.0
+        keys = self.sign * values
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.slots = order
+
+    def update(self, slots, values):
+        """用新值替换指定槽位（NaN排在末尾，相当于移出排名）"""
+        # 用槽位标记表代替np.isin，避免对整个索引排序
+        marked = np.zeros(len(self.slots) + len(slots), dtype=bool)
+        marked[slots] = True
+        keep = ~marked[self.slots]
+        keys, kept_slots = self.keys[keep], self.slots[keep]
+
+        new_keys = self.sign * values
+        order = np.argsort(new_keys, kind='stable')
+        new_keys, slots = new_keys[order], slots[order]
+
+        positions = np.searchsorted(keys, new_keys, side='right')
+        self.keys = np.insert(keys, positions, new_keys)
+        self.slots = np.insert(kept_slots, positions, slots)
+
+    def head(self, n, below=None):
+        """排名前n的槽位；below给定时只取原始值小于该阈值的前缀（仅用于升序索引）"""
+        stop = n if below is None else min(n, np.searchsorted(self.keys, below, side='left'))
+        valid = ~np.isnan(self.keys[:stop])
+        return self.slots[:stop][valid]
+
+class IncrementalAnalyzer:
+    """
+    日内增量分析引擎
+
+    以首个快照初始化，之后每次update只处理按代码比较后发生变化的行：
+    单列排名由有序索引维护，市场概况、类型统计和综合得分所需的因子均值/方差由累加量维护。
+    综合得分依赖全市场均值和标准差，任一行变化都会影响全部得分，因此得分由一次矩阵乘法重算，
+    不再经过pandas标准化流程。
+    """
+
+    def __init__(self, df):
+        self.factors = list(ANALYSIS_WEIGHTS.keys())
+        self.weights = np.array(list(ANALYSIS_WEIGHTS.values()))
+        # 历史因子在初始化时按当日历史计算一次，日内更新沿用各代码的初始值
+        self.historical = [name for name in self.factors if name not in df.columns and name in FACTORS]
+        display = [col for name in INCREMENTAL_TABLES for col in RANKING_COLUMNS[name]]
+        self.numeric_columns = list(dict.fromkeys(
+            [col for col in display if col not in TEXT_COLUMNS and col != '综合得分'] + self.factors))
+        self._factor_pos = [self.numeric_columns.index(f) for f in self.factors]
+        self._reset(df)
+
+    def _reset(self, df):
+        """由完整快照重建全部状态"""
+        df = df.drop_duplicates(subset=['代码'], keep='last')
+        if self.historical:
+            df = df.assign(**compute_factors(df, self.historical))
+        self.code_index = pd.Index(df['代码'])
+        self.values = np.array(df[self.numeric_columns].to_numpy(dtype='float64'))
+        self.text = {col: df[col].to_numpy(dtype=object) if col in df.columns else np.full(len(df), None, dtype=object)
+                     for col in TEXT_COLUMNS}
+        self.active = np.ones(len(df), dtype=bool)
+
+        self.indexes = {}
+        for name, (column, ascending) in RANKING_KEYS.items():
+            self.indexes[name] = SortedIndex(self._column(column), ascending)
+
+        self.factor_sum = np.zeros(len(self.factors))
+        self.factor_sumsq = np.zeros(len(self.factors))
+        self.factor_count = np.zeros(len(self.factors))
+        self.market = {'上涨': 0, '下跌': 0, '平盘': 0, '有效数量': 0, '涨跌幅合计': 0.0}
+        self.type_stats = {}
+        self.reversal = ((self._column('5日涨跌幅') < REVERSAL_THRESHOLD['5日跌幅'])
+                         & (self._column('涨跌幅') > REVERSAL_THRESHOLD['今日涨幅']))
+        self._accumulate(np.arange(len(df)), 1)
+        self._scores = None
+        self.version = 0
+
+    def _column(self, column, slots=None):
+        values = self.values[:, self.numeric_columns.index(column)]
+        return values if slots is None else values[slots]
+
+    def _accumulate(self, slots, sign):
+        """将指定槽位的当前值计入(sign=1)或移出(sign=-1)累加统计"""
+        slots = slots[self.active[slots]]
+        if len(slots) == 0:
+            return
+
+        block = self.values[np.ix_(slots, self._factor_pos)]
+        finite = np.isfinite(block)
+        block = np.where(finite, block, 0.0)
+        self.factor_sum += sign * block.sum(axis=0)
+        self.factor_sumsq += sign * (block ** 2).sum(axis=0)
+        self.factor_count += sign * finite.sum(axis=0)
+
+        change = self._column('涨跌幅', slots)
+        valid = ~np.isnan(change)
+        self.market['上涨'] += sign * int((change > 0).sum())
+        self.market['下跌'] += sign * int((change < 0).sum())
+        self.market['平盘'] += sign * int((change == 0).sum())
+        self.market['有效数量'] += sign * int(valid.sum())
+        self.market['涨跌幅合计'] += sign * float(change[valid].sum())
+
+        codes, types = pd.factorize(self.text['类型'][slots][valid])
+        known = codes >= 0
+        sums = np.bincount(codes[known], weights=change[valid][known], minlength=len(types))
+        counts = np.bincount(codes[known], minlength=len(types))
+        for etf_type, total, count in zip(types, sums, counts):
+            stats = self.type_stats.setdefault(etf_type, [0.0, 0])
+            stats[0] += sign * total
+            stats[1] += sign * int(count)
+
+    def _with_historical(self, snapshot):
+        """为快照补上各代码初始化时的历史因子值（新代码为NaN）"""
+        positions = self.code_index.get_indexer(snapshot['代码'])
+        known = positions >= 0
+        overlays = {}
+        for name in self.historical:
+            if name not in snapshot.columns:
+                values = np.full(len(snapshot), np.nan)
+                values[known] = self._column(name, positions[known])
+                overlays[name] = values
+        return snapshot.assign(**overlays) if overlays else snapshot
+
+    def update(self, snapshot, partial=False):
+        """
+        应用新的快照
+
+        参数:
+        snapshot: 新快照DataFrame（经load_etf_data相同方式预处理，代码唯一）
+        partial: 为True时快照只包含变化的行，缺失的代码保持不变；否则缺失的代码视为退出
+
+        返回:
+        本次实际变化的行数
+        """
+        if self.historical:
+            snapshot = self._with_historical(snapshot)
+        changed_slots, changed_rows, new_rows = diff_snapshot(
+            self.code_index, self.values, snapshot, self.numeric_columns)
+
+        removed = np.array([], dtype=np.intp)
+        if not partial:
+            present = np.zeros(len(self.active), dtype=bool)
+            positions = self.code_index.get_indexer(snapshot['代码'])
+            present[positions[positions >= 0]] = True
+            removed = np.flatnonzero(self.active & ~present)
+
+        # 新代码追加到末尾的空槽位
+        if len(new_rows):
+            start = len(self.active)
+            self.code_index = self.code_index.append(pd.Index(snapshot['代码'].to_numpy()[new_rows]))
+            self.values = np.vstack([self.values, np.full((len(new_rows), len(self.numeric_columns)), np.nan)])
+            for col in TEXT_COLUMNS:
+                self.text[col] = np.concatenate([self.text[col], np.full(len(new_rows), None, dtype=object)])
+            self.active = np.concatenate([self.active, np.zeros(len(new_rows), dtype=bool)])
+            self.reversal = np.concatenate([self.reversal, np.zeros(len(new_rows), dtype=bool)])
+            changed_slots = np.concatenate([changed_slots, np.arange(start, start + len(new_rows))])
+            changed_rows = np.concatenate([changed_rows, new_rows])
+
+        slots = np.concatenate([changed_slots, removed])
+        if len(slots) == 0:
+            return 0
+
+        self._accumulate(slots, -1)
+
+        rows = snapshot.iloc[changed_rows]
+        self.values[changed_slots] = rows[self.numeric_columns].to_numpy(dtype='float64')
+        for col in TEXT_COLUMNS:
+            if col in rows.columns:
+                self.text[col][changed_slots] = rows[col].to_numpy(dtype=object)
+        self.active[changed_slots] = True
+        self.values[removed] = np.nan
+        self.active[removed] = False
+
+        self._accumulate(slots, 1)
+
+        for name, (column, _) in RANKING_KEYS.items():
+            self.indexes[name].update(slots, self._column(column, slots))
+        self.reversal[slots] = self.active[slots] & (
+            (self._column('5日涨跌幅', slots) < REVERSAL_THRESHOLD['5日跌幅'])
+            & (self._column('涨跌幅', slots) > REVERSAL_THRESHOLD['今日涨幅']))
+
+        self._scores = None
+        self.version += 1
+        logger.info(f"增量更新完成: 变化 {len(changed_slots)} 行，退出 {len(removed)} 行")
+        return len(slots)
+
+    def scores(self):
+        """由累加的均值和标准差计算全部槽位的综合得分（非活跃槽位为NaN）"""
+        if self._scores is None:
+            count = np.maximum(self.factor_count, 1)
+            mean = self.factor_sum / count
+            std = np.sqrt(np.maximum(self.factor_sumsq / count - mean ** 2, 0))
+            # 得分 = Σ w·(x-μ)/σ，展开为一次矩阵向量乘法；标准差为0的因子不参与
+            scale = np.divide(self.weights, std, out=np.zeros_like(std), where=std > 0)
+            factor_block = self.values[:, self._factor_pos]
+            scores = factor_block @ scale - mean @ scale
+            # 含缺失/无穷值的行按标准化后记0的规则单独计算
+            invalid = ~np.isfinite(scores)
+            if invalid.any():
+                with np.errstate(invalid='ignore'):
+                    z_scores = (factor_block[invalid] - mean) * scale
+                scores[invalid] = np.nan_to_num(z_scores, nan=0, posinf=0, neginf=0).sum(axis=1)
+            self._scores = np.where(self.active, scores, np.nan)
+        return self._scores
+
+    def _table(self, slots, name):
+        """按槽位取出排名表"""
+        columns = RANKING_COLUMNS[name]
+        data = {}
+        for col in columns:
+            if col in TEXT_COLUMNS:
+                data[col] = self.text[col][slots]
+            elif col == '综合得分':
+                data[col] = self.scores()[slots]
+            else:
+                data[col] = self._column(col, slots)
+        return pd.DataFrame(data, columns=columns)
+
+    def results(self, n=10):
+        """返回与analyze_etf_data结构一致的分析结果"""
+        results = {}
+        for name in RANKING_KEYS:
+            below = DISCOUNT_THRESHOLD if name == 'discount_etfs' else None
+            results[name] = self._table(self.indexes[name].head(n, below), name)
+
+        reversal = np.flatnonzero(self.reversal)
+        reversal = reversal[np.argsort(self._column('5日涨跌幅', reversal), kind='stable')[:n]]
+        results['reversal_etfs'] = self._table(reversal, 'reversal_etfs')
+
+        scores = np.where(np.isnan(self.scores()), -np.inf, self.scores())
+        top = np.argpartition(-scores, min(n, len(scores) - 1))[:n] if len(scores) > n else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        results['top_score'] = self._table(top[np.isfinite(scores[top])], 'top_score')
+
+        type_perf = pd.DataFrame(
+            [(etf_type, total / count, count) for etf_type, (total, count) in self.type_stats.items() if count > 0],
+            columns=['类型', '平均涨跌幅', '数量']).set_index('类型').sort_index()
+        results['type_perf'] = type_perf
+
+        valid = self.market['有效数量']
+        results['market_overview'] = {
+            '上涨': self.market['上涨'],
+            '下跌': self.market['下跌'],
+            '平盘': self.market['平盘'],
+            '平均涨跌幅': self.market['涨跌幅合计'] / valid if valid else np.nan,
+            '总数量': int(self.active.sum())
+        }
+        return results
+
+    def frame(self):
+        """当前全部活跃ETF的DataFrame（含综合得分），供图表和组合构建使用"""
+        data = {col: self.text[col][self.active] for col in TEXT_COLUMNS}
+        for i, col in enumerate(self.numeric_columns):
+            data[col] = self.values[self.active, i]
+        data['综合得分'] = self.scores()[self.active]
+        return pd.DataFrame(data)
@@ -0,0 +1,143 @@
+import warnings
+import numpy as np
+import pandas as pd
+from configs.portfolio_config import PORTFOLIO_WEIGHTS, PORTFOLIO_ANALYTICS_CONFIG
+from configs.report_config import REPORT_CONFIG
+from .history import default_store
+from utils.logging_config import logger
+
+def holding_weights(name, n):
+    """
+    组合内各持仓的权重
+
+    PORTFOLIO_WEIGHTS按名次给出权重：持仓少于配置时取前n个并归一化，
+    多于配置或未配置时等权
+    """
+    configured = PORTFOLIO_WEIGHTS.get(name)
+    if configured is None or len(configured) < n or n == 0:
+        return np.full(n, 1.0 / max(n, 1))
+    weights = np.asarray(configured[:n], dtype='float64')
+    return weights / weights.sum()
+
+def holdings_matrix(portfolios):
+    """
+    把多个组合堆叠为一个持仓矩阵
+
+    参数:
+    portfolios: {组合名: 持仓DataFrame，或 {分组: DataFrame}（如分散组合）}
+
+    返回:
+    (组合名列表, 持仓代码Index, (组合数 × 持仓代码数) 的权重矩阵)；空组合不计入
+    """
+    names, holdings = [], []
+    for name, value in portfolios.items():
+        if isinstance(value, dict):
+            frames = [frame for frame in value.values() if isinstance(frame, pd.DataFrame) and not frame.empty]
+            value = pd.concat(frames) if frames else None
+        if isinstance(value, pd.DataFrame) and not value.empty and '代码' in value.columns:
+            names.append(name)
+            holdings.append(value['代码'].to_numpy())
+
+    codes = pd.Index(np.concatenate(holdings)).unique() if holdings else pd.Index([])
+    weights = np.zeros((len(names), len(codes)))
+    for row, (name, held) in enumerate(zip(names, holdings)):
+        np.add.at(weights[row], codes.get_indexer(held), holding_weights(name, len(held)))
+    return names, codes, weights
+
+def _risk_level(volatility, expected_return):
+    """按年化波动率划分风险等级；没有历史波动率时按预期收益粗略划分"""
+    if np.isfinite(volatility):
+        for upper, level in PORTFOLIO_ANALYTICS_CONFIG['risk_levels']:
+            if volatility < upper:
+                return level
+        return '高'
+    if expected_return > 0.2:
+        return '高'
+    return '低' if expected_return < 0.05 else '中等'
+
+def portfolio_metrics(df, portfolios, store=None):
+    """
+    批量计算组合的收益风险指标
+
+    所有组合先堆叠为 (组合数 × 持仓数) 的权重矩阵，再与 (交易日 × 持仓数) 的历史收益矩阵相乘，
+    一次得到全部组合的日收益序列，组合数量增加几乎不增加开销
+
+    参数:
+    df: 当日数据（提供历史面板的ETF集合、年初至今等当日字段）
+    portfolios: {组合名: 持仓DataFrame 或 {分组: DataFrame}}
+    store: 历史快照存储
+
+    返回:
+    以组合名为索引的DataFrame：预期收益率、年化收益、年化波动率、夏普比率、最大回撤、
+    集中度(HHI)、有效持仓数、流动性覆盖、清仓天数、历史天数、风险等级
+    """
+    config = PORTFOLIO_ANALYTICS_CONFIG
+    names, codes, weights = holdings_matrix(portfolios)
+    if not names:
+        return pd.DataFrame()
+
+    # 代码重复时取首次出现的行（get_indexer要求索引唯一）
+    index = pd.Index(df['代码'])
+    first = np.flatnonzero(~index.duplicated())
+    positions = index[first].get_indexer(codes)
+    positions = np.where(positions >= 0, first[np.maximum(positions, 0)], -1)
+    if (positions < 0).any():
+        raise ValueError(f"持仓代码不在当日数据中: {', '.join(codes[positions < 0][:5])}")
+
+    # 当日字段给出的预期收益代理：年初至今，缺失时用5日涨跌幅
+    proxy = pd.Series(np.nan, index=df.index)
+    for col in ('年初至今', '5日涨跌幅'):
+        if col in df.columns:
+            proxy = proxy.fillna(pd.to_numeric(df[col], errors='coerce'))
+    proxy = proxy.fillna(0).to_numpy(dtype='float64')[positions]
+
+    store = store or default_store()
+    _, panel = store.panel(df, ['涨跌幅', '成交额'], config['window'])
+    returns = panel['涨跌幅'][:, positions]
+    turnover = panel['成交额'][:, positions]
+
+    # 组合日收益：缺失收益的持仓当日不计入，其余持仓按权重重新归一
+    valid = np.isfinite(returns)
+    covered = valid.astype('float64') @ weights.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily = np.where(covered > 0, np.where(valid, returns, 0.0) @ weights.T / covered, np.nan)
+    days = np.isfinite(daily).sum(axis=0)
+
+    with warnings.catch_warnings(), np.errstate(all='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        annual_return = np.nanmean(daily, axis=0) * config['trading_days']
+        volatility = np.nanstd(daily, axis=0, ddof=1) * np.sqrt(config['trading_days'])
+        sharpe = (annual_return - REPORT_CONFIG['risk_free_rate']) / volatility
+        wealth = np.cumprod(1 + np.nan_to_num(daily), axis=0)
+        drawdown = (wealth / np.maximum.accumulate(wealth, axis=0) - 1).min(axis=0)
+        average_turnover = np.nanmean(turnover, axis=0)
+
+    enough = days >= config['min_periods']
+    annual_return, volatility, sharpe, drawdown = (np.where(enough, values, np.nan)
+                                                   for values in (annual_return, volatility, sharpe, drawdown))
+
+    # 流动性：按名义规模计算每个持仓需要的清仓天数，1天内可清仓的权重占比为覆盖率
+    capacity = config['participation'] * np.where(average_turnover > 0, average_turnover, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        liquidation_days = weights * config['nominal_capital'] / capacity
+    held = weights > 0
+    coverage = (weights * (held & (liquidation_days <= 1))).sum(axis=1)
+    liquidation_days = np.where(held, liquidation_days, 0).max(axis=1)
+
+    concentration = (weights ** 2).sum(axis=1)
+    expected_return = weights @ proxy
+    metrics = pd.DataFrame({
+        '预期收益率': expected_return,
+        '年化收益': annual_return,
+        '年化波动率': volatility,
+        '夏普比率': sharpe,
+        '最大回撤': drawdown,
+        '集中度': concentration,
+        '有效持仓数': 1 / concentration,
+        '流动性覆盖': coverage,
+        '清仓天数': liquidation_days,
+        '历史天数': days,
+        '风险等级': [_risk_level(v, r) for v, r in zip(volatility, expected_return)]
+    }, index=pd.Index(names, name='组合'))
+    logger.info(f"组合指标计算完成: {len(names)} 个组合，{len(codes)} 只持仓，{int(days.max())} 个交易日")
+    return metrics
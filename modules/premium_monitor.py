@@ -0,0 +1,207 @@
+import glob
+import json
+import os
+import socket
+import time
+import numpy as np
+import pandas as pd
+from configs.analysis_config import PREMIUM_MONITOR_CONFIG
+from .data_loader import read_source
+from .incremental import diff_snapshot
+from utils.logging_config import logger
+
+# 监控依赖的行情列
+PRICE_COLUMNS = ['现价', 'IOPV']
+
+class PremiumMonitor:
+    """
+    日内溢折率流式监控
+
+    每只ETF一个固定长度的环形缓冲区，保存每次行情变化时的价格相对IOPV偏离（现价/IOPV-1）。
+    偏离绝对值超过 max(min_deviation, sigma×该ETF此前的滚动标准差) 记为一次异常，
+    连续persistence次同向异常即标记为持续折价/溢价。
+    每次update只按代码比较出变化的行，对这些行读写缓冲区，开销与变化行数成正比
+    """
+
+    def __init__(self, config=None):
+        self.config = {**PREMIUM_MONITOR_CONFIG, **(config or {})}
+        self.code_index = pd.Index([], dtype=object)
+        self.last = np.empty((0, len(PRICE_COLUMNS)))
+        self.names = np.empty(0, dtype=object)
+        self.buffer = np.empty((0, self.config['window']))
+        self.head = np.empty(0, dtype=np.intp)
+        self.threshold = np.empty(0)
+        self.streak = np.empty(0, dtype=np.intp)
+        self.flagged = set()
+        self.version = 0
+
+    def _grow(self, codes, names):
+        """为新代码追加槽位"""
+        n = len(codes)
+        self.code_index = self.code_index.append(pd.Index(codes, dtype=object))
+        self.last = np.vstack([self.last, np.full((n, len(PRICE_COLUMNS)), np.nan)])
+        self.names = np.concatenate([self.names, names])
+        self.buffer = np.vstack([self.buffer, np.full((n, self.config['window']), np.nan)])
+        self.head = np.concatenate([self.head, np.zeros(n, dtype=np.intp)])
+        self.threshold = np.concatenate([self.threshold, np.full(n, np.nan)])
+        self.streak = np.concatenate([self.streak, np.zeros(n, dtype=np.intp)])
+
+    def update(self, snapshot):
+        """
+        接收一个日内快照（可以只包含变化的行）
+
+        参数:
+        snapshot: 至少包含代码、现价、IOPV列的DataFrame，缺失的代码视为未变化
+
+        返回:
+        本次新进入持续异常状态的ETF（DataFrame，列同flags）
+        """
+        snapshot = snapshot.drop_duplicates(subset=['代码'], keep='last')
+        prices = snapshot[PRICE_COLUMNS].apply(pd.to_numeric, errors='coerce')
+        snapshot = snapshot.assign(**prices)
+        changed_slots, changed_rows, new_rows = diff_snapshot(self.code_index, self.last, snapshot, PRICE_COLUMNS)
+
+        if len(new_rows):
+            start = len(self.code_index)
+            names = (snapshot['名称'].to_numpy(dtype=object)[new_rows] if '名称' in snapshot.columns
+                     else np.full(len(new_rows), None, dtype=object))
+            self._grow(snapshot['代码'].to_numpy(dtype=object)[new_rows], names)
+            changed_slots = np.concatenate([changed_slots, np.arange(start, start + len(new_rows))])
+            changed_rows = np.concatenate([changed_rows, new_rows])
+        if len(changed_slots) == 0:
+            return self.flags().iloc[:0]
+
+        values = snapshot[PRICE_COLUMNS].to_numpy(dtype='float64')[changed_rows]
+        self.last[changed_slots] = values
+        if '名称' in snapshot.columns:
+            self.names[changed_slots] = snapshot['名称'].to_numpy(dtype=object)[changed_rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            deviation = np.where(values[:, 1] > 0, values[:, 0] / values[:, 1] - 1, np.nan)
+
+        # 阈值取自写入本次观测之前的窗口，避免当前异常值抬高自身的标准差
+        window = self.buffer[changed_slots]
+        finite = np.isfinite(window)
+        samples = finite.sum(axis=1)
+        window = np.where(finite, window, 0.0)
+        mean = window.sum(axis=1) / np.maximum(samples, 1)
+        std = np.sqrt(np.maximum((window ** 2).sum(axis=1) / np.maximum(samples, 1) - mean ** 2, 0))
+        std = np.where(samples >= self.config['min_samples'], std, 0.0)
+        threshold = np.maximum(self.config['min_deviation'], self.config['sigma'] * std)
+        self.threshold[changed_slots] = threshold
+
+        self.buffer[changed_slots, self.head[changed_slots]] = deviation
+        self.head[changed_slots] = (self.head[changed_slots] + 1) % self.config['window']
+
+        # 同向异常累加，方向改变或回到阈值内时清零
+        direction = np.where(np.abs(deviation) >= threshold, np.sign(deviation), 0).astype(np.intp)
+        streak = self.streak[changed_slots]
+        continued = (direction != 0) & (np.sign(streak) == direction)
+        self.streak[changed_slots] = np.where(continued, streak + direction, direction)
+
+        persistent = np.abs(self.streak[changed_slots]) >= self.config['persistence']
+        entered = [slot for slot in changed_slots[persistent] if slot not in self.flagged]
+        self.flagged.difference_update(changed_slots[~persistent].tolist())
+        self.flagged.update(entered)
+        self.version += 1
+        return self._table(np.array(entered, dtype=np.intp))
+
+    def _table(self, slots):
+        """按槽位生成信号表"""
+        slots = np.asarray(slots, dtype=np.intp)
+        deviation = self.buffer[slots, (self.head[slots] - 1) % self.config['window']]
+        table = pd.DataFrame({
+            '代码': self.code_index[slots].to_numpy(dtype=object),
+            '名称': self.names[slots],
+            '现价': self.last[slots, 0],
+            'IOPV': self.last[slots, 1],
+            '偏离': deviation,
+            '阈值': self.threshold[slots],
+            '持续次数': np.abs(self.streak[slots]),
+            '方向': np.where(self.streak[slots] < 0, '折价', '溢价')
+        })
+        return table.iloc[np.argsort(-np.abs(deviation), kind='stable')].reset_index(drop=True)
+
+    def flags(self):
+        """当前处于持续折价/溢价状态的ETF，按偏离绝对值排序"""
+        return self._table(sorted(self.flagged))
+
+def iter_directory_snapshots(directory, pattern='*.csv', follow=False, poll_interval=None):
+    """
+    按文件名顺序读取目录中的日内快照
+
+    参数:
+    directory: 快照目录（文件名应能按时间排序，如 ETF_0930.csv）
+    pattern: 文件名通配符
+    follow: 为True时读完现有文件后继续轮询新文件
+    poll_interval: 轮询间隔（秒）
+
+    生成:
+    (文件路径, 快照DataFrame)
+    """
+    poll_interval = poll_interval or PREMIUM_MONITOR_CONFIG['poll_interval']
+    seen = set()
+    while True:
+        for path in sorted(glob.glob(os.path.join(glob.escape(directory), pattern))):
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                yield path, read_source(path)
+            except Exception as e:
+                logger.error(f"读取快照失败 {path}: {str(e)}")
+        if not follow:
+            return
+        time.sleep(poll_interval)
+
+def iter_socket_snapshots(host='127.0.0.1', port=8766):
+    """
+    从本地套接字接收日内快照（行情推送的本地替身）
+
+    每行一个JSON数组，数组元素为一只ETF的记录（至少包含代码、现价、IOPV），
+    可以只推送变化的行。连接断开后等待下一个连接
+
+    生成:
+    (来源描述, 快照DataFrame)
+    """
+    with socket.create_server((host, port)) as server:
+        logger.info(f"溢折率监控等待行情推送: {host}:{port}")
+        while True:
+            conn, address = server.accept()
+            with conn, conn.makefile('r', encoding='utf-8') as stream:
+                for line in stream:
+                    if not line.strip():
+                        continue
+                    try:
+                        records = json.loads(line)
+                        yield f"{address[0]}:{address[1]}", pd.DataFrame(records)
+                    except (ValueError, TypeError) as e:
+                        logger.error(f"无法解析推送的快照: {str(e)}")
+
+def run_monitor(source, follow=False):
+    """
+    运行溢折率监控，直到数据源结束或被中断
+
+    参数:
+    source: 快照目录，或 tcp://host:port 形式的本地推送地址
+    follow: 监视目录时是否持续等待新文件
+    """
+    if source.startswith('tcp://'):
+        host, port = source[len('tcp://'):].rsplit(':', 1)
+        snapshots = iter_socket_snapshots(host, int(port))
+    else:
+        snapshots = iter_directory_snapshots(source, follow=follow)
+
+    monitor = PremiumMonitor()
+    try:
+        for origin, snapshot in snapshots:
+            start = time.perf_counter()
+            entered = monitor.update(snapshot)
+            elapsed = (time.perf_counter() - start) * 1000
+            logger.info(f"溢折率监控已处理 {origin}: {len(snapshot)} 行，耗时 {elapsed:.1f}毫秒，"
+                        f"当前信号 {len(monitor.flagged)} 个")
+            for row in entered.itertuples(index=False):
+                logger.info(f"持续{row.方向}: {row.名称}({row.代码}) 偏离 {row.偏离:.2%}，"
+                            f"阈值 {row.阈值:.2%}，已连续 {row.持续次数} 次")
+    except KeyboardInterrupt:
+        logger.info("溢折率监控已停止")
+    return monitor
@@ -0,0 +1,105 @@
+import time
+import numpy as np
+import pandas as pd
+from configs.analysis_config import QUANTILE_CONFIG
+from utils.logging_config import logger
+
+def factor_columns(df):
+    """参与分组的因子列：加载时清洗过的数值列（无记录时取全部数值列）加上存在的派生列"""
+    numeric_cols = df.attrs.get('numeric_cols') or list(df.select_dtypes(include='number').columns)
+    excluded = set(QUANTILE_CONFIG['exclude']) | {QUANTILE_CONFIG['target']}
+    columns = [col for col in numeric_cols if col in df.columns and col not in excluded]
+    columns += [col for col in QUANTILE_CONFIG['extra_factors'] if col in df.columns and col not in columns]
+    return columns
+
+def assign_buckets(block, buckets):
+    """
+    按排序位置把每个因子等分为buckets组
+
+    因子块 (因子数 × 行数) 按有效值个数相同的列分批，每批一次argpartition：
+    只需把各组边界位置上的元素放到位，不必完整排序。缺失值排在最后，不分组
+
+    返回:
+    (分组编号 (因子数 × 行数) int8数组，缺失值为buckets；各组下界 (因子数 × buckets))
+    """
+    count = block.shape[1]
+    codes = np.full(block.shape, buckets, dtype=np.int8)
+    lower = np.full((len(block), buckets), np.nan)
+    valid = np.isfinite(block).sum(axis=1)
+    for n in np.unique(valid):
+        if n < buckets:
+            continue
+        rows = np.flatnonzero(valid == n)
+        bounds = [n * b // buckets for b in range(buckets + 1)]
+        # 有缺失值时把第n位也作为分区点，缺失值才会全部落在末尾
+        order = np.argpartition(block[rows], bounds[1:] if n < count else bounds[1:-1], axis=1)
+        positions = np.repeat(np.arange(buckets + 1, dtype=np.int8), np.diff(bounds + [count]))
+        codes[rows[:, None], order] = positions
+        # 分区后边界位置上的元素已就位，即第2组起各组的最小值
+        lower[rows, 1:] = np.take_along_axis(block[rows], order[:, bounds[1:-1]], axis=1)
+        lower[rows, 0] = np.nanmin(block[rows], axis=1)
+    return codes, lower
+
+def bucket_stats(codes, target_sorted, target_order, buckets):
+    """
+    一个因子各组的数量、均值和中位数
+
+    目标值事先整体排序一次；分组编号按该顺序排列后做稳定排序（小整数键），
+    各组内的目标值即已有序，均值用reduceat、中位数直接取组内中间位置
+    """
+    keys = codes[target_order]
+    counts = np.bincount(keys, minlength=buckets + 1)[:buckets]
+    # 缺失值的编号最大，排在最后，截去后各组首尾相接
+    values = target_sorted[np.argsort(keys, kind='stable')][:counts.sum()]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    means = np.full(buckets, np.nan)
+    medians = np.full(buckets, np.nan)
+    filled = counts > 0
+    means[filled] = np.add.reduceat(values, starts[filled]) / counts[filled]
+    medians[filled] = (values[starts[filled] + (counts[filled] - 1) // 2] + values[starts[filled] + counts[filled] // 2]) / 2
+    return counts, means, medians
+
+def quantile_analysis(df):
+    """
+    因子分位分析：按每个因子把全市场等分成若干组，统计各组目标收益的数量、均值和中位数
+
+    返回:
+    {'summary': 每个因子一行（因子、有效数、各组平均收益、高低差），按高低差绝对值排序,
+     'tables': {因子: 每组一行（组、下界、数量、平均收益、收益中位数）}}
+    """
+    start = time.time()
+    buckets = QUANTILE_CONFIG['buckets']
+    target = QUANTILE_CONFIG['target']
+    columns = factor_columns(df)
+    if target not in df.columns or not columns:
+        return {'summary': pd.DataFrame(), 'tables': {}}
+
+    y = df[target].to_numpy(dtype='float64', na_value=np.nan)
+    keep = np.isfinite(y)
+    y = y[keep]
+    # 因子块按 (因子数 × 行数) 存放，每个因子连续，便于逐行分区
+    block = np.empty((len(columns), len(y)))
+    for j, col in enumerate(columns):
+        block[j] = df[col].to_numpy(dtype='float64', na_value=np.nan)[keep]
+    block[~np.isfinite(block)] = np.nan
+
+    codes, lower = assign_buckets(block, buckets)
+    target_order = np.argsort(y)
+    target_sorted = y[target_order]
+
+    labels = [str(b + 1) for b in range(buckets)]
+    mean_name, median_name = f"平均{target}", f"{target}中位数"
+    summary, tables = [], {}
+    for j, col in enumerate(columns):
+        counts, means, medians = bucket_stats(codes[j], target_sorted, target_order, buckets)
+        if not counts.any():
+            continue
+        tables[col] = pd.DataFrame({'组': labels, '下界': lower[j], '数量': counts,
+                                    mean_name: means, median_name: medians})
+        summary.append({'因子': col, '有效数': int(counts.sum()), **dict(zip(labels, means)),
+                        '高低差': means[-1] - means[0]})
+    summary = pd.DataFrame(summary)
+    if not summary.empty:
+        summary = summary.reindex(summary['高低差'].abs().sort_values(ascending=False).index).reset_index(drop=True)
+    logger.info(f"因子分位分析完成: {len(tables)} 个因子，{len(y)} 行，{buckets} 组，耗时: {time.time() - start:.3f}秒")
+    return {'summary': summary, 'tables': tables}
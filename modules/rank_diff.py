@@ -0,0 +1,158 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from configs.data_config import HISTORY_CONFIG
+from configs.report_config import DIFF_CONFIG
+from .history import snapshot_date
+from utils.cache_io import write_cache
+from utils.logging_config import logger
+
+def build_ranking_index(df, analysis_results):
+    """
+    当日排名索引：每只ETF一行，记录综合得分、全市场得分排名和各跟踪榜单中的名次（未上榜为0）
+
+    参数:
+    df: 含综合得分的当日数据
+    analysis_results: analyze_etf_data的结果
+
+    返回:
+    以代码为键的DataFrame
+    """
+    codes = pd.Index(df['代码'])
+    index = pd.DataFrame({
+        '代码': df['代码'].to_numpy(),
+        '名称': df['名称'].to_numpy(),
+        '综合得分': df['综合得分'].to_numpy(dtype='float64'),
+        '得分排名': df['综合得分'].rank(ascending=False, method='min').to_numpy(dtype='float64')
+    })
+    for key in DIFF_CONFIG['tracked_lists']:
+        position = np.zeros(len(codes), dtype='int16')
+        table = analysis_results.get(key)
+        if isinstance(table, pd.DataFrame) and '代码' in table.columns:
+            slots = codes.get_indexer(table['代码'])
+            found = slots >= 0
+            position[slots[found]] = np.arange(1, len(slots) + 1)[found]
+        index[key] = position
+    return index
+
+class RankingIndex:
+    """
+    按交易日保存的排名索引（history/rankings/YYYY-MM-DD.parquet）
+
+    每天一个以代码为键的小文件，日间对比只读取当天和上一交易日这两个文件，
+    开销与保存了多少天无关
+    """
+
+    def __init__(self, history_dir=None):
+        self.index_dir = os.path.join(history_dir or HISTORY_CONFIG['history_dir'], DIFF_CONFIG['index_dir'])
+
+    def dates(self):
+        """已保存索引的日期（升序）"""
+        if not os.path.isdir(self.index_dir):
+            return []
+        names = {os.path.splitext(name)[0] for name in os.listdir(self.index_dir)}
+        return sorted(name for name in names if re.fullmatch(r'\d{4}-\d{2}-\d{2}', name))
+
+    def save(self, index, date):
+        """保存某日的排名索引（同一日期覆盖）"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        for ext in ('.parquet', '.pkl'):
+            stale = os.path.join(self.index_dir, date + ext)
+            if os.path.exists(stale):
+                os.remove(stale)
+        return write_cache(index, os.path.join(self.index_dir, date))
+
+    def load(self, date):
+        """读取某日的排名索引"""
+        for ext in ('.parquet', '.pkl'):
+            path = os.path.join(self.index_dir, date + ext)
+            if os.path.exists(path):
+                return pd.read_parquet(path) if ext == '.parquet' else pd.read_pickle(path)
+        raise FileNotFoundError(f"没有 {date} 的排名索引")
+
+    def previous(self, date):
+        """date之前最近一个交易日的日期，没有时返回None"""
+        earlier = [day for day in self.dates() if day < date]
+        return earlier[-1] if earlier else None
+
+def diff_rankings(today, previous):
+    """
+    对比两天的排名索引
+
+    参数:
+    today, previous: build_ranking_index生成的索引
+
+    返回:
+    dict，包含全市场得分变化表score_changes、排名上升/下降最多的rank_gainers/rank_losers、
+    各榜单新进与退出list_changes，以及汇总summary。全部基于一次按代码的外连接
+    """
+    lists = DIFF_CONFIG['tracked_lists']
+    top_n = DIFF_CONFIG['top_n']
+    # 跟踪榜单调整后，旧索引中缺少的榜单按未上榜处理
+    previous = previous.reindex(columns=today.columns)
+    merged = today.merge(previous, on='代码', how='outer', suffixes=('', '_昨日'), indicator=True)
+    merged['名称'] = merged['名称'].fillna(merged['名称_昨日'])
+    merged['得分变化'] = merged['综合得分'] - merged['综合得分_昨日']
+    merged['排名变化'] = merged['得分排名_昨日'] - merged['得分排名']  # 正数表示排名上升
+
+    score_changes = merged[['代码', '名称', '综合得分', '得分变化', '得分排名', '得分排名_昨日', '排名变化']].rename(
+        columns={'得分排名': '今日排名', '得分排名_昨日': '昨日排名'})
+    both = score_changes[merged['_merge'].to_numpy() == 'both']
+
+    changes = []
+    for key, title in lists.items():
+        current = merged[key].fillna(0).to_numpy()
+        before = merged[f"{key}_昨日"].fillna(0).to_numpy()
+        for label, mask, rank in (('新进', (current > 0) & (before == 0), current),
+                                  ('退出', (before > 0) & (current == 0), before)):
+            rows = np.flatnonzero(mask)
+            if len(rows):
+                changes.append(pd.DataFrame({
+                    '榜单': title,
+                    '变化': label,
+                    '代码': merged['代码'].to_numpy()[rows],
+                    '名称': merged['名称'].to_numpy()[rows],
+                    '名次': rank[rows].astype(int)
+                }).sort_values('名次'))
+    list_changes = (pd.concat(changes, ignore_index=True) if changes
+                    else pd.DataFrame(columns=['榜单', '变化', '代码', '名称', '名次']))
+
+    summary = {
+        '共同ETF': len(both),
+        '新增ETF': int((merged['_merge'] == 'left_only').sum()),
+        '减少ETF': int((merged['_merge'] == 'right_only').sum()),
+        '平均得分变化': float(both['得分变化'].mean()) if len(both) else np.nan,
+        '排名上升': int((both['排名变化'] > 0).sum()),
+        '排名下降': int((both['排名变化'] < 0).sum())
+    }
+    return {
+        'score_changes': score_changes,
+        'rank_gainers': both[both['排名变化'] > 0].nlargest(top_n, '排名变化'),
+        'rank_losers': both[both['排名变化'] < 0].nsmallest(top_n, '排名变化'),
+        'list_changes': list_changes.reset_index(drop=True),
+        'summary': summary
+    }
+
+def compare_with_previous(df, analysis_results, history_dir=None, save=True):
+    """
+    保存当日排名索引，并与上一交易日对比
+
+    返回:
+    diff_rankings的结果（附带previous_date）；没有上一交易日的索引时返回None
+    """
+    ranking_index = RankingIndex(history_dir)
+    date = snapshot_date(df)
+    today = build_ranking_index(df, analysis_results)
+    if save:
+        ranking_index.save(today, date)
+
+    previous_date = ranking_index.previous(date)
+    if previous_date is None:
+        logger.info("没有上一交易日的排名索引，跳过日间对比")
+        return None
+    diff = diff_rankings(today, ranking_index.load(previous_date))
+    diff['previous_date'] = previous_date
+    logger.info(f"日间对比完成: 对比 {previous_date}，{diff['summary']['排名上升']} 只排名上升，"
+                f"{diff['summary']['排名下降']} 只下降，榜单变动 {len(diff['list_changes'])} 条")
+    return diff
@@ -1,9 +1,14 @@
 import base64
+import json
 from datetime import datetime
 import os
+import numpy as np
 import pandas as pd
 import jinja2
-from configs.report_config import REPORT_CONFIG
+from configs.report_config import REPORT_CONFIG, UNIVERSE_TABLE_CONFIG
+from configs.portfolio_config import PORTFOLIO_CATEGORIES
+from configs.analysis_config import SCREEN_CONFIG, ROLLUP_CONFIG, STABILITY_CONFIG, QUANTILE_CONFIG, SCANNER_CONFIG
+from .visualizer import plotly_script
 import logging
 from utils.logging_config import logger
 import traceback
@@ -12,6 +17,19 @@ import traceback
 template_loader = jinja2.FileSystemLoader(searchpath='./templates')
 template_env = jinja2.Environment(loader=template_loader)
 
+# 策略组合的显示名称
+PORTFOLIO_NAMES = {
+    'growth': '成长型',
+    'value': '价值型',
+    'momentum': '动量型',
+    'balanced': '平衡型',
+    'diversified': '分散型'
+}
+
+# 自定义筛选结果表的列格式（未列出的列按数值/文本原样显示）
+PERCENT_COLUMNS = {'涨跌幅', '5日涨跌幅', '年初至今', '溢折率', '换手率', '年初至今份额变动率', '反转前跌幅'}
+CURRENCY_COLUMNS = {'成交额', '估算规模', '规模变化'}
+
 def format_percentage(value):
     """格式化百分比显示"""
     if pd.isna(value) or value is None:
@@ -32,8 +50,84 @@ def format_value(value, decimals=3):
         return f"{value:.{decimals}f}"
     return str(value)
 
-def generate_markdown_report(analysis_results, charts, portfolio_advice, file_path=None):
-    """生成Markdown格式的日报"""
+def format_column(column, value):
+    """按列名格式化自定义筛选结果中的值"""
+    if column in PERCENT_COLUMNS or column.startswith('动量'):
+        return format_percentage(value)
+    if column in CURRENCY_COLUMNS:
+        return format_currency(value)
+    return format_value(value)
+
+def universe_table_data(df):
+    """
+    全市场数据表的嵌入数据（按列存储的紧凑JSON）
+
+    数值列按显示格式保留有限小数位；取值重复较多的文本列（类型、管理公司等）存为字典加编码。
+    浏览器端只渲染可见的行，页面中不生成逐行的静态HTML
+    """
+    config = UNIVERSE_TABLE_CONFIG
+    columns, values = [], []
+    for col in [col for col in config['columns'] if col in df.columns]:
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            kind = 'percent' if col in PERCENT_COLUMNS else 'currency' if col in CURRENCY_COLUMNS else 'number'
+            array = np.round(series.to_numpy(dtype='float64', na_value=np.nan), config['decimals'][kind])
+            finite = np.isfinite(array)
+            if config['decimals'][kind]:
+                cells = array.astype(object)
+            else:
+                # 不保留小数的列存为整数，JSON中不带“.0”
+                cells = np.where(finite, array, 0).astype('int64').astype(object)
+            cells[~finite] = None
+            columns.append({'name': col, 'kind': kind})
+            values.append(cells.tolist())
+            continue
+        codes, uniques = pd.factorize(series)
+        if len(uniques) * 2 <= len(series):
+            columns.append({'name': col, 'kind': 'dict', 'dict': [str(value) for value in uniques]})
+            values.append(codes.tolist())
+        else:
+            columns.append({'name': col, 'kind': 'text'})
+            values.append(series.astype(object).where(series.notna(), None).tolist())
+    payload = {
+        'rows': len(df),
+        'columns': columns,
+        'values': values,
+        'filter_column': config['filter_column'],
+        'default_sort': config['default_sort'],
+        'row_height': config['row_height'],
+        'visible_rows': config['visible_rows']
+    }
+    # 嵌入<script>标签中，转义</避免提前结束标签
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+def screen_sections(analysis_results):
+    """报告中展开的自定义筛选：有命中的筛选按定义顺序取前report_sections个"""
+    screens = [(name, table) for name, table in analysis_results.get('screens', {}).items() if not table.empty]
+    return dict(screens[:SCREEN_CONFIG['report_sections']])
+
+def quantile_tables(analysis_results):
+    """
+    报告中展开的因子分位明细，每个因子转置为紧凑表：列为各组，行为下界、数量、平均收益和收益中位数
+
+    返回:
+    {因子: {'groups': 组标签列表, 'rows': [(行名, 各组取值列表), ...]}}
+    """
+    tables = analysis_results.get('quantiles', {}).get('tables', {})
+    return {factor: {'groups': tables[factor]['组'].tolist(),
+                     'rows': [(name, tables[factor][name].tolist()) for name in tables[factor].columns[1:]]}
+            for factor in QUANTILE_CONFIG['report_factors'] if factor in tables}
+
+def format_quantile_cell(factor, row, value):
+    """分位明细表的单元格：下界按因子列格式，数量为整数，收益按百分比"""
+    if row == '下界':
+        return format_column(factor, value)
+    if row == '数量':
+        return str(int(value))
+    return format_percentage(value)
+
+def generate_markdown_report(analysis_results, charts, portfolio_advice, file_path=None, title=None, categories=None):
+    """生成Markdown格式的日报；title为报告标题，categories为展示的组合类别（默认全部）"""
     try:
         today = datetime.now().strftime('%Y年%m月%d日')
         
@@ -42,8 +136,17 @@ def generate_markdown_report(analysis_results, charts, portfolio_advice, file_pa
         total_etfs = market.get('总数量', market.get('上涨', 0) + market.get('下跌', 0) + market.get('平盘', 0))
         
         # 创建报告内容
-        md_content = f"""# ETF市场日报 | {today}
-
+        md_content = f"""# {title or 'ETF市场日报'} | {today}
+"""
+        
+        # 时间预算不足时被舍弃的内容
+        degraded = analysis_results.get('degraded_sections', [])
+        if degraded:
+            md_content += f"""
+> ⚠️ 本期报告因时间预算不足省略了以下内容：{'、'.join(item['section'] for item in degraded)}
+"""
+        
+        md_content += f"""
 ## 一、市场概览
 
 今日市场共有{total_etfs}只ETF交易，**{market.get('上涨', 0)}**只上涨，**{market.get('下跌', 0)}**只下跌，**{market.get('平盘', 0)}**只平盘，平均涨幅**{format_percentage(market.get('平均涨跌幅', 0))}**。
@@ -57,6 +160,26 @@ def generate_markdown_report(analysis_results, charts, portfolio_advice, file_pa
         if 'type_performance' in charts and charts['type_performance']:
             md_content += f"\n\n### 各类ETF表现\n\n![不同类型ETF平均涨跌幅](data:image/png;base64,{charts['type_performance']})"
         
+        # 多维汇总：各维度资金流入最多的分组
+        rollup = analysis_results.get('rollup', {})
+        for dim in ROLLUP_CONFIG['report_dimensions']:
+            table = rollup.get(dim, pd.DataFrame())
+            if table.empty or '规模变化合计' not in table.columns:
+                continue
+            md_content += f"""
+### 按{dim}汇总 🧭
+
+资金流入最多的{ROLLUP_CONFIG['top_n']}个{dim}：
+
+| {dim} | ETF数量 | 资金流入(亿元) | 成交额(亿元) | 平均换手率 | 平均溢折率 | 加权涨跌幅 |
+|------|---------|----------------|--------------|------------|------------|------------|
+"""
+            for _, row in table.nlargest(ROLLUP_CONFIG['top_n'], '规模变化合计').iterrows():
+                md_content += f"| {row[dim]} | {row['数量']} | {format_currency(row['规模变化合计'])} | {format_currency(row.get('成交额合计'))} | {format_percentage(row.get('平均换手率'))} | {format_percentage(row.get('平均溢折率'))} | {format_percentage(row.get('加权涨跌幅'))} |\n"
+        
+        if 'rollup_heatmap' in charts and charts['rollup_heatmap']:
+            md_content += f"\n\n![资金流向热力图](data:image/png;base64,{charts['rollup_heatmap']})"
+        
         md_content += """
 ## 二、ETF龙虎榜
 
@@ -167,6 +290,35 @@ def generate_markdown_report(analysis_results, charts, portfolio_advice, file_pa
         else:
             md_content += "| - | 暂无明显反转信号ETF | - | - | - |\n"
         
+        # 有历史快照时追加多周期动量与反转扫描结果
+        momentum_scan = analysis_results.get('momentum_scan', pd.DataFrame())
+        if not momentum_scan.empty:
+            horizons = SCANNER_CONFIG['horizons']
+            md_content += f"""
+### 多周期动量 TOP10 📈
+
+基于历史快照的{'/'.join(map(str, horizons))}日累计收益加权排名：
+
+| 代码 | 名称 | 现价 | {' | '.join(f"{horizon}日动量" for horizon in horizons)} | 多周期动量 |
+|------|------|------|{'|'.join('---------' for _ in horizons)}|------------|
+"""
+            for _, row in momentum_scan.iterrows():
+                momentum = ' | '.join(format_percentage(row.get(f"动量{horizon}日")) for horizon in horizons)
+                md_content += f"| {row['代码']} | {row['名称']} | {format_value(row.get('现价', 0))} | {momentum} | {format_value(row.get('多周期动量', 0), 2)} |\n"
+        
+        reversal_scan = analysis_results.get('reversal_scan', pd.DataFrame())
+        if not reversal_scan.empty:
+            md_content += """
+### 多周期反转信号 🔄
+
+以下ETF在多个回看周期内跌幅超过阈值且今日上涨：
+
+| 代码 | 名称 | 现价 | 今日涨跌幅 | 触发周期数 | 此前最大跌幅 |
+|------|------|------|------------|------------|--------------|
+"""
+            for _, row in reversal_scan.iterrows():
+                md_content += f"| {row['代码']} | {row['名称']} | {format_value(row.get('现价', 0))} | {format_percentage(row.get('涨跌幅', 0))} | {int(row['反转周期数'])} | {format_percentage(row.get('反转前跌幅'))} |\n"
+        
         md_content += """
 ### 综合评分 TOP10 🏆
 
@@ -187,6 +339,84 @@ def generate_markdown_report(analysis_results, charts, portfolio_advice, file_pa
         if 'score_scatter' in charts and charts['score_scatter']:
             md_content += f"\n\n![ETF综合得分 vs 成交额](data:image/png;base64,{charts['score_scatter']})"
         
+        # 综合评分的排名稳定性（权重扰动下的入选概率和排名区间）
+        stability = analysis_results.get('score_stability', pd.DataFrame())
+        if not stability.empty:
+            low, high = STABILITY_CONFIG['interval']
+            md_content += f"""
+### 综合评分稳定性 🎲
+
+在配置权重附近随机抽取 {STABILITY_CONFIG['draws']} 组权重重新打分，统计各ETF进入前{STABILITY_CONFIG['top_n']}名的概率和排名区间（{low:.0%}–{high:.0%}分位）。入选概率高、区间窄的ETF排名不依赖具体权重：
+
+| 代码 | 名称 | 综合得分 | 基准排名 | 入选概率 | 中位排名 | 排名区间 |
+|------|------|----------|----------|----------|----------|----------|
+"""
+            for _, row in stability.head(STABILITY_CONFIG['report_rows']).iterrows():
+                md_content += f"| {row['代码']} | {row['名称']} | {format_value(row['综合得分'], 2)} | {int(row['基准排名'])} | {row['入选概率']:.1%} | {int(row['中位排名'])} | {int(row['排名下界'])}–{int(row['排名上界'])} |\n"
+        
+        # 与上一交易日的对比（有排名索引时）
+        day_over_day = analysis_results.get('day_over_day')
+        if day_over_day:
+            summary = day_over_day['summary']
+            md_content += f"""
+### 较上一交易日变化 🔁
+
+与 {day_over_day['previous_date']} 相比，{summary['排名上升']}只ETF综合排名上升，{summary['排名下降']}只下降，平均得分变化 {format_value(summary['平均得分变化'], 2)}；新增 {summary['新增ETF']} 只，减少 {summary['减少ETF']} 只。
+
+| 代码 | 名称 | 今日排名 | 昨日排名 | 排名变化 | 得分变化 |
+|------|------|----------|----------|----------|----------|
+"""
+            for table in (day_over_day['rank_gainers'], day_over_day['rank_losers']):
+                for _, row in table.iterrows():
+                    md_content += f"| {row['代码']} | {row['名称']} | {int(row['今日排名'])} | {int(row['昨日排名'])} | {int(row['排名变化']):+d} | {format_value(row['得分变化'], 2)} |\n"
+            
+            list_changes = day_over_day['list_changes']
+            if not list_changes.empty:
+                md_content += """
+| 榜单 | 变化 | 代码 | 名称 | 名次 |
+|------|------|------|------|------|
+"""
+                for _, row in list_changes.iterrows():
+                    md_content += f"| {row['榜单']} | {row['变化']} | {row['代码']} | {row['名称']} | {row['名次']} |\n"
+        
+        # 自定义筛选（汇总全部筛选的命中数，展开有命中的筛选）
+        screen_summary = analysis_results.get('screen_summary', pd.DataFrame())
+        if not screen_summary.empty:
+            md_content += """
+### 自定义筛选 🔎
+
+| 筛选 | 条件 | 命中数 |
+|------|------|--------|
+"""
+            for _, row in screen_summary.iterrows():
+                md_content += f"| {row['筛选']} | `` {row['条件']} `` | {row['命中数']} |\n"
+            for name, table in screen_sections(analysis_results).items():
+                md_content += f"\n#### {name}\n\n| {' | '.join(table.columns)} |\n|{'------|' * len(table.columns)}\n"
+                for row in table.itertuples(index=False):
+                    md_content += f"| {' | '.join(format_column(col, value) for col, value in zip(table.columns, row))} |\n"
+        
+        # 因子分位收益（全部因子的各组平均收益，以及展开因子的分组明细）
+        quantile_summary = analysis_results.get('quantiles', {}).get('summary', pd.DataFrame())
+        if not quantile_summary.empty:
+            groups = [col for col in quantile_summary.columns if col not in ('因子', '有效数', '高低差')]
+            target = QUANTILE_CONFIG['target']
+            md_content += f"""
+### 因子分位收益 📶
+
+按各因子把全市场等分为{len(groups)}组（1为因子值最低的一组），各组的平均{target}；高低差为最高组减最低组，按其绝对值排序：
+
+| 因子 | {' | '.join(groups)} | 高低差 |
+|------|{'------|' * len(groups)}--------|
+"""
+            for row in quantile_summary.to_dict(orient='records'):
+                md_content += f"| {row['因子']} | {' | '.join(format_percentage(row[group]) for group in groups)} | {format_percentage(row['高低差'])} |\n"
+            for factor, table in quantile_tables(analysis_results).items():
+                md_content += f"\n#### {factor}\n\n| 组 | {' | '.join(table['groups'])} |\n|------|{'------|' * len(table['groups'])}\n"
+                for name, values in table['rows']:
+                    md_content += f"| {name} | {' | '.join(format_quantile_cell(factor, name, value) for value in values)} |\n"
+            if 'quantile_returns' in charts and charts['quantile_returns']:
+                md_content += f"\n![因子分位收益](data:image/png;base64,{charts['quantile_returns']})\n"
+        
         md_content += """
 ## 四、ETF投资组合建议
 
@@ -204,7 +434,7 @@ def generate_markdown_report(analysis_results, charts, portfolio_advice, file_pa
                     '医药类': [], '大宗商品': [], '其他': []
                 }
             
-            for category in PORTFOLIO_CATEGORIES.keys():
+            for category in categories or PORTFOLIO_CATEGORIES.keys():
                 md_content += f"\n### {category}ETF\n"
                 etfs = portfolio_advice.get(category, pd.DataFrame())
                 if not etfs.empty:
@@ -212,6 +442,18 @@ def generate_markdown_report(analysis_results, charts, portfolio_advice, file_pa
                         md_content += f"- **{row['名称']}** ({row['代码']})：现价 {format_value(row.get('现价', 0))}，涨跌幅 {format_percentage(row.get('涨跌幅', 0))}，综合得分 {format_value(row.get('综合得分', 0), 2)}\n"
                 else:
                     md_content += "- 暂无推荐\n"
+            
+            # 各组合的历史风险收益指标
+            metrics = portfolio_advice.get('metrics', pd.DataFrame())
+            if not metrics.empty:
+                md_content += """
+### 组合风险收益指标 📐
+
+| 组合 | 预期收益率 | 年化收益 | 年化波动率 | 夏普比率 | 最大回撤 | 有效持仓数 | 流动性覆盖 | 风险等级 |
+|------|------------|----------|------------|----------|----------|------------|------------|----------|
+"""
+                for _, row in metrics.iterrows():
+                    md_content += f"| {PORTFOLIO_NAMES.get(row['组合'], row['组合'])} | {format_percentage(row['预期收益率'])} | {format_percentage(row['年化收益'])} | {format_percentage(row['年化波动率'])} | {format_value(row['夏普比率'], 2)} | {format_percentage(row['最大回撤'])} | {format_value(row['有效持仓数'], 1)} | {format_percentage(row['流动性覆盖'])} | {row['风险等级']} |\n"
         else:
             md_content += "\n暂无投资组合建议\n"
         
@@ -257,14 +499,21 @@ def generate_markdown_report(analysis_results, charts, portfolio_advice, file_pa
         logger.error(f"生成Markdown报告失败: {str(e)}\n{traceback.format_exc()}")
         return "报告生成失败"
 
-def generate_html_report(analysis_results, charts, portfolio_advice, output_file=None):
-    """生成HTML格式的报告"""
+def generate_html_report(analysis_results, charts, portfolio_advice, output_file=None, interactive_charts=None,
+                         title=None, categories=None, universe=None):
+    """
+    生成HTML格式的报告
+    
+    interactive_charts为generate_interactive_charts生成的交互图表片段；title为报告标题，categories为展示的组合类别；
+    universe为带综合得分的全市场数据，给定时附加可排序、筛选的全市场数据表
+    """
     try:
         today = datetime.now().strftime('%Y年%m月%d日')
         
         # 准备模板数据
         report_data = {
             'report_date': today,
+            'report_title': title or 'ETF市场日报',
             'market': analysis_results.get('market_overview', {}),
             'top_gainers': analysis_results.get('top_gainers', pd.DataFrame()).to_dict(orient='records'),
             'top_losers': analysis_results.get('top_losers', pd.DataFrame()).to_dict(orient='records'),
@@ -273,12 +522,49 @@ def generate_html_report(analysis_results, charts, portfolio_advice, output_file
             'discount_etfs': analysis_results.get('discount_etfs', pd.DataFrame()).to_dict(orient='records'),
             'reversal_etfs': analysis_results.get('reversal_etfs', pd.DataFrame()).to_dict(orient='records'),
             'top_score': analysis_results.get('top_score', pd.DataFrame()).to_dict(orient='records'),
+            'momentum_scan': analysis_results.get('momentum_scan', pd.DataFrame()).to_dict(orient='records'),
+            'momentum_horizons': SCANNER_CONFIG['horizons'],
+            'reversal_scan': analysis_results.get('reversal_scan', pd.DataFrame()).to_dict(orient='records'),
+            'score_stability': analysis_results.get('score_stability', pd.DataFrame()).head(
+                STABILITY_CONFIG['report_rows']).to_dict(orient='records'),
+            'stability_config': STABILITY_CONFIG,
+            'day_over_day': analysis_results.get('day_over_day'),
+            # 多维汇总：各报告维度资金流入最多的分组
+            'rollup_tables': {
+                dim: table.nlargest(ROLLUP_CONFIG['top_n'], '规模变化合计').to_dict(orient='records')
+                for dim in ROLLUP_CONFIG['report_dimensions']
+                if not (table := analysis_results.get('rollup', {}).get(dim, pd.DataFrame())).empty
+                and '规模变化合计' in table.columns
+            },
+            'screen_summary': analysis_results.get('screen_summary', pd.DataFrame()).to_dict(orient='records'),
+            'screens': {name: table.to_dict(orient='split', index=False)
+                        for name, table in screen_sections(analysis_results).items()},
+            'quantile_summary': analysis_results.get('quantiles', {}).get('summary', pd.DataFrame()).to_dict(orient='split', index=False),
+            'quantile_tables': quantile_tables(analysis_results),
+            'quantile_target': QUANTILE_CONFIG['target'],
             'charts': charts,
+            'interactive_charts': interactive_charts or {},
+            # plotly.js在整份报告中只引用一次，各交互图表共用
+            'plotly_script': plotly_script() if interactive_charts else '',
+            'universe_table': universe_table_data(universe) if universe is not None else '',
             'portfolio': portfolio_advice,
+            # 按行业类别整理的组合（模板逐行渲染）
+            'portfolio_categories': {
+                category: portfolio_advice[category].to_dict(orient='records')
+                for category in categories or PORTFOLIO_CATEGORIES
+                if isinstance(portfolio_advice.get(category), pd.DataFrame)
+            },
+            'portfolio_metrics': [
+                {**row, '组合': PORTFOLIO_NAMES.get(row['组合'], row['组合'])}
+                for row in portfolio_advice.get('metrics', pd.DataFrame()).to_dict(orient='records')
+            ],
+            'degraded_sections': analysis_results.get('degraded_sections', []),
             # 添加格式化函数
             'format_percentage': format_percentage,
             'format_currency': format_currency,
-            'format_value': format_value
+            'format_value': format_value,
+            'format_column': format_column,
+            'format_quantile_cell': format_quantile_cell
         }
         
         # 加载模板
@@ -0,0 +1,283 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import urlsplit
+import numpy as np
+import pandas as pd
+from configs.report_config import SERVICE_CONFIG
+from .data_loader import load_etf_sources
+from .analyzer import analyze_etf_data, add_derived_columns
+from .portfolio_builder import generate_portfolio_advice
+from .visualizer import CHART_NAMES, render_chart
+from utils.logging_config import logger, get_log_queue, init_worker_logging
+from utils.shared_table import SharedTable, attach_table, ensure_resource_tracker
+
+def build_snapshot(data_file, sheet_name=None):
+    """加载并分析一个数据快照（在执行器中运行；data_file可为多个文件）"""
+    df = add_derived_columns(load_etf_sources(data_file, sheet_name))
+    analysis_results = analyze_etf_data(df)
+    portfolio_advice = generate_portfolio_advice(df)
+    return df, analysis_results, portfolio_advice
+
+def render_chart_png(name, table_descriptor, analysis_results):
+    """在渲染进程中挂载共享内存表并生成单张图表的PNG字节"""
+    with attach_table(table_descriptor) as df:
+        chart = render_chart(name, df, analysis_results)
+    return base64.b64decode(chart) if chart else b''
+
+def file_signature(file_paths):
+    """数据文件（一个或多个）的内容哈希，作为快照版本号"""
+    if isinstance(file_paths, str):
+        file_paths = [file_paths]
+    digest = hashlib.sha1()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def to_serializable(value):
+    """将分析结果转换为可JSON序列化的结构（DataFrame转为记录列表，NaN转为None）"""
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient='records', force_ascii=False))
+    if isinstance(value, dict):
+        return {str(key): to_serializable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_serializable(item) for item in value]
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    return value
+
+def to_json_bytes(payload):
+    """序列化为UTF-8 JSON"""
+    return json.dumps(to_serializable(payload), ensure_ascii=False).encode('utf-8')
+
+class ReportService:
+    """
+    本地异步报告服务
+
+    内存中保存最新快照的数据、分析结果和组合建议，以JSON/PNG提供给看板。
+    响应按快照版本生成ETag，支持If-None-Match条件请求；数据文件变化时才重新分析，
+    分析和图表渲染都在执行器中进行，事件循环只负责收发请求。
+    """
+
+    def __init__(self, data_file, sheet_name=None, config=None):
+        self.data_file = data_file
+        self.sheet_name = sheet_name
+        self.config = {**SERVICE_CONFIG, **(config or {})}
+        self.version = None
+        self.loaded_at = None
+        self.df = None
+        self.analysis_results = {}
+        self.portfolio_advice = {}
+        self._shared_table = None
+        # 共享内存表 -> 使用它的未完成渲染任务数；换版后的旧表等这些任务结束再删除
+        self._renders = {}
+        self._responses = {}
+        self._chart_tasks = {}
+        self._reload_lock = asyncio.Lock()
+        ensure_resource_tracker()
+        self._executor = ProcessPoolExecutor(max_workers=self.config['render_workers'],
+                                             initializer=init_worker_logging, initargs=(get_log_queue(),))
+
+    async def reload_if_changed(self):
+        """数据文件内容变化时重新加载快照，返回是否发生了重新加载"""
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            try:
+                version = await loop.run_in_executor(None, file_signature, self.data_file)
+            except OSError as e:
+                logger.warning(f"读取数据文件失败: {str(e)}")
+                return False
+            if version == self.version:
+                return False
+
+            start = time.time()
+            df, analysis_results, portfolio_advice = await loop.run_in_executor(
+                self._executor, build_snapshot, self.data_file, self.sheet_name)
+            # 整体替换，正在处理的请求继续使用旧快照
+            self.df, self.analysis_results, self.portfolio_advice = df, analysis_results, portfolio_advice
+            # 渲染进程挂载同一块共享内存，不再为每张图表pickle整张数据表
+            # 已提交的旧版本渲染可能还在排队、尚未挂载，旧数据块等它们全部完成后再删除
+            previous, self._shared_table = self._shared_table, SharedTable.from_frame(df)
+            if previous is not None:
+                if previous in self._renders:
+                    logger.info(f"旧快照还有 {self._renders[previous]} 个渲染任务，完成后释放其共享内存")
+                else:
+                    previous.unlink()
+            self.version = version
+            self.loaded_at = datetime.now().isoformat(timespec='seconds')
+            self._responses = {}
+            self._chart_tasks = {}
+            logger.info(f"报告服务已加载快照 {version}，共 {len(df)} 条，耗时: {time.time() - start:.2f}秒")
+            return True
+
+    async def watch(self):
+        """定期检查数据文件是否更新"""
+        while True:
+            await asyncio.sleep(self.config['poll_interval'])
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                logger.error(f"重新加载快照失败: {str(e)}")
+
+    def _release(self, table):
+        """一个渲染任务结束；已被替换的表在最后一个任务结束时删除"""
+        self._renders[table] -= 1
+        if self._renders[table] == 0:
+            del self._renders[table]
+            if table is not self._shared_table:
+                table.unlink()
+
+    def _chart_done(self, key, table, task):
+        """渲染任务结束：释放共享表；失败或被取消的任务不缓存，下次请求重新渲染"""
+        self._release(table)
+        if (task.cancelled() or task.exception() is not None) and self._chart_tasks.get(key) is task:
+            del self._chart_tasks[key]
+
+    async def _chart(self, name):
+        """获取图表PNG；同一版本的同一图表只渲染一次，并发请求共享同一个渲染任务"""
+        key = (self.version, name)
+        if key not in self._chart_tasks:
+            loop = asyncio.get_running_loop()
+            table = self._shared_table
+            self._renders[table] = self._renders.get(table, 0) + 1
+            task = loop.run_in_executor(self._executor, render_chart_png, name, table.descriptor,
+                                        self.analysis_results)
+            task.add_done_callback(lambda done: self._chart_done(key, table, done))
+            self._chart_tasks[key] = task
+        return await self._chart_tasks[key]
+
+    async def resolve(self, path):
+        """
+        按路径生成响应内容
+
+        返回:
+        (状态码, Content-Type, 响应体)
+        """
+        if self.df is None:
+            return HTTPStatus.SERVICE_UNAVAILABLE, 'application/json', to_json_bytes({'error': '数据尚未加载'})
+
+        if path.startswith('/charts/') and path.endswith('.png'):
+            name = path[len('/charts/'):-len('.png')]
+            if name not in CHART_NAMES:
+                return HTTPStatus.NOT_FOUND, 'application/json', to_json_bytes({'error': f'未知图表: {name}'})
+            body = await self._chart(name)
+            if not body:
+                return HTTPStatus.NOT_FOUND, 'application/json', to_json_bytes({'error': f'图表无数据: {name}'})
+            return HTTPStatus.OK, 'image/png', body
+
+        if path in self._responses:
+            return HTTPStatus.OK, 'application/json; charset=utf-8', self._responses[path]
+
+        tables = {key: value for key, value in self.analysis_results.items() if isinstance(value, pd.DataFrame)}
+        if path == '/api/status':
+            payload = {'version': self.version, 'loaded_at': self.loaded_at, 'data_file': self.data_file,
+                       'rows': len(self.df), 'rankings': list(tables), 'charts': list(CHART_NAMES)}
+        elif path == '/api/overview':
+            payload = self.analysis_results.get('market_overview', {})
+        elif path == '/api/rankings':
+            payload = {key: value for key, value in tables.items() if key != 'type_perf'}
+        elif path.startswith('/api/rankings/'):
+            name = path[len('/api/rankings/'):]
+            if name not in tables:
+                return HTTPStatus.NOT_FOUND, 'application/json', to_json_bytes({'error': f'未知排名: {name}'})
+            table = tables[name]
+            payload = table.reset_index() if name == 'type_perf' else table
+        elif path == '/api/portfolio':
+            payload = self.portfolio_advice
+        else:
+            return HTTPStatus.NOT_FOUND, 'application/json', to_json_bytes({'error': f'未知路径: {path}'})
+
+        # JSON序列化在当前快照内只做一次
+        body = to_json_bytes(payload)
+        self._responses[path] = body
+        return HTTPStatus.OK, 'application/json; charset=utf-8', body
+
+    async def handle(self, reader, writer):
+        """处理一个HTTP/1.1连接（每个连接一个请求）"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.config['request_timeout'])
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = lines[0].split(' ', 2)
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+
+            if method not in ('GET', 'HEAD'):
+                await self._send(writer, HTTPStatus.METHOD_NOT_ALLOWED, 'text/plain', b'', method)
+                return
+
+            path = urlsplit(target).path.rstrip('/') or '/api/status'
+            version = self.version
+            etag = f'"{version}-{hashlib.sha1(path.encode()).hexdigest()[:8]}"'
+            # 快照未变时同一路径的响应不变，ETag匹配就直接返回304，不再生成响应或渲染图表
+            if version is not None and headers.get('if-none-match') == etag:
+                content_type = 'image/png' if path.endswith('.png') else 'application/json; charset=utf-8'
+                await self._send(writer, HTTPStatus.NOT_MODIFIED, content_type, b'', method, etag)
+                return
+            status, content_type, body = await self.resolve(path)
+            await self._send(writer, status, content_type, body, method,
+                             etag if status == HTTPStatus.OK else None)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        except Exception as e:
+            logger.error(f"处理请求失败: {str(e)}")
+            await self._send(writer, HTTPStatus.INTERNAL_SERVER_ERROR, 'application/json',
+                             to_json_bytes({'error': str(e)}), 'GET')
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status, content_type, body, method, etag=None):
+        """写出HTTP响应"""
+        headers = [
+            f'HTTP/1.1 {status.value} {status.phrase}',
+            f'Content-Type: {content_type}',
+            f'Content-Length: {len(body)}',
+            'Cache-Control: no-cache',
+            'Connection: close'
+        ]
+        if etag:
+            headers.append(f'ETag: {etag}')
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+        if method != 'HEAD' and status != HTTPStatus.NOT_MODIFIED:
+            writer.write(body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def serve_forever(self):
+        """加载首个快照并开始监听"""
+        await self.reload_if_changed()
+        server = await asyncio.start_server(self.handle, self.config['host'], self.config['port'])
+        logger.info(f"报告服务已启动: http://{self.config['host']}:{self.config['port']}/api/status")
+        watcher = asyncio.create_task(self.watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+            self._executor.shutdown(cancel_futures=True)
+            # 渲染进程已全部退出，当前表和仍在等待渲染结束的旧表一并删除
+            for table in {self._shared_table, *self._renders} - {None}:
+                table.unlink()
+            self._renders = {}
+
+def run_service(data_file, sheet_name=None, host=None, port=None):
+    """启动本地报告服务（阻塞直到中断）"""
+    config = {key: value for key, value in (('host', host), ('port', port)) if value is not None}
+    service = ReportService(data_file, sheet_name, config)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("报告服务已停止")
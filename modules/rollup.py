@@ -0,0 +1,186 @@
+import glob
+import hashlib
+import os
+import time
+from itertools import combinations
+import numpy as np
+import pandas as pd
+from configs.analysis_config import ROLLUP_CONFIG
+from configs.data_config import HISTORY_CONFIG
+from .history import snapshot_date
+from utils.cache_io import write_cache
+from utils.logging_config import logger
+
+# 同一进程内的汇总缓存：(日期, 输入摘要) -> 最细粒度单元表
+_ROLLUP_CACHE = {}
+
+def _dimensions(df):
+    return [dim for dim in ROLLUP_CONFIG['dimensions'] if dim in df.columns]
+
+def _all_dims(cells):
+    """单元表中的维度列（分类类型）"""
+    return [col for col, dtype in cells.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+
+def _accumulators(df):
+    """
+    需要累加的量：每个指标的有效值合计与有效个数，加权指标的加权合计与权重合计，以及ETF数量
+
+    返回:
+    (累加量名称列表, (行数 × 累加量数) 数组)；缺失值记为0且不计入个数
+    """
+    metrics = [metric for metric in ROLLUP_CONFIG['metrics'] if metric in df.columns]
+    block = df[metrics].to_numpy(dtype='float64', na_value=np.nan)
+    valid = np.isfinite(block)
+    values = np.where(valid, block, 0.0)
+    names = [f"{metric}:sum" for metric in metrics] + [f"{metric}:n" for metric in metrics]
+    columns = [values, valid]
+
+    weight_column = ROLLUP_CONFIG['weight']
+    if weight_column in df.columns:
+        weight = df[weight_column].to_numpy(dtype='float64', na_value=np.nan)
+        weight = np.where(np.isfinite(weight) & (weight > 0), weight, 0.0)
+        for metric in ROLLUP_CONFIG['weighted_metrics']:
+            if metric in metrics:
+                j = metrics.index(metric)
+                w = np.where(valid[:, j], weight, 0.0)
+                columns += [(values[:, j] * w)[:, None], w[:, None]]
+                names += [f"{metric}:wsum", f"{metric}:w"]
+
+    columns.append(np.ones((len(df), 1)))
+    names.append('数量')
+    return names, np.hstack(columns).astype('float64')
+
+def _reduce(keys, values):
+    """
+    按整数键分组求和：键稳定排序后一次np.add.reduceat同时得到所有累加量的组合计
+
+    返回:
+    (各组的键, (组数 × 累加量数) 合计)
+    """
+    if len(keys) == 0:
+        return keys, np.zeros((0, values.shape[1]))
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return sorted_keys[starts], np.add.reduceat(values[order], starts, axis=0)
+
+def build_cells(df):
+    """
+    最细粒度的汇总单元：全部维度组合成一个整数键，对行做一次分组求和
+
+    各维度只factorize一次，单元表中的维度列保存为分类类型（类别即该维度的全部取值），
+    粗粒度的汇总直接用分类编码在单元表上再求和，不再回到逐行数据
+    """
+    dims = _dimensions(df)
+    codes, labels = [], []
+    for dim in dims:
+        values = df[dim].astype(object).where(df[dim].notna(), ROLLUP_CONFIG['missing_label']).astype(str)
+        dim_codes, uniques = pd.factorize(values, sort=True)
+        codes.append(dim_codes)
+        labels.append(pd.Index(uniques))
+    shape = tuple(len(uniques) for uniques in labels)
+    keys = np.ravel_multi_index(codes, shape) if dims else np.zeros(len(df), dtype=np.intp)
+
+    names, accumulators = _accumulators(df)
+    cell_keys, sums = _reduce(np.asarray(keys, dtype=np.int64), accumulators)
+    coords = np.unravel_index(cell_keys, shape) if dims else []
+    cells = pd.DataFrame({dim: pd.Categorical.from_codes(coord, categories=uniques)
+                          for dim, coord, uniques in zip(dims, coords, labels)})
+    for j, name in enumerate(names):
+        cells[name] = sums[:, j]
+    return cells
+
+def rollup_cells(cells, dims):
+    """
+    从单元表汇总到指定维度
+
+    合计、个数和权重都可加，均值在汇总后由合计/个数得出，因此各层级与直接分组的结果一致
+
+    返回:
+    每组一行的DataFrame：维度列、数量、各指标的合计（X合计）或均值（平均X），加权均值（加权X）
+    """
+    dims = list(dims)
+    all_dims = _all_dims(cells)
+    accumulator_names = [col for col in cells.columns if col not in all_dims]
+    values = cells[accumulator_names].to_numpy(dtype='float64')
+    if dims:
+        shape = tuple(len(cells[dim].cat.categories) for dim in dims)
+        keys = np.ravel_multi_index([cells[dim].cat.codes.to_numpy() for dim in dims], shape).astype(np.int64)
+    else:
+        keys = np.zeros(len(cells), dtype=np.int64)
+    group_keys, sums = _reduce(keys, values)
+    column = {name: sums[:, j] for j, name in enumerate(accumulator_names)}
+
+    result = {}
+    if dims:
+        for dim, coord in zip(dims, np.unravel_index(group_keys, shape)):
+            result[dim] = cells[dim].cat.categories[coord].to_numpy()
+    result['数量'] = column['数量'].astype('int64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for metric, how in ROLLUP_CONFIG['metrics'].items():
+            if f"{metric}:sum" not in column:
+                continue
+            total, count = column[f"{metric}:sum"], column[f"{metric}:n"]
+            if how == 'sum':
+                result[f"{metric}合计"] = np.where(count > 0, total, np.nan)
+            else:
+                result[f"平均{metric}"] = np.where(count > 0, total / count, np.nan)
+        for metric in ROLLUP_CONFIG['weighted_metrics']:
+            if f"{metric}:wsum" in column:
+                weight = column[f"{metric}:w"]
+                result[f"加权{metric}"] = np.where(weight > 0, column[f"{metric}:wsum"] / weight, np.nan)
+    return pd.DataFrame(result)
+
+def _input_digest(df):
+    """维度列、指标列和汇总配置的摘要，快照内容或配置变化时缓存失效"""
+    columns = [col for col in dict.fromkeys(['代码', *ROLLUP_CONFIG['dimensions'], *ROLLUP_CONFIG['metrics'],
+                                              ROLLUP_CONFIG['weight']]) if col in df.columns]
+    digest = hashlib.sha1(repr(sorted(ROLLUP_CONFIG.items(), key=lambda item: item[0])).encode())
+    digest.update(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+def load_cells(df, history_dir=None):
+    """
+    当日快照的单元表，按快照缓存在内存和 history/rollup/ 下；同一快照重复运行直接读取缓存
+    """
+    date = snapshot_date(df)
+    key = (date, _input_digest(df))
+    cells = _ROLLUP_CACHE.get(key)
+    if cells is not None:
+        return cells
+
+    cache_dir = os.path.join(history_dir or HISTORY_CONFIG['history_dir'], ROLLUP_CONFIG['cache_dir'])
+    cache_file = os.path.join(cache_dir, f"{date}_{key[1]}")
+    for path in (cache_file + '.parquet', cache_file + '.pkl'):
+        if os.path.exists(path):
+            cells = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_pickle(path)
+            break
+    if cells is None:
+        cells = build_cells(df)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            for stale in glob.glob(os.path.join(glob.escape(cache_dir), f"{date}_*")):
+                os.remove(stale)
+            write_cache(cells, cache_file)
+        except Exception as e:
+            logger.warning(f"写入汇总缓存失败: {str(e)}")
+    _ROLLUP_CACHE[key] = cells
+    return cells
+
+def build_rollup(df, history_dir=None):
+    """
+    多维汇总：按类型、管理公司、跟踪指数名称及其所有组合汇总资金流、成交、换手、溢折率和收益
+
+    返回:
+    {分组名: DataFrame}，分组名为维度用“×”连接，如 '管理公司'、'类型×管理公司'
+    """
+    start = time.time()
+    cells = load_cells(df, history_dir)
+    dims = _all_dims(cells)
+    tables = {}
+    for depth in range(1, len(dims) + 1):
+        for group in combinations(dims, depth):
+            tables['×'.join(group)] = rollup_cells(cells, group)
+    logger.info(f"多维汇总完成: {len(dims)} 个维度，{len(tables)} 种分组，{len(cells)} 个单元，"
+                f"耗时: {time.time() - start:.3f}秒")
+    return tables
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+from configs.analysis_config import SCANNER_CONFIG, REVERSAL_THRESHOLD
+from .history import default_store
+from utils.logging_config import logger
+
+def horizon_returns(returns, horizons, end=None, min_coverage=None):
+    """
+    由日收益面板计算各周期的累计收益
+
+    参数:
+    returns: (日期数 × ETF数) 的日收益数组，缺失为NaN
+    horizons: 周期列表（交易日）
+    end: 截止行（不含），默认到最后一行
+    min_coverage: 周期内有效天数占比下限
+
+    返回:
+    (周期数 × ETF数) 的累计收益数组。对数收益和有效天数各做一次累积和，
+    任意周期的收益都是两行之差，不需要逐只ETF或逐个窗口循环
+    """
+    min_coverage = SCANNER_CONFIG['min_coverage'] if min_coverage is None else min_coverage
+    end = len(returns) if end is None else end
+    valid = np.isfinite(returns)
+    with np.errstate(invalid='ignore'):
+        log_returns = np.where(valid, np.log1p(np.where(valid, returns, 0.0)), 0.0)
+    zero = np.zeros((1, returns.shape[1]))
+    cum_log = np.vstack([zero, np.cumsum(log_returns, axis=0)])
+    cum_valid = np.vstack([zero, np.cumsum(valid, axis=0)])
+
+    result = np.full((len(horizons), returns.shape[1]), np.nan)
+    for i, horizon in enumerate(horizons):
+        start = end - horizon
+        if start < 0:
+            continue
+        covered = (cum_valid[end] - cum_valid[start]) >= np.ceil(horizon * min_coverage)
+        result[i] = np.where(covered, np.expm1(cum_log[end] - cum_log[start]), np.nan)
+    return result
+
+def _zscore(values):
+    """截面标准化，缺失记为0"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (values - np.nanmean(values)) / np.nanstd(values)
+    return np.nan_to_num(z, nan=0, posinf=0, neginf=0)
+
+def scan_history(df, store=None):
+    """
+    多周期动量与反转扫描
+
+    参数:
+    df: 当前快照（当日涨跌幅作为面板最后一天）
+    store: 历史快照存储
+
+    返回:
+    与df同索引的DataFrame，包含各周期动量、多周期动量、反转周期数、反转前跌幅和多周期反转；
+    历史天数不足最短周期时返回None
+    """
+    horizons = SCANNER_CONFIG['horizons']
+    store = store or default_store()
+    dates, panel = store.panel(df, ['涨跌幅'], max(horizons) + 1)
+    if len(dates) <= min(horizons):
+        logger.info(f"历史交易日不足（{len(dates)}天），跳过多周期扫描")
+        return None
+
+    returns = panel['涨跌幅']
+    momentum = horizon_returns(returns, horizons)
+    # 反转：截至昨日的周期收益跌破阈值（按周期的平方根放大5日阈值），且今日上涨
+    prior = horizon_returns(returns, horizons, end=len(returns) - 1)
+    thresholds = REVERSAL_THRESHOLD['5日跌幅'] * np.sqrt(np.array(horizons) / 5.0)
+    with np.errstate(invalid='ignore'):
+        dropped = prior < thresholds[:, None]
+    today_up = df['涨跌幅'].to_numpy(dtype='float64') > REVERSAL_THRESHOLD['今日涨幅']
+    reversal = dropped & today_up
+    reversal_count = reversal.sum(axis=0)
+
+    weights = np.array(SCANNER_CONFIG['momentum_weights'])
+    available = np.isfinite(momentum).any(axis=1)
+    composite = sum(weights[i] * _zscore(momentum[i]) for i in np.flatnonzero(available))
+    composite = np.where(np.isfinite(momentum).any(axis=0), composite, np.nan)
+
+    result = {f"动量{horizon}日": momentum[i] for i, horizon in enumerate(horizons)}
+    result['多周期动量'] = composite
+    result['反转周期数'] = reversal_count
+    result['反转前跌幅'] = np.where(reversal, prior, np.inf).min(axis=0)
+    result['反转前跌幅'] = np.where(reversal_count > 0, result['反转前跌幅'], np.nan)
+    result['多周期反转'] = reversal_count > 0
+    logger.info(f"多周期扫描完成: {len(dates)} 个交易日，可用周期 "
+                f"{', '.join(str(h) for h, ok in zip(horizons, available) if ok)}，反转信号 {int((reversal_count > 0).sum())} 只")
+    return pd.DataFrame(result, index=df.index)
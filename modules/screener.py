@@ -0,0 +1,347 @@
+"""
+自定义筛选表达式
+
+语法是Python表达式的一个子集，例如:
+    溢折率 < -0.005 and 换手率 > 0.05 and 类型 == '主'
+    `5日涨跌幅` < -0.03 and not 反转信号
+    '半导体' in 名称 and rank(成交额) > 0.8
+    类型 in ('宽', '策') and -0.01 < 涨跌幅 < 0
+
+- 列名直接书写；不是合法标识符的列名（如以数字开头）用反引号括起
+- 比较: < <= > >= == !=（可链式），in / not in（列表、元组）
+- 文本列: == / != / in 按类别编码比较；'子串' in 列 为包含匹配
+- 逻辑: and / or / not；算术: + - * /
+- 函数: abs(列), isna(列), notna(列), rank(列)（截面百分位排名，0~1）
+"""
+import ast
+import json
+import os
+import re
+import time
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from configs.analysis_config import SCREEN_CONFIG
+from utils.logging_config import logger
+
+COMPARISONS = {ast.Lt: 'lt', ast.LtE: 'le', ast.Gt: 'gt', ast.GtE: 'ge', ast.Eq: 'eq', ast.NotEq: 'ne'}
+MIRRORED = {'lt': 'gt', 'le': 'ge', 'gt': 'lt', 'ge': 'le', 'eq': 'eq', 'ne': 'ne'}
+ARITHMETIC = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+FUNCTIONS = ('abs', 'isna', 'notna', 'rank')
+
+class ScreenError(ValueError):
+    """筛选表达式无法解析或求值"""
+
+class _Labels:
+    """文本列的类别编码：比较只在类别上做一次，再按编码取回各行"""
+
+    def __init__(self, values):
+        self.codes, categories = pd.factorize(values, use_na_sentinel=True)
+        self.categories = pd.Index(categories)
+
+    def take(self, category_mask):
+        """类别上的布尔结果 -> 各行的布尔结果（缺失值为False）"""
+        return np.append(np.asarray(category_mask, dtype=bool), False)[self.codes]
+
+class ScreenProgram:
+    """
+    一组筛选编译后的计算步骤
+
+    每个子表达式规范化后得到一个键（and/or的操作数排序、常量放到比较右侧、链式比较拆开），
+    相同的键只占一个步骤，多个筛选共用的条件和列只计算一次。and/or按排序后的操作数两两折叠，
+    共同前缀也可共用
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.slots = {}
+        self.screens = []
+
+    def _intern(self, key):
+        if key not in self.slots:
+            self.slots[key] = len(self.steps)
+            self.steps.append(key)
+        return self.slots[key]
+
+    def add(self, name, expr, sort=None, ascending=False):
+        """解析并加入一个筛选，返回其结果步骤"""
+        columns = []
+        text = re.sub(r'`([^`]+)`', lambda m: f"__col{self._quoted(m.group(1), columns)}", expr)
+        try:
+            tree = ast.parse(text.strip(), mode='eval').body
+        except SyntaxError as e:
+            raise ScreenError(f"筛选 {name} 的表达式语法错误: {e.msg}") from None
+        self._columns = columns
+        referenced = []
+        root = self._compile(tree, referenced)
+        self.screens.append({'name': name, 'expr': expr, 'root': root, 'sort': sort, 'ascending': ascending,
+                             'columns': list(dict.fromkeys(referenced))})
+        return root
+
+    @staticmethod
+    def _quoted(column, columns):
+        columns.append(column)
+        return len(columns) - 1
+
+    def _fold(self, op, operands):
+        """展开嵌套的同类逻辑运算，操作数去重排序后两两折叠"""
+        flat = set()
+        for slot in operands:
+            flat.update(self._operands(op, slot))
+        flat = sorted(flat)
+        slot = flat[0]
+        for other in flat[1:]:
+            slot = self._intern((op, slot, other))
+        return slot
+
+    def _operands(self, op, slot):
+        key = self.steps[slot]
+        if key[0] != op:
+            return [slot]
+        return self._operands(op, key[1]) + self._operands(op, key[2])
+
+    def _column_name(self, node):
+        if node.id.startswith('__col') and node.id[5:].isdigit():
+            return self._columns[int(node.id[5:])]
+        return node.id
+
+    def _constant(self, node):
+        """常量节点的值；不是常量时返回None"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+            return node.value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant) \
+                and isinstance(node.operand.value, (int, float)):
+            return -node.operand.value
+        return None
+
+    def _compile(self, node, referenced):
+        constant = self._constant(node)
+        if constant is not None:
+            return self._intern(('const', type(constant).__name__, constant))
+        if isinstance(node, ast.Name):
+            column = self._column_name(node)
+            referenced.append(column)
+            return self._intern(('col', column))
+        if isinstance(node, ast.BoolOp):
+            return self._fold('and' if isinstance(node.op, ast.And) else 'or',
+                              [self._compile(value, referenced) for value in node.values])
+        if isinstance(node, ast.UnaryOp):
+            operand = self._compile(node.operand, referenced)
+            if isinstance(node.op, ast.Not):
+                return self._intern(('not', operand))
+            if isinstance(node.op, ast.USub):
+                return self._intern(('neg', operand))
+            if isinstance(node.op, ast.UAdd):
+                return operand
+        if isinstance(node, ast.BinOp) and type(node.op) in ARITHMETIC:
+            return self._intern(('arith', type(node.op).__name__,
+                                 self._compile(node.left, referenced), self._compile(node.right, referenced)))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+                and len(node.args) == 1 and not node.keywords:
+            return self._intern(('call', node.func.id, self._compile(node.args[0], referenced)))
+        if isinstance(node, ast.Compare):
+            parts = []
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                parts.append(self._comparison(op, left, right, referenced))
+                left = right
+            # 链式比较 a < b < c 拆为 a < b and b < c
+            return self._fold('and', parts)
+        raise ScreenError(f"不支持的表达式: {ast.unparse(node)}")
+
+    def _comparison(self, op, left, right, referenced):
+        if isinstance(op, (ast.In, ast.NotIn)):
+            negate = isinstance(op, ast.NotIn)
+            text = self._constant(left)
+            if isinstance(text, str):
+                # '子串' in 列
+                slot = self._intern(('contains', text, self._compile(right, referenced)))
+            elif isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+                values = [self._constant(item) for item in right.elts]
+                if any(value is None for value in values):
+                    raise ScreenError(f"in 的右侧只能是常量列表: {ast.unparse(right)}")
+                slot = self._intern(('isin', self._compile(left, referenced), tuple(sorted(set(values), key=str))))
+            else:
+                raise ScreenError(f"不支持的 in 表达式: {ast.unparse(left)} in {ast.unparse(right)}")
+            return self._intern(('not', slot)) if negate else slot
+        if type(op) not in COMPARISONS:
+            raise ScreenError(f"不支持的比较运算: {type(op).__name__}")
+        name = COMPARISONS[type(op)]
+        a, b = self._compile(left, referenced), self._compile(right, referenced)
+        # 常量统一放在右侧：0 > 溢折率 与 溢折率 < 0 是同一步骤
+        if self.steps[a][0] == 'const' and self.steps[b][0] != 'const':
+            a, b, name = b, a, MIRRORED[name]
+        return self._intern(('cmp', name, a, b))
+
+    def evaluate(self, df):
+        """
+        对df求值全部筛选
+
+        返回:
+        {筛选名: 布尔数组}；引用了缺失列或求值失败的筛选记录警告后跳过
+        """
+        needed = sorted({column for screen in self.screens for column in screen['columns'] if column in df.columns})
+        numeric = [column for column in needed if pd.api.types.is_numeric_dtype(df[column])
+                   and not pd.api.types.is_bool_dtype(df[column])]
+        # 数值列一次取成一个列块，各步骤直接引用列块中的列
+        block = df[numeric].to_numpy(dtype='float64', na_value=np.nan) if numeric else np.empty((len(df), 0))
+        positions = {column: i for i, column in enumerate(numeric)}
+        values = {}
+
+        def column(name):
+            if name not in df.columns:
+                raise ScreenError(f"数据中没有列: {name}")
+            if name in positions:
+                return block[:, positions[name]]
+            if pd.api.types.is_bool_dtype(df[name]):
+                return df[name].to_numpy(dtype=bool)
+            return _Labels(df[name].to_numpy())
+
+        def mask(value, key):
+            if isinstance(value, np.ndarray) and value.dtype == bool:
+                return value
+            raise ScreenError(f"条件不是布尔值: {key}")
+
+        def compute(slot):
+            if slot in values:
+                return values[slot]
+            key = self.steps[slot]
+            kind = key[0]
+            if kind == 'const':
+                result = key[2]
+            elif kind == 'col':
+                result = column(key[1])
+            elif kind in ('and', 'or'):
+                left, right = mask(compute(key[1]), key), mask(compute(key[2]), key)
+                result = (left & right) if kind == 'and' else (left | right)
+            elif kind == 'not':
+                result = ~mask(compute(key[1]), key)
+            elif kind == 'neg':
+                result = -np.asarray(compute(key[1]), dtype='float64')
+            elif kind == 'arith':
+                op = ARITHMETIC[getattr(ast, key[1])]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = op(compute(key[2]), compute(key[3]))
+            elif kind == 'call':
+                result = self._call(key[1], compute(key[2]))
+            elif kind == 'cmp':
+                result = self._compare(key[1], compute(key[2]), compute(key[3]))
+            elif kind == 'isin':
+                target = compute(key[1])
+                if isinstance(target, _Labels):
+                    result = target.take(target.categories.isin(list(key[2])))
+                else:
+                    result = np.isin(target, [value for value in key[2] if not isinstance(value, str)])
+            elif kind == 'contains':
+                target = compute(key[2])
+                if not isinstance(target, _Labels):
+                    raise ScreenError(f"包含匹配只能用于文本列: {key[1]}")
+                result = target.take(target.categories.astype(str).str.contains(key[1], regex=False))
+            values[slot] = result
+            return result
+
+        masks = {}
+        for screen in self.screens:
+            try:
+                result = compute(screen['root'])
+                masks[screen['name']] = mask(result, screen['expr'])
+            except (ScreenError, TypeError) as e:
+                logger.warning(f"筛选 {screen['name']} 无法计算，已跳过: {e}")
+        return masks
+
+    @staticmethod
+    def _call(name, value):
+        if isinstance(value, _Labels):
+            if name in ('isna', 'notna'):
+                missing = value.codes < 0
+                return missing if name == 'isna' else ~missing
+            raise ScreenError(f"{name}() 不能用于文本列")
+        value = np.asarray(value, dtype='float64')
+        if name == 'abs':
+            return np.abs(value)
+        if name == 'isna':
+            return np.isnan(value)
+        if name == 'notna':
+            return ~np.isnan(value)
+        return pd.Series(value).rank(pct=True).to_numpy(dtype='float64')
+
+    @staticmethod
+    def _compare(name, left, right):
+        if isinstance(left, _Labels) or isinstance(right, _Labels):
+            labels, other = (left, right) if isinstance(left, _Labels) else (right, left)
+            if name not in ('eq', 'ne') or isinstance(other, _Labels):
+                raise ScreenError("文本列只支持与常量做 == / != 比较")
+            matched = labels.take(labels.categories == other)
+            return matched if name == 'eq' else ~matched
+        with np.errstate(invalid='ignore'):
+            return getattr(np, {'lt': 'less', 'le': 'less_equal', 'gt': 'greater', 'ge': 'greater_equal',
+                                'eq': 'equal', 'ne': 'not_equal'}[name])(left, right)
+
+def load_screens(screens_file=None):
+    """配置中的筛选加上筛选定义文件（JSON数组，每项 {name, expr, sort, ascending}）中的筛选"""
+    screens = list(SCREEN_CONFIG['screens'])
+    screens_file = screens_file or SCREEN_CONFIG['screens_file']
+    if screens_file and os.path.exists(screens_file):
+        with open(screens_file, encoding='utf-8') as f:
+            screens += json.load(f)
+    return screens
+
+@lru_cache(maxsize=4)
+def _compile(definitions):
+    program = ScreenProgram()
+    for screen in json.loads(definitions):
+        try:
+            program.add(screen['name'], screen['expr'], screen.get('sort'), screen.get('ascending', False))
+        except (ScreenError, KeyError) as e:
+            logger.warning(f"筛选定义无效，已跳过: {e}")
+    logger.info(f"已编译 {len(program.screens)} 个筛选，共 {len(program.steps)} 个计算步骤")
+    return program
+
+def compile_screens(screens):
+    """编译一组筛选；相同定义只解析一次（批量报告等场景重复调用时直接复用）"""
+    return _compile(json.dumps(screens, ensure_ascii=False, sort_keys=True))
+
+def run_screens(df, screens=None, top_n=None):
+    """
+    求值全部筛选并按各自的排序列排名
+
+    返回:
+    (筛选结果 {筛选名: DataFrame}, 汇总表 [筛选, 条件, 命中数])；结果表包含代码、名称、现价、
+    表达式引用的数值列和排序列，默认按综合得分从高到低
+    """
+    top_n = top_n or SCREEN_CONFIG['top_n']
+    program = compile_screens(load_screens() if screens is None else screens)
+    start = time.time()
+    masks = program.evaluate(df)
+
+    # 排序列和输出列各取一次数组，之后每个筛选只做整数下标取值，不再逐个切片DataFrame
+    arrays = {}
+
+    def array(column):
+        if column not in arrays:
+            values = df[column]
+            arrays[column] = (values.to_numpy(dtype='float64', na_value=np.nan)
+                              if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+                              else values.to_numpy())
+        return arrays[column]
+
+    default_sort = '综合得分' if '综合得分' in df.columns else '涨跌幅'
+    tables, summary = {}, []
+    for screen in program.screens:
+        if screen['name'] not in masks:
+            continue
+        rows = np.flatnonzero(masks[screen['name']])
+        summary.append({'筛选': screen['name'], '条件': screen['expr'], '命中数': len(rows)})
+        sort = screen['sort'] or default_sort
+        columns = [column for column in dict.fromkeys(['代码', '名称', '现价', *screen['columns'], sort])
+                   if column in df.columns]
+        if len(rows) and sort in df.columns:
+            # 排序列也可能是文本（名称、类型等），交给pandas排序：降序同样稳定，缺失值排在最后
+            order = pd.Series(array(sort)[rows]).sort_values(ascending=screen['ascending'], kind='stable',
+                                                            na_position='last')
+            rows = rows[order.index.to_numpy()]
+        rows = rows[:top_n]
+        tables[screen['name']] = pd.DataFrame({column: array(column)[rows] for column in columns})
+
+    logger.info(f"自定义筛选完成: {len(tables)} 个筛选，耗时: {time.time() - start:.3f}秒")
+    return tables, pd.DataFrame(summary, columns=['筛选', '条件', '命中数'])
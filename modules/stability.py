@@ -0,0 +1,110 @@
+import time
+import numpy as np
+import pandas as pd
+from configs.analysis_config import STABILITY_CONFIG
+from utils.logging_config import logger
+
+def perturbed_weights(weights, draws, concentration, rng):
+    """
+    在配置权重附近抽样权重向量
+
+    以|w|/Σ|w|为均值做Dirichlet抽样，再乘回Σ|w|并恢复符号（波动率类因子可为负权重）；
+    权重为0的因子保持为0
+
+    返回:
+    (抽样数 × 因子数) 数组
+    """
+    weights = np.asarray(weights, dtype='float64')
+    active = weights != 0
+    scale = np.abs(weights).sum()
+    samples = np.zeros((draws, len(weights)))
+    if active.any():
+        alpha = concentration * np.abs(weights[active]) / scale
+        samples[:, active] = rng.dirichlet(alpha, size=draws) * scale * np.sign(weights[active])
+    return samples
+
+def _chunks(draws, width):
+    """按STABILITY_CONFIG['chunk_cells']把抽样分块，每块的得分矩阵不超过该元素数"""
+    size = max(1, STABILITY_CONFIG['chunk_cells'] // max(width, 1))
+    return [slice(start, min(start + size, draws)) for start in range(0, draws, size)]
+
+def top_probability(block, samples, top_n):
+    """
+    各ETF在抽样权重下进入前top_n名的概率
+
+    抽样分块与因子块相乘，每行用argpartition取前top_n（不需要整行排序），内存只占一块的得分矩阵
+    """
+    count = len(block)
+    if count <= top_n:
+        return np.ones(count)
+    hits = np.zeros(count, dtype='int64')
+    for part in _chunks(len(samples), count):
+        scores = samples[part] @ block.T
+        top = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+        hits += np.bincount(top.ravel(), minlength=count)
+    return hits / len(samples)
+
+def candidate_ranks(block, samples, candidates):
+    """
+    候选ETF在各抽样权重下的名次（1为最高）
+
+    名次 = 1 + 得分严格高于它的ETF数。每次抽样只取出高于候选最低得分的ETF排序，再对各候选二分查找计数
+
+    返回:
+    (抽样数 × 候选数) 的名次数组
+    """
+    ranks = np.empty((len(samples), len(candidates)), dtype=np.int32)
+    for part in _chunks(len(samples), len(block)):
+        scores = samples[part] @ block.T
+        own = scores[:, candidates]
+        for row, draw in enumerate(range(part.start, part.stop)):
+            above = scores[row][scores[row] > own[row].min()]
+            above.sort()
+            ranks[draw] = 1 + len(above) - np.searchsorted(above, own[row], side='right')
+    return ranks
+
+def score_stability(df, weights, block, draws=None, seed=None):
+    """
+    综合得分的排名稳定性：权重在配置值附近扰动时，各ETF进入前N名的概率和排名区间
+
+    参数:
+    df: 带综合得分的数据
+    weights: 配置的因子权重
+    block: 标准化后的因子块（与计算综合得分时相同）
+
+    返回:
+    入选概率大于0或基准排名在前top_n的ETF，按入选概率和中位排名排序，列为代码、名称、综合得分、基准排名、
+    入选概率、排名下界、中位排名、排名上界（区间为STABILITY_CONFIG['interval']分位数）
+    """
+    start = time.time()
+    draws = draws or STABILITY_CONFIG['draws']
+    seed = STABILITY_CONFIG['seed'] if seed is None else seed
+    top_n = STABILITY_CONFIG['top_n']
+    rng = np.random.default_rng(seed)
+    samples = perturbed_weights(weights, draws, STABILITY_CONFIG['concentration'], rng)
+    composite = df['综合得分'].to_numpy(dtype='float64')
+    baseline_top = np.argpartition(-composite, min(top_n, len(composite)) - 1)[:top_n]
+    top_prob = top_probability(block, samples, top_n)
+
+    # 排名区间只对候选计算：曾进入前top_n的ETF，加上当前权重下的前top_n
+    candidates = np.union1d(np.flatnonzero(top_prob > 0), baseline_top)
+    ranks = np.sort(candidate_ranks(block, samples, candidates), axis=0)
+    # 名次为整数，排序后直接按位置取分位数
+    quantiles = np.array([STABILITY_CONFIG['interval'][0], 0.5, STABILITY_CONFIG['interval'][1]])
+    positions = np.rint(quantiles * (draws - 1)).astype(int)
+    low, median, high = ranks[positions]
+
+    result = pd.DataFrame({
+        '代码': df['代码'].to_numpy()[candidates],
+        '名称': df['名称'].to_numpy()[candidates],
+        '综合得分': composite[candidates],
+        '基准排名': len(composite) + 1 - np.searchsorted(np.sort(composite), composite[candidates], side='right'),
+        '入选概率': top_prob[candidates],
+        '排名下界': low,
+        '中位排名': median,
+        '排名上界': high
+    })
+    result = result.sort_values(['入选概率', '中位排名'], ascending=[False, True])
+    logger.info(f"排名稳定性分析完成: {draws} 组权重，{len(df)} 只ETF，{int((top_prob > 0).sum())} 只曾进入前{top_n}，"
+                f"耗时: {time.time() - start:.3f}秒")
+    return result.reset_index(drop=True)
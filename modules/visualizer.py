@@ -5,7 +5,10 @@ import numpy as np
 import platform
 from io import BytesIO
 import plotly.express as px
-from configs.report_config import REPORT_CONFIG
+import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from configs.report_config import REPORT_CONFIG, TIME_BUDGET, INTERACTIVE_CHART_CONFIG
+from configs.analysis_config import ROLLUP_CONFIG, QUANTILE_CONFIG
 import matplotlib as mpl
 import time
 import logging
@@ -110,6 +113,52 @@ def create_pie_chart(series, title='', autopct='%1.1f%%'):
         logger.error(f"创建饼图失败: {str(e)}")
         return ""
 
+def create_heatmap(pivot, title='', scale=1e8, unit='亿元'):
+    """创建以0为中心的热力图（流入为红、流出为绿），格内标注数值"""
+    try:
+        set_chinese_font()
+        values = pivot.to_numpy(dtype='float64') / scale
+        limit = np.nanmax(np.abs(values)) if np.isfinite(values).any() else 1
+        fig, ax = plt.subplots(figsize=REPORT_CONFIG['chart_sizes']['heatmap'])
+        image = ax.imshow(values, cmap='RdYlGn_r', vmin=-limit, vmax=limit, aspect='auto')
+        ax.grid(False)
+        ax.set_xticks(range(len(pivot.columns)), labels=pivot.columns, fontsize=8)
+        ax.set_yticks(range(len(pivot.index)), labels=pivot.index, fontsize=8)
+        for i, j in zip(*np.nonzero(np.isfinite(values))):
+            ax.text(j, i, f"{values[i, j]:.2f}", ha='center', va='center', fontsize=7)
+        fig.colorbar(image, ax=ax, label=unit)
+        ax.set_title(title, fontsize=12)
+        plt.tight_layout()
+        return fig_to_base64(fig)
+    except Exception as e:
+        logger.error(f"创建热力图失败: {str(e)}")
+        return ""
+
+def create_quantile_bars(tables, target='涨跌幅', title=''):
+    """因子分位收益小图：每个因子一格，柱为各组平均收益，点为中位数"""
+    try:
+        set_chinese_font()
+        columns = 2 if len(tables) > 1 else 1
+        rows = -(-len(tables) // columns)
+        fig, axes = plt.subplots(rows, columns, figsize=REPORT_CONFIG['chart_sizes']['quantile'], squeeze=False)
+        for ax, (factor, table) in zip(axes.flat, tables.items()):
+            means = table[f"平均{target}"].to_numpy(dtype='float64') * 100
+            positions = np.arange(len(table))
+            ax.bar(positions, means, color=np.where(means >= 0, '#c0392b', '#27ae60'), alpha=0.8)
+            ax.plot(positions, table[f"{target}中位数"].to_numpy(dtype='float64') * 100, 'ko', markersize=3)
+            ax.axhline(0, color='gray', linewidth=0.8)
+            ax.set_xticks(positions, labels=table['组'], fontsize=8)
+            ax.set_title(factor, fontsize=10)
+            ax.set_ylabel(f"{target}(%)", fontsize=8)
+        for ax in axes.flat[len(tables):]:
+            ax.set_visible(False)
+        fig.suptitle(title, fontsize=12)
+        plt.tight_layout()
+        return fig_to_base64(fig)
+    except Exception as e:
+        logger.error(f"创建分位收益图失败: {str(e)}")
+        return ""
+
 def create_scatter_plot(df, x_col, y_col, title='', xlabel='', ylabel=''):
     """创建美观的ETF综合得分 vs 成交额散点图"""
     try:
@@ -134,7 +183,7 @@ def create_scatter_plot(df, x_col, y_col, title='', xlabel='', ylabel=''):
         # 使用颜色渐变表示综合得分
         scores = valid_data.get('综合得分', valid_data[y_col])
         norm = plt.Normalize(scores.min(), scores.max())
-        cmap = plt.cm.get_cmap('viridis')
+        cmap = plt.get_cmap('viridis')
         
         # 绘制散点图
         scatter = ax.scatter(
@@ -228,46 +277,163 @@ def create_scatter_plot(df, x_col, y_col, title='', xlabel='', ylabel=''):
         logger.error(f"创建散点图失败: {str(e)}")
         return ""
 
+def create_interactive_scatter(df, x_col, y_col, title='', log_x=False):
+    """
+    全市场交互散点图（WebGL）
 
-def generate_all_charts(df, analysis_results):
-    """生成所有图表"""
-    charts = {}
-    logger.info("开始生成图表...")
-    start_time = time.time()
-    
+    每个类别一条scattergl轨迹，图例点击和下拉框均可按类别筛选。
+    坐标和悬停数值以float32 numpy数组传入，plotly序列化为base64类型数组而不是逐点的JSON数字
+
+    返回:
+    不含plotly.js的HTML片段，数据不足时返回空字符串
+    """
     try:
+        config = INTERACTIVE_CHART_CONFIG
+        category_col = config['category_column']
+        hover_cols = [col for col in config['hover_columns'] if col in df.columns and col not in (x_col, y_col)]
+        x = pd.to_numeric(df[x_col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        y = pd.to_numeric(df[y_col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        valid = np.isfinite(x) & np.isfinite(y)
+        if log_x:
+            valid &= x > 0
+        if not valid.any():
+            logger.warning(f"没有有效数据创建交互散点图: {x_col} vs {y_col}")
+            return ""
+
+        data = df.loc[valid]
+        x, y = x[valid].astype('float32'), y[valid].astype('float32')
+        labels = (data['名称'].astype(str) + '(' + data['代码'].astype(str) + ')').to_numpy()
+        extra = np.column_stack([pd.to_numeric(data[col], errors='coerce').to_numpy(dtype='float32', na_value=np.nan)
+                                 for col in hover_cols]) if hover_cols else None
+        x_format = ',.0f' if log_x else '.2%'
+        hovertemplate = (f"%{{hovertext}}<br>{x_col}: %{{x:{x_format}}}<br>{y_col}: %{{y:.2f}}"
+                         + ''.join(f"<br>{col}: %{{customdata[{i}]:.2%}}" for i, col in enumerate(hover_cols))
+                         + "<extra>%{fullData.name}</extra>")
+
+        categories = (data[category_col].fillna('其他').astype(str) if category_col in data.columns
+                      else pd.Series('全部', index=data.index))
+        fig = go.Figure()
+        for category, positions in categories.groupby(categories.to_numpy(), sort=True).indices.items():
+            fig.add_trace(go.Scattergl(
+                x=x[positions], y=y[positions], mode='markers', name=category,
+                hovertext=labels[positions], customdata=extra[positions] if extra is not None else None,
+                hovertemplate=hovertemplate, marker={'size': 6, 'opacity': 0.7}
+            ))
+
+        # 下拉框：显示全部或只显示某一类别
+        n = len(fig.data)
+        buttons = [{'label': '全部', 'method': 'restyle', 'args': [{'visible': [True] * n}]}]
+        buttons += [{'label': trace.name, 'method': 'restyle', 'args': [{'visible': [i == j for j in range(n)]}]}
+                    for i, trace in enumerate(fig.data)]
+        fig.update_layout(
+            title=title or f'{y_col} vs {x_col}', height=config['height'], template='plotly_white',
+            xaxis={'title': x_col, 'type': 'log' if log_x else 'linear'},
+            yaxis={'title': y_col},
+            legend={'title': {'text': category_col}},
+            updatemenus=[{'buttons': buttons, 'x': 1.0, 'xanchor': 'right', 'y': 1.12, 'yanchor': 'top'}]
+        )
+        return fig.to_html(full_html=False, include_plotlyjs=False, config={'displaylogo': False, 'responsive': True})
+
+    except Exception as e:
+        logger.error(f"创建交互散点图失败: {str(e)}")
+        return ""
+
+def plotly_script():
+    """报告中只出现一次的plotly.js引用：内嵌完整脚本或CDN链接"""
+    if INTERACTIVE_CHART_CONFIG['plotlyjs'] == 'cdn':
+        return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js" charset="utf-8"></script>'
+    return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+
+
+# 图表名称及生成时的日志说明（按生成顺序）
+CHART_NAMES = {
+    'price_change_dist': '涨跌幅分布图',
+    'type_performance': '类型平均涨跌幅图',
+    'volume_dist': '成交额TOP10饼图',
+    'score_scatter': '综合评分散点图',
+    'rollup_heatmap': '资金流向热力图',
+    'quantile_returns': '因子分位收益图'
+}
+
+def render_chart(name, df, analysis_results):
+    """生成单张图表，返回base64编码；数据不足时返回空字符串"""
+    if name == 'price_change_dist':
         # 1. 涨跌幅分布图
-        logger.info("生成涨跌幅分布图...")
         if not df.empty and '涨跌幅' in df.columns:
-            charts['price_change_dist'] = create_histogram(df, '涨跌幅', 'ETF涨跌幅分布')
-        
+            return create_histogram(df, '涨跌幅', 'ETF涨跌幅分布')
+    
+    elif name == 'type_performance':
         # 2. 类型平均涨跌幅图
-        logger.info("生成类型平均涨跌幅图...")
         if 'type_perf' in analysis_results and not analysis_results['type_perf'].empty:
-            charts['type_performance'] = create_bar_chart(
+            return create_bar_chart(
                 analysis_results['type_perf']['平均涨跌幅'], 
                 '不同类型ETF平均涨跌幅', 
                 'ETF类型', 
                 '平均涨跌幅'
             )
-        
+    
+    elif name == 'volume_dist':
         # 3. 成交额TOP10饼图
-        logger.info("生成成交额TOP10饼图...")
         if 'top_volume' in analysis_results and not analysis_results['top_volume'].empty:
             top_volume = analysis_results['top_volume'].set_index('名称')['成交额']
-            charts['volume_dist'] = create_pie_chart(top_volume, '成交额TOP10 ETF占比')
-        
-        # 4. 综合评分散点图 - 使用静态图表替代Plotly
-        logger.info("生成综合评分散点图...")
+            return create_pie_chart(top_volume, '成交额TOP10 ETF占比')
+    
+    elif name == 'score_scatter':
+        # 4. 综合评分散点图 - 使用静态图表替代Plotly，只画综合得分最高的若干只，避免全市场的点堆叠
         if '综合得分' in df.columns and not df.empty:
-            charts['score_scatter'] = create_scatter_plot(
-                df.head(30),
+            top_n = REPORT_CONFIG['score_scatter_top_n']
+            return create_scatter_plot(
+                df.nlargest(top_n, '综合得分'),
                 '成交额',
                 '综合得分',
-                title='ETF综合得分 vs 成交额',
+                title=f'ETF综合得分 vs 成交额（得分前{top_n}）',
                 xlabel='成交额',
                 ylabel='综合得分'
             )
+    
+    elif name == 'rollup_heatmap':
+        # 5. 资金流向热力图（多维汇总中两个维度交叉的规模变化合计）
+        rows, columns = ROLLUP_CONFIG['heatmap']
+        rollup = analysis_results.get('rollup', {})
+        table = rollup.get(f"{rows}×{columns}", rollup.get(f"{columns}×{rows}"))
+        if table is not None and not table.empty and '规模变化合计' in table.columns:
+            pivot = table.pivot(index=rows, columns=columns, values='规模变化合计')
+            # 只保留资金流绝对值合计最大的若干行
+            keep = pivot.abs().sum(axis=1).nlargest(ROLLUP_CONFIG['heatmap_rows']).index
+            pivot = pivot.loc[keep]
+            return create_heatmap(pivot.loc[:, pivot.notna().any()], f"{rows}×{columns} 资金流向（规模变化）")
+    
+    elif name == 'quantile_returns':
+        # 6. 因子分位收益（报告展开的因子各一格：低分组在左）
+        tables = analysis_results.get('quantiles', {}).get('tables', {})
+        tables = {factor: tables[factor] for factor in QUANTILE_CONFIG['report_factors'] if factor in tables}
+        if tables:
+            return create_quantile_bars(tables, QUANTILE_CONFIG['target'],
+                                        f"按因子分组的{QUANTILE_CONFIG['target']}（柱为均值，点为中位数）")
+    
+    else:
+        logger.warning(f"未知的图表: {name}")
+    return ""
+
+def generate_all_charts(df, analysis_results, budget=None):
+    """生成所有图表；给定时间预算时，预算不足则跳过可选图表，超时后跳过剩余图表"""
+    charts = {}
+    logger.info("开始生成图表...")
+    start_time = time.time()
+    
+    try:
+        for name, description in CHART_NAMES.items():
+            if budget is not None:
+                if budget.expired():
+                    budget.degrade(description)
+                    continue
+                if name in TIME_BUDGET['optional_charts'] and not budget.allows_optional():
+                    budget.degrade(description)
+                    continue
+            logger.info(f"生成{description}...")
+            chart = render_chart(name, df, analysis_results)
+            if chart:
+                charts[name] = chart
         
         # 记录图表生成时间
         elapsed = time.time() - start_time
@@ -277,3 +443,15 @@ def generate_all_charts(df, analysis_results):
     except Exception as e:
         logger.error(f"生成图表过程中出错: {str(e)}")
         return {}
+
+def generate_interactive_charts(df):
+    """生成HTML报告的全市场交互图表，返回 {图表名: HTML片段}"""
+    charts = {}
+    start_time = time.time()
+    for name, spec in INTERACTIVE_CHART_CONFIG['charts'].items():
+        if spec['x'] in df.columns and spec['y'] in df.columns:
+            chart = create_interactive_scatter(df, spec['x'], spec['y'], spec['title'], spec['log_x'])
+            if chart:
+                charts[name] = chart
+    logger.info(f"交互图表生成完成: {len(charts)} 张，{len(df)} 个点，耗时: {time.time() - start_time:.2f}秒")
+    return charts
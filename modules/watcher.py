@@ -0,0 +1,316 @@
+import csv
+import ctypes
+import ctypes.util
+import fnmatch
+import multiprocessing
+import os
+import select
+import struct
+import sys
+import time
+from datetime import datetime
+import matplotlib.pyplot as plt
+import pandas as pd
+from configs.data_config import WATCH_CONFIG
+from .data_loader import source_date
+from .report_generator import template_env
+from .report_service import file_signature
+from .visualizer import set_chinese_font, fig_to_base64
+from utils.logging_config import logger, get_log_queue, init_worker_logging
+from utils.shared_table import ensure_resource_tracker
+
+# inotify事件（见 <sys/inotify.h>）：写入、写完关闭、改名移入、新建，以及事件队列溢出
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+_INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+# struct inotify_event 的定长部分：wd, mask, cookie, len，之后是len字节的文件名
+_EVENT_HEADER = struct.Struct('iIII')
+
+# 流水线返回这些结果时视为失败
+PIPELINE_FAILURES = ('数据加载失败', '报告生成失败')
+
+LATENCY_FIELDS = ['文件', '到达时间', '稳定时间', '开始时间', '发布时间',
+                  '等待写入(秒)', '排队(秒)', '运行(秒)', '端到端延迟(秒)', '结果']
+
+def _matching(name):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in WATCH_CONFIG['patterns'])
+
+def scan_directory(directory):
+    """目录中匹配的数据文件 -> (大小, 修改时间)"""
+    states = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and _matching(entry.name):
+                stat = entry.stat()
+                states[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return states
+
+def file_trade_date(path):
+    """不读取文件内容判断数据文件的交易日：文件名中的日期，没有时取修改时间（见data_loader.source_date）"""
+    return source_date(path, pd.DataFrame())[0]
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class InotifySource:
+    """Linux inotify监听（通过ctypes调用libc，不需要额外依赖）"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify初始化失败')
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), _INOTIFY_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"无法监听目录 {directory}")
+
+    def changes(self, timeout=None):
+        """等待至多timeout秒（None为一直等待），返回有变化的数据文件路径"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        changed, offset = set(), 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            start = offset + _EVENT_HEADER.size
+            name = os.fsdecode(buffer[start:start + length].split(b'\0', 1)[0])
+            offset = start + length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出时丢失了部分事件，重新扫描整个目录
+                changed.update(scan_directory(self.directory))
+            elif name and _matching(name):
+                changed.add(os.path.join(self.directory, name))
+        return sorted(changed)
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingSource:
+    """轮询监听：定期扫描目录，比较文件大小和修改时间"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.states = scan_directory(directory)
+
+    def changes(self, timeout=None):
+        interval = WATCH_CONFIG['poll_interval']
+        time.sleep(interval if timeout is None else min(timeout, interval))
+        states = scan_directory(self.directory)
+        changed = [path for path, state in states.items() if self.states.get(path) != state]
+        self.states = states
+        return sorted(changed)
+
+    def close(self):
+        pass
+
+def open_source(directory):
+    """按配置选择监听方式：Linux上优先inotify，不可用时退回轮询"""
+    if WATCH_CONFIG['backend'] == 'auto' and sys.platform.startswith('linux'):
+        try:
+            source = InotifySource(directory)
+            logger.info(f"使用inotify监听目录: {directory}")
+            return source
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify不可用，改为轮询: {str(e)}")
+    logger.info(f"轮询监听目录: {directory}（间隔 {WATCH_CONFIG['poll_interval']} 秒）")
+    return PollingSource(directory)
+
+def _warm_worker(log_queue):
+    """工作进程初始化：接入主进程日志，并预先完成字体加载、首次绘图和模板编译"""
+    init_worker_logging(log_queue)
+    try:
+        set_chinese_font()
+        fig, ax = plt.subplots()
+        ax.set_title('预热')
+        fig_to_base64(fig)
+        template_env.get_template('report_template.html')
+    except Exception as e:
+        logger.warning(f"工作进程预热失败: {str(e)}")
+    finally:
+        plt.close('all')
+
+def _ready():
+    return os.getpid()
+
+def _run_pipeline(pipeline, data_file, args):
+    """在工作进程中运行流水线，只返回结果状态和完成时间，报告内容由流水线自行写入文件"""
+    result = pipeline(data_file, *args)
+    failed = result is None or (isinstance(result, str) and result in PIPELINE_FAILURES)
+    return ('失败' if failed else '成功'), time.time()
+
+class WarmWorker:
+    """
+    常驻的单进程工作池
+
+    启动时完成导入和预热，文件到达后直接提交流水线；工作进程跨次运行保留，
+    历史因子和汇总等进程内缓存也随之保留。运行超时后终止并重建
+    """
+
+    def __init__(self, pipeline, args=()):
+        self.pipeline = pipeline
+        self.args = args
+        self.pool = None
+
+    def start(self):
+        start = time.time()
+        ensure_resource_tracker()
+        self.pool = multiprocessing.Pool(processes=1, initializer=_warm_worker, initargs=(get_log_queue(),))
+        pid = self.pool.apply(_ready)
+        logger.info(f"工作进程 {pid} 预热完成，耗时: {time.time() - start:.2f}秒")
+
+    def submit(self, data_file):
+        return self.pool.apply_async(_run_pipeline, (self.pipeline, data_file, self.args))
+
+    def restart(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.start()
+
+    def close(self, wait=True):
+        if self.pool is None:
+            return
+        if wait:
+            self.pool.close()
+            self.pool.join()
+        else:
+            self.pool.terminate()
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds).isoformat(sep=' ', timespec='milliseconds')
+
+def record_latency(batch, started, published, status, log_path=None):
+    """记录一次触发从文件到达到报告发布的各段耗时（追加到CSV，同时写入日志）"""
+    log_path = log_path or WATCH_CONFIG['latency_log']
+    rows = []
+    for path, (arrived, settled, _) in batch.items():
+        rows.append({
+            '文件': path,
+            '到达时间': _timestamp(arrived),
+            '稳定时间': _timestamp(settled),
+            '开始时间': _timestamp(started),
+            '发布时间': _timestamp(published),
+            '等待写入(秒)': round(settled - arrived, 3),
+            '排队(秒)': round(started - settled, 3),
+            '运行(秒)': round(published - started, 3),
+            '端到端延迟(秒)': round(published - arrived, 3),
+            '结果': status
+        })
+        logger.info(f"{os.path.basename(path)} {status}: 到达至发布 {published - arrived:.2f}秒"
+                    f"（等待写入 {settled - arrived:.2f}秒，排队 {started - settled:.2f}秒，"
+                    f"运行 {published - started:.2f}秒）")
+    try:
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        new_file = not os.path.exists(log_path)
+        with open(log_path, 'a', newline='', encoding='utf-8-sig' if new_file else 'utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=LATENCY_FIELDS)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+    except Exception as e:
+        logger.warning(f"写入延迟记录失败: {str(e)}")
+
+def run_watch(pipeline, args=(), directory=None, timeout=None):
+    """
+    监听数据目录，新快照写入完成后立即在预热的工作进程中运行流水线
+
+    文件大小和修改时间持续settle_seconds不变才视为写入完成；同一文件写入期间的多次事件合并为一次触发，
+    内容与上次处理时相同的文件不再触发；运行期间写入完成的文件合并为下一批。
+    每次运行以目录中与变化文件同一交易日的全部匹配文件作为多源加载，未变化的其他交易所/供应商文件不会被漏掉；
+    一批中有多个交易日时按日期从早到晚分别运行，不同日期的文件不会合并成同一份快照。
+    启动时目录中已有的文件只记录内容哈希，不触发运行
+
+    参数:
+    pipeline: 流水线函数，调用方式为 pipeline(数据文件, *args)
+    args: 流水线的其余参数
+    directory: 监听目录，默认为WATCH_CONFIG['watch_dir']
+    timeout: 单次运行的超时（秒），超时后终止并重建工作进程
+    """
+    directory = directory or WATCH_CONFIG['watch_dir']
+    settle_seconds = WATCH_CONFIG['settle_seconds']
+    check_interval = WATCH_CONFIG['check_interval']
+    processed = {path: file_signature(path) for path in scan_directory(directory)}
+    source = open_source(directory)
+    worker = WarmWorker(pipeline, args)
+    worker.start()
+    logger.info(f"开始监听 {directory}（{', '.join(WATCH_CONFIG['patterns'])}），已有 {len(processed)} 个数据文件，"
+                f"按 Ctrl+C 停止")
+
+    pending = {}  # 路径 -> [到达时间, 最近一次的(大小, 修改时间), 该状态开始的时间]
+    ready = {}  # 路径 -> (到达时间, 稳定时间, 内容哈希)，等待工作进程空闲
+    running = None  # (AsyncResult, 批次, 开始时间)
+    try:
+        while True:
+            for path in source.changes(check_interval if pending or running else None):
+                if path not in pending:
+                    logger.info(f"检测到数据文件变化: {path}")
+                    pending[path] = [time.time(), None, None]
+
+            now = time.time()
+            for path, entry in list(pending.items()):
+                state = _file_state(path)
+                if state is None:
+                    # 文件已被移走（如供应商先写临时名再改名）
+                    del pending[path]
+                elif state != entry[1]:
+                    entry[1], entry[2] = state, now
+                elif state[0] > 0 and now - entry[2] >= settle_seconds:
+                    del pending[path]
+                    try:
+                        signature = file_signature(path)
+                    except OSError as e:
+                        logger.warning(f"读取数据文件失败 {path}: {str(e)}")
+                        continue
+                    if processed.get(path) == signature:
+                        logger.info(f"{path} 内容与上次处理时相同，跳过")
+                        continue
+                    ready[path] = (entry[0], now, signature)
+
+            if running is not None:
+                result, batch, started = running
+                if result.ready():
+                    try:
+                        status, published = result.get()
+                    except Exception as e:
+                        logger.error(f"流水线执行出错: {str(e)}")
+                        status, published = '失败', time.time()
+                    record_latency(batch, started, published, status)
+                    running = None
+                elif timeout and now - started > timeout:
+                    logger.error(f"流水线运行超过 {timeout} 秒，终止并重建工作进程")
+                    record_latency(batch, started, time.time(), '超时')
+                    worker.restart()
+                    running = None
+
+            if ready and running is None:
+                current = scan_directory(directory)
+                dates = {path: file_trade_date(path) for path in current}
+                # 写入完成后又被移走的文件不再处理
+                ready = {path: entry for path, entry in ready.items() if path in dates}
+                if ready:
+                    date = min(dates[path] for path in ready)
+                    batch = {path: entry for path, entry in ready.items() if dates[path] == date}
+                    ready = {path: entry for path, entry in ready.items() if dates[path] != date}
+                    for path, (_, _, signature) in batch.items():
+                        processed[path] = signature
+                    files = sorted(path for path in current if dates[path] == date)
+                    logger.info(f"触发流水线（交易日 {date}）: {', '.join(os.path.basename(path) for path in sorted(batch))}"
+                                f" 有变化，共 {len(files)} 个数据源")
+                    running = (worker.submit(files[0] if len(files) == 1 else files), batch, time.time())
+    except KeyboardInterrupt:
+        logger.info("停止监听")
+    finally:
+        source.close()
+        worker.close(wait=False)
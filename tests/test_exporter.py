@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from benchmarks.synthetic import make_synthetic_universe
+from configs.analysis_config import SCANNER_CONFIG
+from modules.analyzer import RANKING_COLUMNS
+from modules.exporter import ResultExporter, read_table
+
+
+def _results(df):
+    return {
+        'top_score': df[RANKING_COLUMNS['top_score']].head(10),
+        'market_overview': {'上涨': int((df['涨跌幅'] > 0).sum()), '下跌': int((df['涨跌幅'] < 0).sum()),
+                            '平盘': int((df['涨跌幅'] == 0).sum()), '平均涨跌幅': df['涨跌幅'].mean(),
+                            '总数量': len(df)}
+    }
+
+
+def _empty_day():
+    """空数据文件：没有行，各列为object类型"""
+    df = make_synthetic_universe(20).iloc[:0].astype(object)
+    return df.assign(动量得分=pd.Series(dtype=object), 综合得分=pd.Series(dtype=object),
+                     反转信号=pd.Series(dtype=object))
+
+
+def _history_day():
+    """有历史快照的一天：多出多周期扫描列，反转周期数为含NA的可空整数"""
+    df = make_synthetic_universe(50)
+    rng = np.random.default_rng(0)
+    df = df.assign(动量得分=0.3 * df['涨跌幅'] + 0.7 * df['5日涨跌幅'], 综合得分=rng.normal(size=len(df)),
+                   反转信号=df['涨跌幅'] > 0)
+    scan = {f"动量{horizon}日": rng.normal(size=len(df)) for horizon in SCANNER_CONFIG['horizons']}
+    counts = pd.array(rng.integers(0, 3, len(df)), dtype='Int64')
+    counts[:5] = pd.NA
+    scan.update(多周期动量=rng.normal(size=len(df)), 反转周期数=counts,
+                反转前跌幅=np.where(counts.fillna(0).to_numpy() > 0, -0.05, np.nan), 多周期反转=counts.fillna(0) > 0)
+    return df.assign(**scan)
+
+
+def test_schema_stable_between_empty_day_and_history_day(tmp_path):
+    exporter = ResultExporter(str(tmp_path), formats=['arrow', 'parquet'])
+    empty, full = _empty_day(), _history_day()
+    first = exporter.export(empty, _results(empty), {}, date='2026-10-15')
+    first_schemas = {name: entry['schema'] for name, entry in first['tables'].items()}
+    second = exporter.export(full, _results(full), {}, date='2026-10-16')
+
+    for name, schema in first_schemas.items():
+        assert second['tables'][name]['schema'] == schema, name
+        assert read_table(name, '2026-10-15', str(tmp_path)).schema == read_table(name, '2026-10-16', str(tmp_path)).schema
+
+    universe = read_table('universe', '2026-10-15', str(tmp_path))
+    assert universe.num_rows == 0
+    assert str(universe.schema.field('涨跌幅').type) == 'double'
+    assert str(universe.schema.field('反转周期数').type) == 'int64'
+
+    history = read_table('universe', '2026-10-16', str(tmp_path))
+    assert history.column('反转周期数').null_count == 5
+    assert str(history.schema.field('多周期反转').type) == 'bool'
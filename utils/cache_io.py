@@ -0,0 +1,23 @@
+import os
+from utils.logging_config import logger
+
+def write_cache(df, cache_base):
+    """
+    写入列式缓存（优先Parquet，缺少pyarrow或类型不兼容时退回pickle）
+
+    参数:
+    df: 要缓存的DataFrame
+    cache_base: 不含扩展名的缓存路径
+
+    返回:
+    实际写入的缓存文件路径（.parquet或.pkl）
+    """
+    try:
+        df.to_parquet(cache_base + '.parquet', index=False)
+        return cache_base + '.parquet'
+    except Exception as e:
+        logger.warning(f"Parquet缓存不可用，改用pickle: {str(e)}")
+        if os.path.exists(cache_base + '.parquet'):
+            os.remove(cache_base + '.parquet')
+        df.to_pickle(cache_base + '.pkl')
+        return cache_base + '.pkl'
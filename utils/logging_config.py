@@ -1,35 +1,140 @@
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import re
+import time
 
-def setup_logger():
-    """设置并返回日志记录器"""
-    # 创建日志目录
-    log_dir = "logs"
+# 日志配置
+LOG_CONFIG = {
+    'log_dir': 'logs',
+    'log_file': 'etf_analysis.log',
+    'max_bytes': 5 * 1024 * 1024,  # 单个日志文件上限5MB，超过后轮转
+    'backup_count': 5,  # 保留的历史日志文件数
+    'rate_limit_window': 60,  # 重复警告限流窗口（秒）
+    'rate_limit_burst': 1  # 窗口内同类警告最多输出的条数
+}
+
+_log_queue = None
+_listener = None
+
+class RateLimitFilter(logging.Filter):
+    """
+    重复警告限流
+
+    忽略方括号内容和数字后内容相同的警告视为同一类（如各策略的权重截断提示），
+    窗口期内只输出前burst条，其余计数，下一条输出时附带被抑制的数量。
+    只作用于WARNING级别：ERROR/CRITICAL总是输出，不同的错误不会因文本相似而被合并
+    """
+
+    def __init__(self, window=60, burst=1):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._state = {}
+
+    @staticmethod
+    def _pattern(message):
+        return re.sub(r'\[[^\]]*\]|\d+(\.\d+)?', '#', message)
+
+    def filter(self, record):
+        if record.levelno != logging.WARNING:
+            return True
+
+        key = self._pattern(record.getMessage())
+        now = time.monotonic()
+        start, count, suppressed = self._state.get(key, (now, 0, 0))
+        if now - start > self.window:
+            start, count = now, 0
+
+        if count < self.burst:
+            if suppressed:
+                record.msg = f"{record.getMessage()}（此前已抑制 {suppressed} 条同类警告）"
+                record.args = None
+                suppressed = 0
+            self._state[key] = (start, count + 1, suppressed)
+            return True
+
+        self._state[key] = (start, count, suppressed + 1)
+        return False
+
+def _build_handlers():
+    """创建唯一的写入端处理器：轮转文件 + 控制台"""
+    log_dir = LOG_CONFIG['log_dir']
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
-    
-    # 创建日志记录器
-    logger = logging.getLogger('etf_analysis')
-    logger.setLevel(logging.INFO)
-    
-    # 创建文件处理器
-    log_file = os.path.join(log_dir, "etf_analysis.log")
-    file_handler = logging.FileHandler(log_file)
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # 按大小轮转的文件处理器
+    log_file = os.path.join(log_dir, LOG_CONFIG['log_file'])
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=LOG_CONFIG['max_bytes'], backupCount=LOG_CONFIG['backup_count'],
+        encoding='utf-8', delay=True)
     file_handler.setLevel(logging.INFO)
-    
-    # 创建控制台处理器
+    file_handler.setFormatter(formatter)
+
+    # 控制台处理器
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
-    
-    # 创建日志格式
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
-    
-    # 添加处理器到日志记录器
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+
+    return [file_handler, console_handler]
+
+def _attach_queue_handler(logger, log_queue):
+    """将记录器的输出替换为非阻塞的队列处理器"""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(LOG_CONFIG['rate_limit_window'], LOG_CONFIG['rate_limit_burst']))
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+def get_log_queue():
+    """返回进程间共享的日志队列，用作工作进程初始化参数"""
+    return _log_queue
+
+def init_worker_logging(log_queue):
+    """
+    工作进程初始化函数
+
+    工作进程只向主进程的日志队列投递记录，不自行打开日志文件
+    """
+    global _log_queue
+    _log_queue = log_queue
+    logger = logging.getLogger('etf_analysis')
+    logger.setLevel(logging.INFO)
+    if log_queue is not None:
+        _attach_queue_handler(logger, log_queue)
+
+def stop_logging():
+    """停止写入线程并刷新剩余日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logger():
+    """设置并返回日志记录器"""
+    global _log_queue, _listener
+
+    # 创建日志记录器
+    logger = logging.getLogger('etf_analysis')
+    logger.setLevel(logging.INFO)
+
+    # 以spawn方式启动的子进程会重新导入本模块，由init_worker_logging接入主进程的队列
+    if multiprocessing.parent_process() is not None:
+        logger.propagate = False
+        return logger
+
+    # 主进程：所有记录经队列交给唯一的后台写入线程，调用方不做磁盘I/O
+    _log_queue = multiprocessing.Queue(-1)
+    _attach_queue_handler(logger, _log_queue)
+    _listener = logging.handlers.QueueListener(_log_queue, *_build_handlers(), respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
     return logger
 
 # 初始化日志记录器
@@ -0,0 +1,136 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from configs.report_config import PROFILE_CONFIG
+from utils.logging_config import logger
+
+class SamplingProfiler:
+    """
+    统计采样分析器
+
+    后台线程按固定间隔读取目标线程的调用栈（sys._current_frames），只记录代码对象元组并计数，
+    不安装trace/profile钩子，被测代码照常全速运行；开销只有每次采样的栈遍历，
+    可以在日常运行中保持开启。每个样本按采样时所处的流水线阶段归类
+
+    参数:
+    stage: 返回当前阶段名称的函数（如 lambda: budget.current_stage），返回None时归入outside_stage
+    interval: 采样间隔（秒）
+    """
+
+    def __init__(self, stage=None, interval=None, max_depth=None):
+        self.stage = stage or (lambda: None)
+        self.interval = interval or PROFILE_CONFIG['interval']
+        self.max_depth = max_depth or PROFILE_CONFIG['max_depth']
+        self.counts = Counter()  # (阶段, 代码对象元组（最内层在前）) -> 样本数
+        self.sample_seconds = 0.0  # 采样本身消耗的时间
+        self.wall_seconds = 0.0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+        self._root = None
+        self._start = None
+
+    def start(self):
+        """开始采样调用线程；栈只记录到调用start的函数为止，进程池等外层调用不计入"""
+        self._target = threading.get_ident()
+        self._root = sys._getframe(1).f_code
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.wall_seconds = time.perf_counter() - self._start
+        return self
+
+    def _run(self):
+        outside = PROFILE_CONFIG['outside_stage']
+        max_depth, root = self.max_depth, self._root
+        while not self._stop.wait(self.interval):
+            began = time.perf_counter()
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < max_depth:
+                code = frame.f_code
+                stack.append(code)
+                if code is root:
+                    break
+                frame = frame.f_back
+            del frame
+            self.counts[(self.stage() or outside, tuple(stack))] += 1
+            self.sample_seconds += time.perf_counter() - began
+
+    def _label(self, code):
+        """函数名（文件:首行），项目内文件用相对路径，第三方库从包名开始"""
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            for root in [os.getcwd()] + sorted(sys.path, key=len, reverse=True):
+                if root and path.startswith(root + os.sep):
+                    path = os.path.relpath(path, root)
+                    break
+            label = f"{code.co_name} ({path.replace(os.sep, '/')}:{code.co_firstlineno})".replace(';', ',')
+            self._labels[code] = label
+        return label
+
+    def collapsed(self):
+        """折叠栈格式（每行“阶段;外层;...;内层 样本数”），可直接用flamegraph.pl或speedscope打开"""
+        lines = [';'.join([stage] + [self._label(code) for code in reversed(stack)]) + f" {count}"
+                 for (stage, stack), count in self.counts.items()]
+        return '\n'.join(sorted(lines)) + '\n'
+
+    def hotspots(self, top_n=None):
+        """
+        热点汇总文本：各阶段样本占比，以及按自身样本数和累计样本数排名前top_n的函数
+        """
+        top_n = top_n or PROFILE_CONFIG['top_n']
+        total = sum(self.counts.values())
+        stages, own, inclusive = Counter(), Counter(), Counter()
+        for (stage, stack), count in self.counts.items():
+            stages[stage] += count
+            if stack:
+                own[stack[0]] += count
+            # 递归调用时同一函数在一个样本中只计一次
+            for code in set(stack):
+                inclusive[code] += count
+
+        def share(count):
+            return f"{count / total:7.1%}" if total else '      -'
+
+        overhead = self.sample_seconds / self.wall_seconds if self.wall_seconds else 0.0
+        lines = [
+            f"采样: {total} 个样本，间隔 {self.interval * 1000:.1f} 毫秒，运行 {self.wall_seconds:.2f} 秒，"
+            f"采样耗时 {self.sample_seconds:.3f} 秒（{overhead:.2%}）",
+            '',
+            '阶段          样本    占比',
+        ]
+        lines += [f"{stage:<12}{count:>6} {share(count)}" for stage, count in stages.most_common()]
+        for title, counter in ((f"自身耗时 TOP{top_n}", own), (f"累计耗时 TOP{top_n}", inclusive)):
+            lines += ['', title, '  样本    占比  函数']
+            lines += [f"{count:>6} {share(count)}  {self._label(code)}" for code, count in counter.most_common(top_n)]
+        return '\n'.join(lines) + '\n'
+
+    def save(self, base_path):
+        """
+        写出 <base_path>.folded（折叠栈）和 <base_path>.hotspots.txt（热点汇总）
+
+        返回:
+        (折叠栈文件, 热点汇总文件)
+        """
+        folded_file, hotspots_file = base_path + '.folded', base_path + '.hotspots.txt'
+        os.makedirs(os.path.dirname(base_path) or '.', exist_ok=True)
+        with open(folded_file, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        with open(hotspots_file, 'w', encoding='utf-8') as f:
+            f.write(self.hotspots())
+        logger.info(f"采样分析结果已保存: {folded_file}，{hotspots_file}"
+                    f"（{sum(self.counts.values())} 个样本，采样开销 {self.sample_seconds:.3f}秒）")
+        return folded_file, hotspots_file
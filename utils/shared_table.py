@@ -0,0 +1,192 @@
+import gc
+import sys
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import pandas as pd
+from utils.logging_config import logger
+
+# 列数据在共享内存块中的对齐字节数
+_ALIGNMENT = 64
+
+def _codes_dtype(n_categories):
+    """与pandas分类编码一致的最小整数类型，保证挂载时不发生类型转换"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def ensure_resource_tracker():
+    """
+    在创建工作进程之前启动资源跟踪器
+
+    以fork方式启动的工作进程只有在父进程已启动跟踪器时才会与其共用；
+    否则各自启动跟踪器，进程退出时会把仍在使用的共享内存块当作泄漏删除
+    """
+    resource_tracker.ensure_running()
+
+def _open_segment(name):
+    """
+    打开已有的共享内存块
+
+    工作进程与主进程共用同一个资源跟踪器，挂载方不登记所有权（3.13起显式关闭跟踪），
+    共享内存块的删除只由创建方负责
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+def _close_segment(segment):
+    """关闭映射；仍有视图引用时交给进程退出时释放"""
+    gc.collect()
+    try:
+        segment.close()
+    except BufferError:
+        logger.debug(f"共享内存 {segment.name} 仍有视图引用，延迟关闭")
+
+class SharedTable:
+    """
+    共享内存中的ETF数据表
+
+    数值列按原始dtype连续存放，挂载方直接得到NumPy视图；文本列存放分类编码，
+    类别字典随描述信息传递（体积很小）。描述信息可以被pickle后发送给其他进程，
+    各进程通过attach_table得到与原表内容一致、但不复制列数据的DataFrame。
+    创建方负责在所有使用方结束后调用unlink释放共享内存。
+    """
+
+    def __init__(self, segment, descriptor):
+        self.segment = segment
+        self.descriptor = descriptor
+
+    @classmethod
+    def from_frame(cls, df):
+        """把DataFrame写入新建的共享内存块"""
+        columns = []
+        payloads = []
+        offset = 0
+
+        index = df.index
+        if isinstance(index, pd.RangeIndex):
+            index_spec = ('range', index.start, index.stop, index.step)
+        else:
+            index_spec = ('column', '__index__')
+            df = df.assign(__index__=index.to_numpy())
+
+        for name in df.columns:
+            values = df[name]
+            if values.dtype.kind in 'biuf':
+                data = np.ascontiguousarray(values.to_numpy())
+                spec = {'name': name, 'kind': 'numeric', 'dtype': data.dtype.str}
+            else:
+                codes, categories = pd.factorize(values, use_na_sentinel=True)
+                data = codes.astype(_codes_dtype(len(categories)))
+                spec = {'name': name, 'kind': 'category', 'dtype': data.dtype.str,
+                        'categories': categories.tolist() if isinstance(categories, pd.Index) else list(categories)}
+            offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+            spec['offset'] = offset
+            columns.append(spec)
+            payloads.append((offset, data))
+            offset += data.nbytes
+
+        segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for start, data in payloads:
+            target = np.ndarray(data.shape, dtype=data.dtype, buffer=segment.buf, offset=start)
+            target[...] = data
+            del target
+
+        descriptor = {
+            'segment': segment.name,
+            'rows': len(df),
+            'columns': columns,
+            'index': index_spec,
+            'attrs': dict(df.attrs)
+        }
+        logger.info(f"已写入共享内存表 {segment.name}: {len(df)} 行, {len(columns)} 列, {offset / 1e6:.1f} MB")
+        return cls(segment, descriptor)
+
+    def close(self):
+        """关闭本进程的映射"""
+        _close_segment(self.segment)
+
+    def unlink(self):
+        """关闭并删除共享内存块（仅由创建方调用）"""
+        self.close()
+        try:
+            self.segment.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+def frame_from_buffer(descriptor, buffer):
+    """由描述信息和共享缓冲区构建零拷贝的只读DataFrame"""
+    rows = descriptor['rows']
+    data = {}
+    for spec in descriptor['columns']:
+        view = np.ndarray((rows,), dtype=np.dtype(spec['dtype']), buffer=buffer, offset=spec['offset'])
+        view.flags.writeable = False
+        if spec['kind'] == 'category':
+            values = pd.Categorical.from_codes(view, categories=pd.Index(spec['categories']))
+        else:
+            values = view
+        data[spec['name']] = pd.Series(values, copy=False)
+
+    df = pd.DataFrame(data, copy=False)
+    kind = descriptor['index'][0]
+    if kind == 'range':
+        df.index = pd.RangeIndex(*descriptor['index'][1:])
+    else:
+        df = df.set_index(descriptor['index'][1])
+        df.index.name = None
+    df.attrs.update(descriptor['attrs'])
+    return df
+
+class attach_table:
+    """
+    在其他进程中挂载共享内存表
+
+    用法:
+    with attach_table(descriptor) as df:
+        ...  # df的数值列直接引用共享内存，只读
+    """
+
+    def __init__(self, descriptor):
+        self.descriptor = descriptor
+        self.segment = None
+
+    def __enter__(self):
+        self.segment = _open_segment(self.descriptor['segment'])
+        return frame_from_buffer(self.descriptor, self.segment.buf)
+
+    def __exit__(self, *exc):
+        _close_segment(self.segment)
+
+# 本进程经share_bytes交出、读取方可能尚未打开的共享内存块
+_outgoing = []
+
+def share_bytes(data):
+    """
+    把字节数据放入共享内存，返回(名称, 长度)
+
+    用于从工作进程返回大块结果，由读取方用read_shared_bytes读取并删除。
+    Windows上命名共享内存在最后一个句柄关闭时即被销毁，因此写入方保留句柄直到进程退出
+    （读取方读完后才关闭进程池），或到下一次调用时关闭上一次结果的句柄
+    """
+    while _outgoing:
+        _outgoing.pop().close()
+    segment = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    segment.buf[:len(data)] = data
+    _outgoing.append(segment)
+    return segment.name, len(data)
+
+def read_shared_bytes(name, size):
+    """读取share_bytes写入的数据并删除共享内存块"""
+    segment = _open_segment(name)
+    try:
+        return bytes(segment.buf[:size])
+    finally:
+        segment.close()
+        segment.unlink()
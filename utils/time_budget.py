@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+from configs.report_config import TIME_BUDGET
+from utils.logging_config import logger
+
+class TimeBudget:
+    """
+    流水线时间预算
+
+    各阶段开始时按配置份额从剩余总预算中分得自己的截止时间，前面阶段节省的时间自动顺延。
+    阶段内部在可选步骤之间调用allows_optional/expired检查（协作式取消），
+    被舍弃的内容记录在degraded中，供报告注明
+    """
+
+    def __init__(self, total=None, shares=None, optional_min_seconds=None):
+        self.total = total if total is not None else TIME_BUDGET['total']
+        self.shares = shares if shares is not None else TIME_BUDGET['stages']
+        self.optional_min_seconds = (optional_min_seconds if optional_min_seconds is not None
+                                     else TIME_BUDGET['optional_min_seconds'])
+        self.start = time.monotonic()
+        self.deadline = self.start + self.total
+        self.current_stage = None
+        self.stage_deadline = self.deadline
+        self.degraded = []
+        self._done = set()
+
+    def remaining(self):
+        """总预算剩余秒数"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def stage_remaining(self):
+        """当前阶段剩余秒数"""
+        return max(0.0, self.stage_deadline - time.monotonic())
+
+    def expired(self):
+        """当前阶段是否已超出预算"""
+        return time.monotonic() >= self.stage_deadline
+
+    def allows_optional(self):
+        """当前阶段是否还有足够时间执行可选内容"""
+        return self.stage_remaining() >= self.optional_min_seconds
+
+    def degrade(self, section, reason='时间预算不足'):
+        """记录被舍弃或降级的报告内容"""
+        self.degraded.append({'section': section, 'reason': reason, 'stage': self.current_stage})
+        logger.warning(f"[{self.current_stage}] 已舍弃: {section}（{reason}）")
+
+    @contextmanager
+    def stage(self, name, description=None):
+        """进入一个阶段：分配截止时间，结束时记录耗时"""
+        pending = [stage for stage in self.shares if stage not in self._done]
+        total_share = sum(self.shares[stage] for stage in pending) or 1.0
+        share = self.shares.get(name, 0.0) / total_share
+        now = time.monotonic()
+        self.current_stage = name
+        self.stage_deadline = min(self.deadline, now + self.remaining() * share) if share else self.deadline
+
+        start = time.time()
+        try:
+            yield self
+        finally:
+            elapsed = time.time() - start
+            self._done.add(name)
+            if description:
+                logger.info(f"{description}完成，耗时: {elapsed:.2f}秒")
+            if time.monotonic() > self.stage_deadline:
+                logger.warning(f"阶段 {name} 超出预算 {time.monotonic() - self.stage_deadline:.2f}秒")
+            self.current_stage = None
+            self.stage_deadline = self.deadline